@@ -0,0 +1,149 @@
+"""
+Long-range aggregate queries on Postgres against the DuckDB/Parquet copy.
+
+Seeds synthetic spendings over --years into an empty throwaway database,
+times the export to Parquet, then runs each query --repeat times on both
+backends, the way query_database would without its result cache.
+
+    POSTGRES_URL=postgres://... python benchmarks/analytics.py --rows 1000000
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from itertools import batched
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+os.environ["ANALYTICS_PATH"] = str(Path(tempfile.mkdtemp()) / "analytics")
+
+import synthetic  # noqa: E402
+from personal_accountant.tools import analytics, database  # noqa: E402
+
+SEED_CHUNK_SIZE = 10_000
+USER_ID = "benchmark"
+
+QUERIES = {
+    "monthly dining by currency": """
+        SELECT currency, date_trunc('month', transaction_date) AS month,
+               AVG(summary_total_amount) AS average
+        FROM spendings
+        WHERE transaction_category = 'Dining'
+          AND transaction_date >= CURRENT_DATE - INTERVAL '3 years'
+        GROUP BY currency, month
+        ORDER BY month, currency;
+    """,
+    "yearly category totals": """
+        SELECT EXTRACT(YEAR FROM transaction_date) AS year, transaction_category,
+               currency, SUM(summary_total_amount) AS total
+        FROM spendings
+        GROUP BY year, transaction_category, currency
+        ORDER BY year, total DESC;
+    """,
+    "top items by spend": """
+        SELECT si.description, SUM(si.total) AS total, COUNT(*) AS times
+        FROM spending_items si
+        JOIN spendings s ON s.id = si.spending_id
+        WHERE s.transaction_date >= CURRENT_DATE - INTERVAL '2 years'
+        GROUP BY si.description
+        ORDER BY total DESC
+        LIMIT 20;
+    """,
+    "weekday averages": """
+        SELECT EXTRACT(DOW FROM transaction_date) AS weekday, currency,
+               AVG(summary_total_amount) AS average, COUNT(*) AS spendings
+        FROM spendings
+        GROUP BY weekday, currency
+        ORDER BY weekday, currency;
+    """,
+}
+
+
+async def on_postgres(query: str) -> database.QueryResult:
+    return await database.run_with_reconnect(
+        lambda conn: database.fetch_query_result(conn, query), user_id=USER_ID
+    )
+
+
+async def on_duckdb(query: str) -> database.QueryResult:
+    rows, total_rows, truncated = await analytics.fetch_rows(
+        query, USER_ID, database.QUERY_MAX_ROWS, database.QUERY_MAX_BYTES, 60
+    )
+    return database.QueryResult(rows=rows, total_rows=total_rows, truncated=truncated)
+
+
+async def time_query(run, query: str, repeat: int) -> tuple[float, int]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = await run(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), len(res.rows)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--years", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if not analytics.enabled():
+        raise SystemExit("Install the analytics extra (duckdb) first")
+
+    # Postgres gets no statement timeout here, the point is to see how long it takes
+    database.QUERY_STATEMENT_TIMEOUT_MS = 0
+
+    try:
+        await database.migrate()
+        pool = await database.get_db_pool()
+        async with pool.connection() as conn:
+            count = await (await conn.execute("SELECT COUNT(*) FROM spendings")).fetchone()
+            if count[0]:
+                raise SystemExit("spendings is not empty, use a throwaway database")
+
+        days = args.years * 365
+        start = time.perf_counter()
+        spendings = synthetic.generate(
+            args.rows, seed=args.seed, start=date.today() - timedelta(days=days), days=days + 1
+        )
+        for chunk in batched(spendings, SEED_CHUNK_SIZE):
+            await database.load_spendings(list(chunk), USER_ID)
+        async with pool.connection() as conn:
+            await conn.execute("ANALYZE")
+        print(f"seeded {args.rows} spendings in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        exported = await database.run_with_reconnect(analytics.export)
+        size = sum(path.stat().st_size for path in Path(analytics.ANALYTICS_PATH).rglob("*.parquet"))
+        print(
+            f"exported {exported['spendings']} spendings and {exported['spending_items']} items"
+            f" in {time.perf_counter() - start:.1f}s, {size / 2**20:.1f} MiB of Parquet"
+        )
+
+        # Views are created on the first query, not worth timing
+        await on_duckdb("SELECT COUNT(*) FROM spendings")
+
+        print(f"{'query':<28} {'rows':>5} {'postgres ms':>12} {'duckdb ms':>10} {'speedup':>8}")
+        for name, query in QUERIES.items():
+            postgres_ms, rows = await time_query(on_postgres, query, args.repeat)
+            duckdb_ms, _ = await time_query(on_duckdb, query, args.repeat)
+            print(
+                f"{name:<28} {rows:>5} {postgres_ms:>12.1f} {duckdb_ms:>10.1f}"
+                f" {postgres_ms / duckdb_ms:>7.1f}x"
+            )
+    finally:
+        await database.close_db_pool()
+        shutil.rmtree(Path(analytics.ANALYTICS_PATH).parent, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
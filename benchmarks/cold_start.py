@@ -0,0 +1,83 @@
+"""
+Cold start of the container: the migration step entrypoint.sh runs, then
+importing the agent the way `adk web` loads it, each in a fresh interpreter.
+
+Importing google.adk alone is timed too, it is the floor for the agent
+import. With POSTGRES_URL set the migration step runs against that database,
+once to bring it up to date and then --repeat times the way a restart finds it.
+
+    POSTGRES_URL=postgres://... python benchmarks/cold_start.py --repeat 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+
+STAGES = {
+    "import google.adk": [sys.executable, "-c", "import google.adk.agents"],
+    "import agent": [sys.executable, "-c", "import personal_accountant.agent"],
+    "migrate": [sys.executable, str(SRC / "personal_accountant" / "tools" / "database.py")],
+}
+
+
+def run(command: list[str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(command, cwd=SRC, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def breakdown(top: int):
+    """The slowest modules of the project and what they import, from -X importtime."""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import google.adk.agents; import personal_accountant.agent"],
+        cwd=SRC,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    # Everything after google.adk was imported on its own is on the project
+    output = output[output.rindex("google.adk.agents\n"):]
+
+    modules = []
+    for line in output.splitlines()[1:]:
+        if not line.startswith("import time:"):
+            continue
+        self_us, _, name = line.removeprefix("import time:").split("|")
+        modules.append((int(self_us), name.strip()))
+
+    print("\nslowest imports after google.adk (self ms):")
+    for self_us, name in sorted(modules, reverse=True)[:top]:
+        print(f"  {self_us / 1000:7.1f}  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--breakdown", type=int, default=0, help="Show the N slowest imports")
+    args = parser.parse_args()
+
+    stages = dict(STAGES)
+    if os.getenv("POSTGRES_URL"):
+        # Bring the database up to date, every restart after that finds it so
+        run(stages["migrate"])
+    else:
+        print("POSTGRES_URL is not set, skipping the migration step")
+        del stages["migrate"]
+
+    print(f"{'stage':<20} {'p50 ms':>8} {'min ms':>8}")
+    for name, command in stages.items():
+        timings = [run(command) * 1000 for _ in range(args.repeat)]
+        print(f"{name:<20} {statistics.median(timings):>8.0f} {min(timings):>8.0f}")
+
+    if args.breakdown:
+        breakdown(args.breakdown)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Offline end-to-end benchmark of the real root_agent graph.
+
+Every model is replaced by the deterministic stub in stub_llm.py, so what is
+measured is our own orchestration, tools and database: ingestion sends
+synthetic receipts through personal_accountant_agent -> spend_extractor_agent
+-> save_spending, retrieval sends a fixed set of questions through
+spend_retriever_agent. Both run at each database size, seeding synthetic
+spendings up to it first.
+
+Needs an empty throwaway database, it is migrated and filled by the run:
+
+    POSTGRES_URL=postgres://... python benchmarks/end_to_end.py --sizes 1000 100000 10000000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from itertools import batched
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+# Start from an empty memo and extraction cache, a previous run's would skip
+# the query generator and the extractor
+run_dir = Path(tempfile.mkdtemp())
+os.environ["QUERY_MEMO_PATH"] = str(run_dir / "query_memo.sqlite3")
+os.environ["EXTRACTION_CACHE_PATH"] = str(run_dir / "extraction_cache.sqlite3")
+
+from google.adk.runners import InMemoryRunner  # noqa: E402
+from google.genai import types  # noqa: E402
+
+import stub_llm  # noqa: E402
+import synthetic  # noqa: E402
+from personal_accountant import telemetry  # noqa: E402
+from personal_accountant.agent import root_agent  # noqa: E402
+from personal_accountant.tools import database  # noqa: E402
+from personal_accountant.tools.query_cache import query_cache  # noqa: E402
+
+SEED_CHUNK_SIZE = 10_000
+DAYS_OF_DATA = 4 * 365
+
+# The first three are answered by the retriever's fast path, the rest go
+# through the query generator and executor loop
+QUESTIONS = {
+    "How much did I spend this month?": None,
+    "Spending by category last month": None,
+    "Top 5 merchants this year": None,
+    "How much did I spend on coffee this month?": """
+        SELECT currency, SUM(summary_total_amount)
+        FROM spendings
+        WHERE merchant_name ILIKE '%coffee%'
+          AND transaction_date >= date_trunc('month', CURRENT_DATE)
+        GROUP BY currency;
+    """,
+    "What did I buy at SuperMart last week?": """
+        SELECT s.transaction_date, si.description, si.quantity, si.total
+        FROM spendings s
+        JOIN spending_items si ON s.id = si.spending_id
+        WHERE s.merchant_name ILIKE 'supermart'
+          AND s.transaction_date >= date_trunc('week', CURRENT_DATE) - INTERVAL '7 days'
+          AND s.transaction_date < date_trunc('week', CURRENT_DATE)
+        ORDER BY s.transaction_date
+        LIMIT 100;
+    """,
+    "Average dining spend per transaction this year?": """
+        SELECT currency, AVG(summary_total_amount)
+        FROM spendings
+        WHERE transaction_category = 'Dining'
+          AND transaction_date >= date_trunc('year', CURRENT_DATE)
+        GROUP BY currency;
+    """,
+    "Which payment methods have I used this year?": """
+        SELECT DISTINCT payment_method
+        FROM spendings
+        WHERE transaction_date >= date_trunc('year', CURRENT_DATE)
+          AND payment_method IS NOT NULL;
+    """,
+}
+
+# The stub only needs SQL for questions that reach the query generator; fast
+# path questions still get some in case the fast path is disabled
+FALLBACK_SQL = "SELECT COUNT(*) FROM spendings;"
+
+
+def sql_for_question(question: str) -> str:
+    return QUESTIONS.get(question.strip()) or FALLBACK_SQL
+
+
+async def run_message(runner: InMemoryRunner, text: str) -> float:
+    session = await runner.session_service.create_session(
+        app_name=runner.app_name, user_id="benchmark"
+    )
+    message = types.Content(role="user", parts=[types.Part(text=text)])
+
+    start = time.perf_counter()
+    async for _ in runner.run_async(
+        user_id="benchmark", session_id=session.id, new_message=message
+    ):
+        pass
+    return time.perf_counter() - start
+
+
+async def run_phase(
+    runner: InMemoryRunner, messages: list[str], concurrency: int
+) -> tuple[list[float], float]:
+    """Latency of every message and the wall time of the whole phase."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(text: str) -> float:
+        async with semaphore:
+            return await run_message(runner, text)
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(run_one(text) for text in messages))
+    return latencies, time.perf_counter() - start
+
+
+def report(phase: str, rows: int, latencies: list[float], wall: float):
+    p99 = statistics.quantiles(latencies, n=100)[98] if len(latencies) > 1 else latencies[0]
+    print(
+        f"{rows:>10} {phase:<10} {len(latencies):>6}"
+        f" {statistics.median(latencies) * 1000:10.1f} {p99 * 1000:10.1f}"
+        f" {len(latencies) / wall:10.1f}"
+    )
+
+
+def report_breakdown(memory: telemetry.MemoryExporter, top: int):
+    """Where the phase's time went, by total time spent."""
+    summary = sorted(memory.summary().items(), key=lambda item: -item[1]["total_ms"])
+    for name, entry in summary[:top]:
+        print(
+            f"{'':>11}  {name:<44} {entry['count']:>6.0f} calls"
+            f" {entry['total_ms'] / entry['count']:9.2f} ms avg"
+        )
+    memory.measurements.clear()
+
+
+async def seed(count: int, seed: int):
+    start = date.today() - timedelta(days=DAYS_OF_DATA)
+    spendings = synthetic.generate(count, seed=seed, start=start, days=DAYS_OF_DATA + 1)
+    for chunk in batched(spendings, SEED_CHUNK_SIZE):
+        await database.load_spendings(list(chunk), "benchmark")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 10_000_000])
+    parser.add_argument("--requests", type=int, default=200, help="Messages per phase and size")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--cache", action="store_true", help="Keep the query result cache on")
+    parser.add_argument("--breakdown", type=int, default=0, help="Show the N most expensive steps per phase")
+    args = parser.parse_args()
+
+    stub_llm.install(root_agent, sql_for_question)
+    if not args.cache:
+        query_cache.max_size = 0
+
+    memory = telemetry.get_exporter(telemetry.MemoryExporter)
+    runner = InMemoryRunner(agent=root_agent)
+
+    try:
+        await database.migrate()
+        pool = await database.get_db_pool()
+        async with pool.connection() as conn:
+            count = await (await conn.execute("SELECT COUNT(*) FROM spendings")).fetchone()
+            if count[0]:
+                raise SystemExit("spendings is not empty, use a throwaway database")
+
+        print(f"{'rows':>10} {'phase':<10} {'ops':>6} {'p50 ms':>10} {'p99 ms':>10} {'ops/s':>10}")
+        rows = 0
+        for size in sorted(args.sizes):
+            if size > rows:
+                start = time.perf_counter()
+                await seed(size - rows, seed=size)
+                seeded = size - rows
+                print(f"{size:>10} seeded {seeded} rows at {seeded / (time.perf_counter() - start):.0f} rows/s")
+                rows = size
+                async with pool.connection() as conn:
+                    await conn.execute("ANALYZE")
+                if memory:
+                    memory.measurements.clear()
+
+            receipts = [
+                stub_llm.RECEIPT_PREFIX + receipt.model_dump_json(exclude_none=True)
+                for receipt in synthetic.generate(args.requests, seed=-size)
+            ]
+            latencies, wall = await run_phase(runner, receipts, args.concurrency)
+            report("ingestion", rows, latencies, wall)
+            if memory and args.breakdown:
+                report_breakdown(memory, args.breakdown)
+            rows += len(receipts)
+
+            questions = [list(QUESTIONS)[i % len(QUESTIONS)] for i in range(args.requests)]
+            latencies, wall = await run_phase(runner, questions, args.concurrency)
+            report("retrieval", rows, latencies, wall)
+            if memory and args.breakdown:
+                report_breakdown(memory, args.breakdown)
+    finally:
+        await database.close_db_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
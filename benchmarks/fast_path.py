@@ -0,0 +1,88 @@
+"""
+End-to-end latency of spend_retriever_agent on questions the intent rules
+cover, answered through the fast path and through the LLM query pipeline.
+
+Runs the real agents, so it needs GOOGLE_API_KEY and a migrated database.
+The query cache and the query memo are disabled so every run does the work.
+
+    POSTGRES_URL=postgres://... python benchmarks/fast_path.py --repeats 3
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from dotenv import load_dotenv  # noqa: E402
+from google.adk.runners import InMemoryRunner  # noqa: E402
+from google.genai import types  # noqa: E402
+
+from personal_accountant.sub_agents.spend_retriever import agent, query_memo  # noqa: E402
+from personal_accountant.tools import database  # noqa: E402
+from personal_accountant.tools.query_cache import query_cache  # noqa: E402
+
+QUESTIONS = [
+    "How much did I spend this month?",
+    "Total spent last week",
+    "Spending by category last month",
+    "What are my top 5 largest transactions?",
+    "Top 3 merchants this year",
+]
+
+
+async def ask(runner: InMemoryRunner, question: str) -> tuple[float, int]:
+    """Seconds until the final answer and the number of model responses."""
+    session = await runner.session_service.create_session(
+        app_name=runner.app_name, user_id="benchmark"
+    )
+    message = types.Content(role="user", parts=[types.Part(text=question)])
+
+    model_calls = 0
+    start = time.perf_counter()
+    async for event in runner.run_async(
+        user_id="benchmark", session_id=session.id, new_message=message
+    ):
+        model_calls += event.author != "user" and event.usage_metadata is not None
+
+    return time.perf_counter() - start, model_calls
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    load_dotenv()
+    query_cache.max_size = 0
+    query_memo.QUERY_MEMO_MIN_SIMILARITY = float("inf")
+
+    runner = InMemoryRunner(agent=agent.spend_retriever_agent)
+
+    try:
+        print(f"{'question':<42} {'fast path':>16} {'llm pipeline':>16}")
+        for question in QUESTIONS:
+            results = {}
+            for enabled in (True, False):
+                agent.FAST_PATH_ENABLED = enabled
+                runs = [await ask(runner, question) for _ in range(args.repeats)]
+                results[enabled] = (
+                    statistics.median(seconds for seconds, _ in runs) * 1000,
+                    max(calls for _, calls in runs),
+                )
+
+            print(
+                f"{question:<42}"
+                f" {results[True][0]:8.0f} ms ({results[True][1]})"
+                f" {results[False][0]:8.0f} ms ({results[False][1]})"
+            )
+        print("(n) is the number of model responses per question")
+    finally:
+        await database.close_db_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,143 @@
+"""
+Cross-currency totals: converting at query time against summing the
+base_total_amount stored at save time.
+
+Needs an empty throwaway database: it is migrated, filled with synthetic
+spendings and four years of daily rates server side, and every spending gets its
+base_total_amount the way the fx_rates loader fills it in.
+
+    POSTGRES_URL=postgres://... python benchmarks/fx_totals.py --rows 1000000
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from personal_accountant.tools import database, fx_rates  # noqa: E402
+
+USER_ID = "benchmark"
+
+SEED_SPENDINGS_SQL = """
+INSERT INTO spendings (
+    type, currency, transaction_date, transaction_category, merchant_name,
+    summary_subtotal, summary_total_amount
+)
+SELECT
+    'receipt',
+    (ARRAY['IDR', 'IDR', 'IDR', 'USD', 'EUR', 'SGD'])[1 + g %% 6],
+    CURRENT_DATE - (g::bigint * 7919 %% 1460)::integer,
+    (ARRAY['Dining', 'Groceries', 'Travel', 'Utilities', 'Shopping', 'Transport'])[1 + (g / 6) %% 6],
+    'Merchant #' || (g %% 997),
+    (g::bigint * 31 %% 100000) / 100.0,
+    (g::bigint * 31 %% 100000) / 100.0
+FROM generate_series(1, %(rows)s) AS g;
+"""
+
+SEED_RATES_SQL = """
+INSERT INTO fx_rates (base_currency, currency, rate_date, base_rate)
+SELECT %(base)s, currency, day::date, base_rate * (1 + 0.01 * sin(extract(doy FROM day)))
+FROM (VALUES ('USD', 16200.0), ('EUR', 17500.0), ('SGD', 12100.0)) AS r (currency, base_rate),
+     generate_series(CURRENT_DATE - 1460, CURRENT_DATE, INTERVAL '1 day') AS day;
+"""
+
+QUERIES = {
+    # What the query generator wrote before: one row per currency, the model
+    # then has to convert and add them up itself
+    "per currency": """
+        SELECT currency, SUM(summary_total_amount)
+        FROM spendings
+        WHERE transaction_date >= CURRENT_DATE - 365
+        GROUP BY currency;
+    """,
+    "converted in the query": """
+        SELECT SUM(s.summary_total_amount * coalesce(r.base_rate, 1))
+        FROM spendings s
+        LEFT JOIN LATERAL (
+            SELECT f.base_rate
+            FROM fx_rates f
+            WHERE f.base_currency = '{base}'
+              AND f.currency = upper(s.currency)
+              AND f.rate_date <= s.transaction_date
+            ORDER BY f.rate_date DESC
+            LIMIT 1
+        ) r ON true
+        WHERE s.transaction_date >= CURRENT_DATE - 365;
+    """,
+    "base_total_amount": """
+        SELECT SUM(base_total_amount)
+        FROM spendings
+        WHERE transaction_date >= CURRENT_DATE - 365;
+    """,
+    "base_total_amount by category": """
+        SELECT transaction_category, SUM(base_total_amount)
+        FROM spendings
+        WHERE transaction_date >= CURRENT_DATE - 365
+        GROUP BY transaction_category;
+    """,
+}
+
+
+async def time_query(pool, query: str, repeat: int) -> float:
+    timings = []
+    async with pool.connection() as conn:
+        await database.scope_to_user(conn, USER_ID)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await (await conn.execute(query)).fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    base = fx_rates.BASE_CURRENCY
+    try:
+        await database.migrate()
+        pool = await database.get_db_pool()
+        async with pool.connection() as conn:
+            count = await (await conn.execute("SELECT COUNT(*) FROM spendings")).fetchone()
+            if count[0]:
+                raise SystemExit("spendings is not empty, use a throwaway database")
+
+            start = time.perf_counter()
+            await conn.execute(SEED_RATES_SQL, {"base": base})
+            await database.scope_to_user(conn, USER_ID)
+            await conn.execute(SEED_SPENDINGS_SQL, {"rows": args.rows})
+            converted = await fx_rates.backfill(conn, base)
+            print(f"seeded {args.rows} spendings, converted {converted} in {time.perf_counter() - start:.1f}s")
+
+        async with pool.connection() as conn:
+            await conn.set_autocommit(True)
+            await conn.execute("VACUUM ANALYZE spendings")
+            await conn.execute("VACUUM ANALYZE fx_rates")
+
+            await fx_rates.rate_cache.load(conn, ["USD", "EUR", "SGD"])
+            await conn.set_autocommit(False)
+
+        # The in-process lookup save_spending does per receipt
+        lookups = 100_000
+        start = time.perf_counter()
+        for number in range(lookups):
+            fx_rates.rate_cache.to_base(Decimal("12.34"), "USD", date.fromordinal(date.today().toordinal() - number % 1000))
+        print(f"rate_cache.to_base: {(time.perf_counter() - start) / lookups * 1e6:.1f} us per spending")
+
+        print(f"{'query':<32} {'ms':>8}")
+        for name, query in QUERIES.items():
+            print(f"{name:<32} {await time_query(pool, query.format(base=base), args.repeat):>8.1f}")
+    finally:
+        await database.close_db_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,211 @@
+"""
+Payload size, preprocessing latency and extraction fidelity of receipt
+photos before and after image_preprocessing.
+
+By default it renders synthetic receipts (benchmarks/synthetic.py) as phone
+photos: printed on paper, slightly rotated on a dark noisy table, stored
+sideways with an EXIF orientation tag, like a camera would. Pass --images
+to measure real photos instead, a `<name>.json` next to a photo holding
+its expected spending enables the accuracy checks for it.
+
+Fidelity is checked on the original and the preprocessed image alike:
+
+- --ocr: character accuracy of tesseract's text against the printed text
+  (synthetic receipts only, needs `pip install pytesseract` and tesseract)
+- --extract: field accuracy of the spend extractor prompt run on Gemini,
+  needs GOOGLE_API_KEY
+
+    python benchmarks/image_preprocessing.py --receipts 20 --ocr
+"""
+
+import argparse
+import asyncio
+import difflib
+import io
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from PIL import Image, ImageDraw, ImageFont, ImageOps  # noqa: E402
+
+import synthetic  # noqa: E402
+from personal_accountant import image_preprocessing  # noqa: E402
+from personal_accountant.types.type import SpendingAgentOutput  # noqa: E402
+
+PHOTO_SIZE = (4032, 3024)
+PAPER_PX_PER_MM = 30
+FONT_MM = 2.5
+EXIF_ORIENTATION = 0x0112
+
+
+def receipt_lines(spending: SpendingAgentOutput) -> list[str]:
+    lines = [spending.merchant_name.upper()]
+    if spending.merchant_address:
+        lines.append(spending.merchant_address)
+    lines += [f"{spending.transaction_date} {spending.transaction_time or ''}".strip(), ""]
+
+    for item in spending.items:
+        lines.append(item.description)
+        lines.append(f"  {item.quantity:g} x {item.unit_price:.2f}  {item.total:>10.2f}")
+
+    lines += [
+        "",
+        f"SUBTOTAL {spending.summary_subtotal:>20.2f}",
+        f"TAX {spending.summary_tax_amount or 0:>25.2f}",
+        f"TOTAL {spending.currency} {spending.summary_total_amount:>19.2f}",
+    ]
+    if spending.payment_method:
+        lines.append(f"PAID BY {spending.payment_method}")
+
+    return lines
+
+
+def render_photo(spending: SpendingAgentOutput, rng: random.Random) -> bytes:
+    """A JPEG like a phone would take of the printed receipt."""
+    lines = receipt_lines(spending)
+    font_px = round(FONT_MM * PAPER_PX_PER_MM)
+    font = ImageFont.load_default(size=font_px)
+    margin = 5 * PAPER_PX_PER_MM
+
+    paper = Image.new("L", (80 * PAPER_PX_PER_MM, 2 * margin + len(lines) * round(font_px * 1.4)), 240)
+    draw = ImageDraw.Draw(paper)
+    for number, line in enumerate(lines):
+        draw.text((margin, margin + number * round(font_px * 1.4)), line, fill=20, font=font)
+
+    paper = paper.rotate(rng.uniform(-3, 3), expand=True, fillcolor=0)
+    mask = paper.point(lambda level: 255 if level else 0)
+
+    # Portrait photo, the table a dark noisy brown
+    width, height = PHOTO_SIZE[1], PHOTO_SIZE[0]
+    photo = Image.merge(
+        "RGB",
+        [
+            Image.effect_noise((width, height), 12).point(lambda v, base=base: base + v // 4)
+            for base in (70, 55, 45)
+        ],
+    )
+    position = (
+        (width - paper.width) // 2 + rng.randrange(-100, 100),
+        (height - paper.height) // 2 + rng.randrange(-100, 100),
+    )
+    photo.paste(paper.convert("RGB"), position, mask)
+
+    # Cameras store the sensor's landscape pixels and an orientation tag
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = 6
+    out = io.BytesIO()
+    photo.transpose(Image.Transpose.ROTATE_90).save(out, format="JPEG", quality=92, exif=exif)
+    return out.getvalue()
+
+
+def synthetic_receipts(count: int, seed: int):
+    rng = random.Random(seed)
+    for number, spending in enumerate(synthetic.generate(count, seed=seed)):
+        yield f"synthetic-{number}", render_photo(spending, rng), spending
+
+
+def photo_receipts(directory: Path):
+    for path in sorted(directory.iterdir()):
+        if path.suffix.lower() not in (".jpg", ".jpeg", ".png", ".webp"):
+            continue
+        truth = path.with_suffix(".json")
+        spending = (
+            SpendingAgentOutput.model_validate_json(truth.read_text()) if truth.exists() else None
+        )
+        yield path.name, path.read_bytes(), spending
+
+
+def ocr_accuracy(data: bytes, spending: SpendingAgentOutput) -> float:
+    import pytesseract
+
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    text = " ".join(pytesseract.image_to_string(image).split())
+    expected = " ".join(" ".join(receipt_lines(spending)).split())
+    return difflib.SequenceMatcher(None, text.lower(), expected.lower()).ratio()
+
+
+def extraction_accuracy(client, data: bytes, mime_type: str, spending: SpendingAgentOutput) -> float:
+    from google.genai import types
+
+    from personal_accountant import model
+    from personal_accountant.sub_agents.spend_extractor.prompt import SPEND_EXTRACTOR_PROMPT
+
+    response = client.models.generate_content(
+        model=model.LIGHT_MODEL,
+        contents=[types.Part.from_bytes(data=data, mime_type=mime_type)],
+        config=types.GenerateContentConfig(
+            system_instruction=SPEND_EXTRACTOR_PROMPT,
+            response_mime_type="application/json",
+            response_schema=SpendingAgentOutput,
+        ),
+    )
+    extracted = SpendingAgentOutput.model_validate_json(response.text)
+
+    checks = [
+        extracted.merchant_name.lower() == spending.merchant_name.lower(),
+        extracted.transaction_date == spending.transaction_date,
+        abs(extracted.summary_total_amount - spending.summary_total_amount) < 0.01,
+        len(extracted.items) == len(spending.items),
+        sum(
+            abs(got.total - expected.total) < 0.01
+            for got, expected in zip(extracted.items, spending.items)
+        ) == len(spending.items),
+    ]
+    return sum(checks) / len(checks)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--receipts", type=int, default=10, help="Synthetic receipts to render")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--images", type=Path, help="Directory of real receipt photos")
+    parser.add_argument("--ocr", action="store_true", help="Check fidelity with tesseract")
+    parser.add_argument("--extract", action="store_true", help="Check fidelity with Gemini")
+    args = parser.parse_args()
+
+    receipts = photo_receipts(args.images) if args.images else synthetic_receipts(args.receipts, args.seed)
+    client = None
+    if args.extract:
+        from google import genai
+
+        client = genai.Client()
+
+    print(f"{'receipt':<20} {'bytes in':>10} {'bytes out':>10} {'ratio':>6} {'ms':>8}  accuracy before -> after")
+    ratios, latencies, before, after = [], [], [], []
+    for name, data, spending in receipts:
+        start = time.perf_counter()
+        processed, mime_type = await image_preprocessing.shrink_image(data, "image/jpeg")
+        latencies.append((time.perf_counter() - start) * 1000)
+        ratios.append(len(processed) / len(data))
+
+        accuracy = ""
+        if spending is not None and (args.ocr and not args.images or args.extract):
+            if args.extract:
+                scores = [
+                    extraction_accuracy(client, data, "image/jpeg", spending),
+                    extraction_accuracy(client, processed, mime_type, spending),
+                ]
+            else:
+                scores = [ocr_accuracy(data, spending), ocr_accuracy(processed, spending)]
+            before.append(scores[0])
+            after.append(scores[1])
+            accuracy = f"{scores[0]:.3f} -> {scores[1]:.3f}"
+
+        print(
+            f"{name:<20} {len(data):>10} {len(processed):>10} {ratios[-1]:>6.2f}"
+            f" {latencies[-1]:>8.1f}  {accuracy}"
+        )
+
+    print(
+        f"{'mean':<20} {'':>10} {'':>10} {statistics.mean(ratios):>6.2f}"
+        f" {statistics.mean(latencies):>8.1f}"
+        + (f"  {statistics.mean(before):.3f} -> {statistics.mean(after):.3f}" if before else "")
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
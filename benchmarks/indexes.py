@@ -0,0 +1,135 @@
+"""
+Query latency of the retriever's typical filters before and after the
+0002_add_query_indexes migration.
+
+Needs an empty throwaway database: it migrates to version 1, seeds synthetic
+spendings server side, times the queries, migrates to version 2 and times
+them again.
+
+    POSTGRES_URL=postgres://... python benchmarks/indexes.py --rows 2000000
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from personal_accountant.tools import database  # noqa: E402
+
+SEED_SPENDINGS_SQL = """
+INSERT INTO spendings (
+    type, currency, transaction_date, transaction_time, transaction_category,
+    merchant_name, summary_subtotal, summary_total_amount, payment_method
+)
+SELECT
+    'receipt',
+    (ARRAY['IDR', 'USD', 'EUR'])[1 + g %% 3],
+    DATE '2022-01-01' + (g * 7919 %% 1460),
+    TIME '08:00' + (g %% 720) * INTERVAL '1 minute',
+    (ARRAY['Dining', 'Groceries', 'Travel', 'Utilities', 'Shopping', 'Transport'])[1 + g %% 6],
+    (ARRAY['SuperMart', 'Local Coffee Shop', 'Amazon', 'Indomaret', 'Grab', 'Hotel Mulia'])[1 + g %% 6]
+        || ' #' || (g %% 997),
+    (g * 31 %% 100000) / 100.0,
+    (g * 31 %% 100000) / 100.0,
+    (ARRAY['Cash', 'Credit Card', 'Debit Card', 'Digital Wallet'])[1 + g %% 4]
+FROM generate_series(1, %(rows)s) AS g;
+"""
+
+SEED_ITEMS_SQL = """
+INSERT INTO spending_items (spending_id, description, quantity, unit_price, total)
+SELECT
+    s.id,
+    (ARRAY['Organic Apples', 'Milk', 'Kopi Susu', 'Bread', 'Coffee Beans', 'Rice'])[1 + (s.id + n) %% 6],
+    1 + n,
+    2.50,
+    2.50 * (1 + n)
+FROM spendings s, generate_series(0, %(items)s - 1) AS n;
+"""
+
+QUERIES = {
+    "total this month": """
+        SELECT SUM(summary_total_amount)
+        FROM spendings
+        WHERE transaction_date >= '2024-10-01' AND transaction_date <= '2024-10-31';
+    """,
+    "category last week": """
+        SELECT transaction_date, merchant_name, summary_total_amount
+        FROM spendings
+        WHERE transaction_category = 'Groceries'
+          AND transaction_date >= '2024-10-14' AND transaction_date <= '2024-10-20'
+        ORDER BY transaction_date;
+    """,
+    "merchant ilike": """
+        SELECT transaction_date, merchant_name, summary_total_amount
+        FROM spendings
+        WHERE merchant_name ILIKE '%coffee shop #42%';
+    """,
+    "items at merchant on day": """
+        SELECT s.transaction_date, si.description, si.quantity, si.unit_price, si.total
+        FROM spendings s
+        JOIN spending_items si ON s.id = si.spending_id
+        WHERE s.merchant_name = 'SuperMart #0'
+          AND s.transaction_date = '2024-10-15';
+    """,
+    "item description ilike": """
+        SELECT COUNT(*), SUM(si.total)
+        FROM spending_items si
+        WHERE si.description ILIKE '%kopi%';
+    """,
+}
+
+
+async def time_queries(pool, repeats: int) -> dict[str, float]:
+    medians = {}
+    async with pool.connection() as conn:
+        await conn.execute("ANALYZE")
+        for name, query in QUERIES.items():
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                await (await conn.execute(query)).fetchall()
+                timings.append(time.perf_counter() - start)
+            medians[name] = statistics.median(timings) * 1000
+    return medians
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--items", type=int, default=3, help="Items per spending")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    try:
+        await database.migrate(target_version=1)
+        pool = await database.get_db_pool()
+
+        async with pool.connection() as conn:
+            count = await (await conn.execute("SELECT COUNT(*) FROM spendings")).fetchone()
+            if count[0]:
+                raise SystemExit("spendings is not empty, use a throwaway database")
+
+            print(f"Seeding {args.rows} spendings with {args.items} items each...")
+            await conn.execute(SEED_SPENDINGS_SQL, {"rows": args.rows})
+            await conn.execute(SEED_ITEMS_SQL, {"items": args.items})
+
+        before = await time_queries(pool, args.repeats)
+        await database.migrate(target_version=2)
+        after = await time_queries(pool, args.repeats)
+
+        print(f"{'query':<26} {'before':>12} {'after':>12} {'speedup':>9}")
+        for name in QUERIES:
+            print(
+                f"{name:<26} {before[name]:9.2f} ms {after[name]:9.2f} ms"
+                f" {before[name] / after[name]:8.1f}x"
+            )
+    finally:
+        await database.close_db_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+"""
+How long save_spending keeps a chat turn waiting, saving straight to Postgres
+against acknowledging from the ingest queue's local journal.
+
+A background connection keeps taking a SHARE lock on spendings, the way a
+long export or migration would, so some saves have to wait for it. Every
+receipt is saved for real, run it against a throwaway database:
+
+    POSTGRES_URL=postgres://... python benchmarks/ingest_queue.py --receipts 200 --lock-ms 300
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from personal_accountant.tools import database  # noqa: E402
+from personal_accountant.tools.ingest_queue import IngestQueue  # noqa: E402
+from personal_accountant.types.type import SpendingAgentOutput, SpendingItem  # noqa: E402
+
+USER_ID = "benchmark"
+
+
+def make_receipt(run: str, number: int) -> SpendingAgentOutput:
+    return SpendingAgentOutput(
+        type="receipt",
+        currency="IDR",
+        transaction_date="2025-05-01",
+        transaction_category="Groceries",
+        merchant_name="SuperMart",
+        # Distinct receipts in every run, identical ones would be skipped
+        payment_transaction_id=f"{run}-{number}",
+        summary_subtotal=10.0,
+        summary_total_amount=10.0,
+        items=[
+            SpendingItem(description=f"item {i}", quantity=1, unit_price=2.5, total=2.5)
+            for i in range(4)
+        ],
+    )
+
+
+async def hold_locks(pool, lock_seconds: float, every_seconds: float):
+    """Block writes to spendings for `lock_seconds` out of every `every_seconds`."""
+    async with pool.connection() as conn:
+        while True:
+            await asyncio.sleep(every_seconds - lock_seconds)
+            await conn.execute("LOCK TABLE spendings IN SHARE MODE")
+            await asyncio.sleep(lock_seconds)
+            await conn.rollback()
+
+
+async def time_saves(save, receipts, interval_seconds: float) -> list[float]:
+    timings = []
+    for receipt in receipts:
+        start = time.perf_counter()
+        await save(receipt)
+        timings.append(time.perf_counter() - start)
+        await asyncio.sleep(interval_seconds)
+    return timings
+
+
+def report(name: str, timings: list[float]):
+    timings_ms = sorted(t * 1000 for t in timings)
+    p99 = timings_ms[min(len(timings_ms) - 1, int(len(timings_ms) * 0.99))]
+    print(
+        f"{name:<8} mean {statistics.mean(timings_ms):8.2f} ms"
+        f"  p50 {statistics.median(timings_ms):8.2f} ms  p99 {p99:8.2f} ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--receipts", type=int, default=200)
+    parser.add_argument("--interval-ms", type=float, default=10, help="Pause between saves")
+    parser.add_argument("--lock-ms", type=float, default=300, help="How long each lock is held")
+    parser.add_argument("--lock-every-ms", type=float, default=1000)
+    args = parser.parse_args()
+
+    run = uuid.uuid4().hex[:8]
+    direct_receipts = [make_receipt(f"{run}-direct", number) for number in range(args.receipts)]
+    queued_receipts = [make_receipt(f"{run}-queued", number) for number in range(args.receipts)]
+    interval = args.interval_ms / 1000
+
+    try:
+        await database.migrate()
+        pool = await database.get_db_pool()
+        locker = asyncio.create_task(hold_locks(pool, args.lock_ms / 1000, args.lock_every_ms / 1000))
+
+        print(
+            f"{args.receipts} saves, spendings locked {args.lock_ms:g} ms out of every"
+            f" {args.lock_every_ms:g} ms, save latency:"
+        )
+        report("direct", await time_saves(
+            lambda receipt: database.save_spendings([receipt], USER_ID), direct_receipts, interval
+        ))
+
+        with tempfile.TemporaryDirectory() as directory:
+            queue = IngestQueue(str(Path(directory) / "queue.sqlite3"), batch_size=100, max_attempts=5)
+            queue.start_worker(database.save_spendings)
+            start = time.perf_counter()
+            report("queued", await time_saves(
+                lambda receipt: queue.enqueue([receipt], USER_ID), queued_receipts, interval
+            ))
+
+            while queue.stats()["depth"]:
+                await asyncio.sleep(0.01)
+            stats = queue.stats()
+            print(
+                f"queue drained {time.perf_counter() - start:.2f}s after the first save,"
+                f" {stats['flushed']:g} flushed at {stats['flushed_per_second']:.0f} rows/s"
+            )
+            queue.worker.cancel()
+
+        locker.cancel()
+    finally:
+        await database.close_db_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+"""
+Wall time of saving several receipts sent in one message.
+
+The root agent and the extractor run on the stub from stub_llm.py, with
+--latency seconds added to every model call. The same number of receipts
+is saved two ways:
+
+- one: a message per receipt, one after the other, each through
+  spend_extractor_agent and save_spending
+- batch: all receipts in one message through extract_spendings, extracted
+  EXTRACTION_CONCURRENCY at a time and saved in one transaction
+
+Every receipt is distinct and the extraction cache starts empty. Spendings
+are written to POSTGRES_URL, use a throwaway database:
+
+    POSTGRES_URL=postgres://... python benchmarks/multi_receipt.py --receipts 10 --latency 1.5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+os.environ["EXTRACTION_CACHE_PATH"] = str(Path(tempfile.mkdtemp()) / "extraction_cache.sqlite3")
+
+from google.adk.runners import InMemoryRunner  # noqa: E402
+from google.genai import types  # noqa: E402
+
+import stub_llm  # noqa: E402
+import synthetic  # noqa: E402
+from personal_accountant.agent import root_agent  # noqa: E402
+from personal_accountant.tools import database  # noqa: E402
+
+
+async def run_message(runner: InMemoryRunner, session_id: str, text: str) -> list[str]:
+    """Names of the tools the root agent called for `text`."""
+    message = types.Content(role="user", parts=[types.Part(text=text)])
+    calls = []
+    async for event in runner.run_async(
+        user_id="benchmark", session_id=session_id, new_message=message
+    ):
+        calls += [call.name for call in event.get_function_calls()]
+    return calls
+
+
+async def one_per_message(runner, session_id, receipts) -> list[str]:
+    calls = []
+    for receipt in receipts:
+        calls += await run_message(runner, session_id, stub_llm.RECEIPT_PREFIX + json.dumps(receipt))
+    return calls
+
+
+async def one_message(runner, session_id, receipts) -> list[str]:
+    return await run_message(runner, session_id, stub_llm.RECEIPTS_PREFIX + json.dumps(receipts))
+
+
+async def saved_count(pool) -> int:
+    async with pool.connection() as conn:
+        return (await (await conn.execute("SELECT COUNT(*) FROM spendings")).fetchone())[0]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--receipts", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=1.0, help="Seconds per model call")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    stub_llm.install(root_agent, lambda question: "SELECT 1", args.latency)
+    runner = InMemoryRunner(agent=root_agent)
+
+    try:
+        await database.migrate()
+        pool = await database.get_db_pool()
+
+        print(f"{'mode':<6} {'receipts':>8} {'saved':>6} {'calls':>6} {'wall s':>8}")
+        strategies = {"one": one_per_message, "batch": one_message}
+        for number, (mode, strategy) in enumerate(strategies.items()):
+            receipts = [
+                receipt.model_dump(mode="json", exclude_none=True)
+                for receipt in synthetic.generate(args.receipts, seed=args.seed + number)
+            ]
+            session = await runner.session_service.create_session(
+                app_name=runner.app_name, user_id="benchmark"
+            )
+            before = await saved_count(pool)
+
+            start = time.perf_counter()
+            calls = await strategy(runner, session.id, receipts)
+            wall = time.perf_counter() - start
+
+            saved = await saved_count(pool) - before
+            print(f"{mode:<6} {len(receipts):>8} {saved:>6} {len(calls):>6} {wall:>8.2f}")
+    finally:
+        await database.close_db_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
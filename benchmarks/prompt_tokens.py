@@ -0,0 +1,104 @@
+"""
+Size of every LLM agent's instruction, rendered the way the agent would send
+it for a sample question, and how much of it is the static prefix a provider
+prompt cache can reuse between calls.
+
+Tokens are estimated at four characters each, the same estimate stub_llm.py
+reports. With GOOGLE_API_KEY set, --count-tokens asks the Gemini API for
+exact counts instead. Instruction providers that read the schema load it
+from POSTGRES_URL, and fall back to a built-in one without a database:
+
+    POSTGRES_URL=postgres://... python benchmarks/prompt_tokens.py
+"""
+
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from google.adk.agents import BaseAgent, LlmAgent  # noqa: E402
+from google.adk.tools.agent_tool import AgentTool  # noqa: E402
+from google.genai import types  # noqa: E402
+
+from personal_accountant.agent import root_agent  # noqa: E402
+from personal_accountant.tools import database  # noqa: E402
+
+QUESTION = "How much did I spend on coffee last month?"
+
+# Enough state for every instruction to render, as if a query had just failed
+STATE = {
+    "sql_query": "SELECT SUM(amount) FROM spendings WHERE merchant_name ILIKE '%coffee%'",
+    "sql_status": "undefined_column",
+    "sql_error": 'UndefinedColumn: column "amount" does not exist',
+}
+
+
+def llm_agents(agent: BaseAgent):
+    if isinstance(agent, LlmAgent):
+        yield agent
+        for tool in agent.tools:
+            if isinstance(tool, AgentTool):
+                yield from llm_agents(tool.agent)
+
+    for sub_agent in agent.sub_agents:
+        yield from llm_agents(sub_agent)
+
+
+async def render(agent: LlmAgent, question: str) -> str:
+    if isinstance(agent.instruction, str):
+        return agent.instruction
+
+    # All instruction providers read is the user message and the state
+    context = SimpleNamespace(
+        user_content=types.Content(role="user", parts=[types.Part(text=question)]),
+        state=STATE,
+    )
+    return await agent.instruction(context)
+
+
+def common_prefix(left: str, right: str) -> int:
+    length = 0
+    for a, b in zip(left, right):
+        if a != b:
+            break
+        length += 1
+    return length
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--question", default=QUESTION)
+    parser.add_argument("--count-tokens", action="store_true", help="Count with the Gemini API")
+    args = parser.parse_args()
+
+    if args.count_tokens:
+        from google import genai
+
+        client = genai.Client()
+
+        def count(text: str, model: str) -> int:
+            return client.models.count_tokens(model=model, contents=text).total_tokens
+    else:
+        def count(text: str, model: str) -> int:
+            return len(text) // 4
+
+    print(f"{'agent':<32} {'chars':>7} {'tokens':>7} {'static':>7}")
+    try:
+        for agent in llm_agents(root_agent):
+            text = await render(agent, args.question)
+            # What stays the same for a different question is the cacheable prefix
+            other = await render(agent, "Show my grocery receipts from yesterday")
+            static = text[: common_prefix(text, other)]
+            print(
+                f"{agent.name:<32} {len(text):>7} {count(text, agent.model):>7}"
+                f" {count(static, agent.model) if static else 0:>7}"
+            )
+    finally:
+        await database.close_db_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+"""
+CPU cost of the record layer around a save and a query answer, no database
+needed.
+
+Per receipt: validating the extracted spending from session state the way
+save_spending does, binding it to INSERT_RECEIPT_SQL's parameters, and
+dumping it back to session state and to the ingest queue's journal. Per
+--rows result rows: sizing each row for QUERY_MAX_BYTES and turning them
+into JSON values for session state, next to the json.dumps(default=str)
+sizing query_database did before.
+
+    python benchmarks/records.py --receipts 2000 --rows 10000
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import synthetic  # noqa: E402
+from personal_accountant.tools import database  # noqa: E402
+from personal_accountant.tools.fx_rates import BASE_CURRENCY  # noqa: E402
+from personal_accountant.types import records  # noqa: E402
+from personal_accountant.types.type import SpendingAgentOutput  # noqa: E402
+
+
+def per_call_us(function, inputs: list, repeat: int) -> float:
+    """Best of `repeat` passes over `inputs`, in microseconds per input."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for value in inputs:
+            function(value)
+        best = min(best, time.perf_counter() - start)
+    return best / len(inputs) * 1e6
+
+
+def per_batch_ms(function, batch, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(batch)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def make_rows(count: int, seed: int) -> list[dict]:
+    """Rows the way psycopg returns them for a listing of spendings."""
+    rng = random.Random(seed)
+    start = date(2022, 1, 1)
+    return [
+        {
+            "id": number,
+            "transaction_date": start + timedelta(days=rng.randrange(4 * 365)),
+            "merchant_name": rng.choice(synthetic.MERCHANTS["Dining"]),
+            "transaction_category": "Dining",
+            "currency": BASE_CURRENCY,
+            "summary_total_amount": Decimal(rng.randrange(100, 10_000_000)) / 100,
+        }
+        for number in range(count)
+    ]
+
+
+def old_row_bytes(rows: list[dict]):
+    for row in rows:
+        len(json.dumps(row, default=str))
+
+
+def new_row_bytes(rows: list[dict]):
+    for row in rows:
+        len(records.encode_row(row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--receipts", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # What the extractor leaves in session state, in the base currency so
+    # binding converts without a rate lookup
+    states = [
+        {**spending.model_dump(exclude_none=True), "currency": BASE_CURRENCY}
+        for spending in synthetic.generate(args.receipts, seed=args.seed)
+    ]
+    spendings = [SpendingAgentOutput.model_validate(state) for state in states]
+    items = sum(len(spending.items) for spending in spendings) / len(spendings)
+
+    print(f"per receipt ({items:.1f} items on average), us")
+    for name, function, inputs in [
+        ("validate", records.SPENDING.validate_python, states),
+        ("bind", database.receipt_values, spendings),
+        ("dump to state", lambda spending: spending.model_dump(exclude_none=True), spendings),
+        ("dump to journal", SpendingAgentOutput.model_dump_json, spendings),
+    ]:
+        print(f"  {name:<18} {per_call_us(function, inputs, args.repeat):8.2f}")
+
+    rows = make_rows(args.rows, args.seed)
+    print(f"per {args.rows} result rows, ms")
+    for name, function in [
+        ("size, json.dumps", old_row_bytes),
+        ("size, encode_row", new_row_bytes),
+        ("json_rows", records.json_rows),
+    ]:
+        print(f"  {name:<18} {per_batch_ms(function, rows, args.repeat):8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Compare receipt persistence strategies:
+
+- per_item: the old save_spending flow, one INSERT for the header and one per item
+- single: the batched INSERT_RECEIPT_SQL, one round trip per receipt
+- bulk: save_spendings style, all receipts of a run pipelined in one transaction
+
+Run it against a throwaway database, every transaction is rolled back:
+
+    POSTGRES_URL=postgres://... python benchmarks/save_spending.py --receipts 50 --items 60
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from personal_accountant.tools import database  # noqa: E402
+from personal_accountant.types.type import SpendingAgentOutput, SpendingItem  # noqa: E402
+
+
+def make_receipt(items: int, number: int) -> SpendingAgentOutput:
+    return SpendingAgentOutput(
+        type="receipt",
+        currency="IDR",
+        transaction_date="2025-05-01",
+        transaction_category="Groceries",
+        merchant_name="SuperMart",
+        # Distinct receipts, identical ones would be skipped as duplicates
+        payment_transaction_id=f"TXN{number}",
+        summary_subtotal=items * 2.5,
+        summary_total_amount=items * 2.5,
+        items=[
+            SpendingItem(
+                description=f"item {i}", quantity=1, unit_price=2.5, total=2.5
+            )
+            for i in range(items)
+        ],
+    )
+
+
+async def per_item(conn, receipt: SpendingAgentOutput):
+    values = database.spending_values(receipt)
+    async with conn.cursor() as cursor:
+        await cursor.execute(
+            """
+            INSERT INTO spendings (
+                type, currency, transaction_date, transaction_time, transaction_category,
+                merchant_name, merchant_address, merchant_phone, merchant_website, merchant_tax_id,
+                summary_subtotal, summary_discount_amount, summary_tax_amount, summary_shipping_amount,
+                summary_total_amount, summary_amount_paid, summary_change_due,
+                payment_method, payment_card_type, payment_transaction_id, notes, base_total_amount,
+                ingest_key
+            ) VALUES (
+                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+                %s
+            ) RETURNING id;
+            """,
+            values,
+        )
+        spending_id = (await cursor.fetchone())[0]
+        for item in receipt.items:
+            await cursor.execute(
+                """
+                INSERT INTO spending_items (
+                    spending_id, description, quantity, unit_price, total
+                ) VALUES (%s, %s, %s, %s, %s);
+                """,
+                (spending_id, item.description, item.quantity, item.unit_price, item.total),
+            )
+
+
+async def single(conn, receipt: SpendingAgentOutput):
+    await database.insert_spendings(conn, [receipt])
+
+
+async def time_per_receipt(pool, strategy, receipts) -> list[float]:
+    timings = []
+    for receipt in receipts:
+        async with pool.connection() as conn:
+            await database.scope_to_user(conn, "benchmark")
+            start = time.perf_counter()
+            await strategy(conn, receipt)
+            timings.append(time.perf_counter() - start)
+            await conn.rollback()
+    return timings
+
+
+async def time_bulk(pool, receipts) -> float:
+    async with pool.connection() as conn:
+        await database.scope_to_user(conn, "benchmark")
+        start = time.perf_counter()
+        await database.insert_spendings(conn, receipts)
+        elapsed = time.perf_counter() - start
+        await conn.rollback()
+    return elapsed
+
+
+def report(name: str, timings: list[float]):
+    timings_ms = sorted(t * 1000 for t in timings)
+    p99 = timings_ms[min(len(timings_ms) - 1, int(len(timings_ms) * 0.99))]
+    print(
+        f"{name:<10} mean {statistics.mean(timings_ms):8.2f} ms"
+        f"  p50 {statistics.median(timings_ms):8.2f} ms  p99 {p99:8.2f} ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--receipts", type=int, default=50)
+    parser.add_argument("--items", type=int, default=60)
+    args = parser.parse_args()
+
+    receipts = [make_receipt(args.items, number) for number in range(args.receipts)]
+
+    try:
+        await database.migrate()
+        pool = await database.get_db_pool()
+
+        # Warm up connections and plans before measuring
+        await time_per_receipt(pool, single, receipts[:3])
+
+        print(f"{args.receipts} receipts x {args.items} items, per receipt latency:")
+        report("per_item", await time_per_receipt(pool, per_item, receipts))
+        report("single", await time_per_receipt(pool, single, receipts))
+
+        bulk_elapsed = await time_bulk(pool, receipts)
+        print(
+            f"{'bulk':<10} {bulk_elapsed * 1000:8.2f} ms for the whole batch"
+            f" ({bulk_elapsed * 1000 / args.receipts:.2f} ms per receipt)"
+        )
+    finally:
+        await database.close_db_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
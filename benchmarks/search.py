@@ -0,0 +1,140 @@
+"""
+Finding spendings by what was bought: the ILIKE filters the query generator
+used to write against search_spending() of 0007_add_spending_search.
+
+Needs an empty throwaway database with pg_trgm: it is migrated and seeded
+server side with --rows spendings of --items items each, described in
+English and Indonesian. Every query runs scoped to one user the way
+query_database runs them, and the matches each way finds are counted along
+with the latency.
+
+    POSTGRES_URL=postgres://... python benchmarks/search.py --rows 500000 --items 4
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from personal_accountant.tools import database  # noqa: E402
+
+USER_ID = "benchmark"
+
+MERCHANTS = [
+    "Starbucks", "Kopi Kenangan", "Indomaret", "Alfamart", "Warung Kopi Pak Budi",
+    "SuperMart", "Pertamina", "Gojek", "Hypermart", "Solaria",
+]
+
+ITEMS = [
+    "Caffe Latte", "Coffee beans 250g", "Iced coffees", "Kopi susu gula aren",
+    "Es kopi", "Kopinya Kapal Api", "Teh manis", "Green tea latte", "Nasi goreng",
+    "Ayam goreng", "Roti tawar", "Croissant", "Milk 1L", "Susu UHT", "Air mineral",
+    "Mineral water", "Bensin Pertalite", "Gasoline", "Sabun mandi", "Shampoo",
+    "Beras 5kg", "Rice 5kg", "Telur ayam", "Eggs", "Minyak goreng", "Cooking oil",
+]
+
+SEED_SPENDINGS_SQL = """
+INSERT INTO spendings (
+    type, currency, transaction_date, transaction_category, merchant_name,
+    summary_subtotal, summary_total_amount, base_total_amount
+)
+SELECT
+    'receipt',
+    'IDR',
+    CURRENT_DATE - (g::bigint * 7919 %% 1460)::integer,
+    (ARRAY['Dining', 'Groceries', 'Travel', 'Utilities', 'Shopping', 'Transport'])[1 + g %% 6],
+    (%(merchants)s::text[])[1 + g %% cardinality(%(merchants)s::text[])] || ' #' || (g %% 97),
+    %(items)s * 25,
+    %(items)s * 25,
+    %(items)s * 25
+FROM generate_series(1, %(rows)s) AS g;
+"""
+
+SEED_ITEMS_SQL = """
+INSERT INTO spending_items (spending_id, description, quantity, unit_price, total)
+SELECT
+    s.id,
+    (%(descriptions)s::text[])[1 + (s.id * 7 + n) %% cardinality(%(descriptions)s::text[])],
+    1,
+    25,
+    25
+FROM spendings s, generate_series(1, %(items)s) AS n;
+"""
+
+TERMS = ["coffee", "kopi", "kopi susu", "starbuks", "rice"]
+
+# What the query generator wrote before, one pattern per term
+ILIKE_SQL = """
+SELECT count(*), sum(coalesce(si.total, s.summary_total_amount))
+FROM spendings s
+LEFT JOIN spending_items si
+    ON si.spending_id = s.id AND s.merchant_name NOT ILIKE %(pattern)s
+WHERE s.merchant_name ILIKE %(pattern)s OR si.description ILIKE %(pattern)s
+"""
+
+SEARCH_SQL = "SELECT count(*), sum(amount) FROM search_spending(%(term)s)"
+
+
+async def time_query(pool, query: str, params: dict, repeat: int) -> tuple[float, int]:
+    timings = []
+    async with pool.connection() as conn:
+        await database.scope_to_user(conn, USER_ID)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            matches, _ = await (await conn.execute(query, params)).fetchone()
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), matches
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--items", type=int, default=4, help="Items per spending")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    try:
+        await database.migrate()
+        pool = await database.get_db_pool()
+        async with pool.connection() as conn:
+            count = await (await conn.execute("SELECT COUNT(*) FROM spendings")).fetchone()
+            if count[0]:
+                raise SystemExit("spendings is not empty, use a throwaway database")
+
+            start = time.perf_counter()
+            await database.scope_to_user(conn, USER_ID)
+            params = {"rows": args.rows, "items": args.items, "merchants": MERCHANTS, "descriptions": ITEMS}
+            await conn.execute(SEED_SPENDINGS_SQL, params)
+            await conn.execute(SEED_ITEMS_SQL, params)
+            print(
+                f"seeded {args.rows} spendings, {args.rows * args.items} items"
+                f" in {time.perf_counter() - start:.1f}s"
+            )
+
+        async with pool.connection() as conn:
+            await conn.set_autocommit(True)
+            await conn.execute("VACUUM ANALYZE spendings")
+            await conn.execute("VACUUM ANALYZE spending_items")
+            await conn.set_autocommit(False)
+
+        print(f"{'term':<12} {'ILIKE ms':>9} {'matches':>9} {'search ms':>10} {'matches':>9}")
+        for term in TERMS:
+            ilike_ms, ilike_matches = await time_query(
+                pool, ILIKE_SQL, {"pattern": f"%{term}%"}, args.repeat
+            )
+            search_ms, search_matches = await time_query(
+                pool, SEARCH_SQL, {"term": term}, args.repeat
+            )
+            print(
+                f"{term:<12} {ilike_ms:>9.1f} {ilike_matches:>9} {search_ms:>10.1f} {search_matches:>9}"
+            )
+    finally:
+        await database.close_db_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
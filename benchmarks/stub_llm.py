@@ -0,0 +1,121 @@
+"""
+Deterministic stand-in for the Gemini models, so the real agent graph can be
+benchmarked offline and without model latency or cost.
+
+install(root_agent, sql_for_question) swaps the model of every LLM agent in
+the tree for a StubLlm that plays that agent's part with canned responses:
+the root agent routes receipts to the extractor (several at once to
+extract_spendings) and questions to the retriever, the extractor echoes the receipt JSON it was given and the query
+agents look the SQL up in `sql_for_question`.
+"""
+
+import asyncio
+import json
+from typing import AsyncGenerator, Callable, Optional
+
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.tools.agent_tool import AgentTool
+from google.genai import types
+
+RECEIPT_PREFIX = "Save this receipt: "
+# Followed by a JSON list of receipts
+RECEIPTS_PREFIX = "Save these receipts: "
+
+
+def text_of(content: types.Content) -> str:
+    return "\n".join(part.text for part in content.parts or [] if part.text)
+
+
+def function_response_of(content: types.Content) -> Optional[types.FunctionResponse]:
+    return next(
+        (part.function_response for part in content.parts or [] if part.function_response),
+        None,
+    )
+
+
+def call(name: str, **args) -> types.Part:
+    return types.Part(function_call=types.FunctionCall(name=name, args=args))
+
+
+class StubLlm(BaseLlm):
+    # The agent this stub plays, set by install()
+    agent_name: str = ""
+    sql_for_question: Callable[[str], str] = lambda question: "SELECT 1"
+    # Seconds every call takes, to stand in for model latency
+    latency: float = 0.0
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        # The latest user text, sessions may hold earlier turns
+        question = next(
+            (
+                text_of(c)
+                for c in reversed(llm_request.contents)
+                if c.role == "user" and text_of(c)
+            ),
+            "",
+        )
+        last = llm_request.contents[-1]
+        responded = function_response_of(last)
+
+        respond = getattr(self, f"respond_{self.agent_name}", self.respond_default)
+        parts = respond(question, responded)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        prompt_chars = sum(len(text_of(c)) for c in llm_request.contents)
+        yield LlmResponse(
+            content=types.Content(role="model", parts=parts),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=prompt_chars // 4,
+                candidates_token_count=sum(len(p.text or "") for p in parts) // 4 + 1,
+                total_token_count=prompt_chars // 4 + 1,
+            ),
+        )
+
+    def respond_personal_accountant_agent(self, question, responded):
+        if responded is None:
+            if question.startswith(RECEIPTS_PREFIX):
+                receipts = json.loads(question.removeprefix(RECEIPTS_PREFIX))
+                return [call("extract_spendings", documents=[json.dumps(r) for r in receipts])]
+            if question.startswith(RECEIPT_PREFIX):
+                return [call("spend_extractor_agent", request=question)]
+            return [call("transfer_to_agent", agent_name="spend_retriever_agent")]
+
+        if responded.name in ("spend_extractor_agent", "extract_spendings"):
+            return [call("save_spending")]
+
+        return [types.Part(text=f"save_spending: {responded.response.get('state')}")]
+
+    def respond_spend_extractor_agent(self, question, responded):
+        receipt = json.loads(question.removeprefix(RECEIPT_PREFIX))
+        return [types.Part(text=json.dumps(receipt))]
+
+    def respond_initial_query_generator_agent(self, question, responded):
+        return [types.Part(text=self.sql_for_question(question))]
+
+    respond_query_refinement_agent = respond_initial_query_generator_agent
+
+    def respond_default(self, question, responded):
+        return [types.Part(text=f"stub answer from {self.agent_name}")]
+
+
+def install(agent: BaseAgent, sql_for_question: Callable[[str], str], latency: float = 0.0):
+    """Replace the model of `agent` and every LLM agent below it with a StubLlm."""
+    if isinstance(agent, LlmAgent):
+        agent.model = StubLlm(
+            model=f"stub-{agent.name}",
+            agent_name=agent.name,
+            sql_for_question=sql_for_question,
+            latency=latency,
+        )
+        for tool in agent.tools:
+            if isinstance(tool, AgentTool):
+                install(tool.agent, sql_for_question, latency)
+
+    for sub_agent in agent.sub_agents:
+        install(sub_agent, sql_for_question, latency)
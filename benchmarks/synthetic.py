@@ -0,0 +1,112 @@
+"""
+Synthetic spendings generated field by field from the Spending and
+SpendingItem models, so a new required field fails here loudly instead of
+silently producing rows the app would reject.
+"""
+
+import random
+from datetime import date, timedelta
+from typing import Callable, Iterator
+
+from personal_accountant.types.type import Spending, SpendingAgentOutput, SpendingItem
+
+MERCHANTS = {
+    "Groceries": ["SuperMart", "Indomaret", "Alfamart", "Ranch Market", "Hypermart"],
+    "Dining": ["Local Coffee Shop", "Kopi Kenangan", "Warung Padang", "Pizza Hut", "Sushi Tei"],
+    "Transport": ["Gojek", "Grab", "Pertamina", "Bluebird", "MRT Jakarta"],
+    "Shopping": ["Tokopedia", "Shopee", "Amazon", "IKEA", "Uniqlo"],
+    "Utilities": ["PLN", "PDAM", "IndiHome", "Telkomsel"],
+    "Travel": ["Garuda Indonesia", "Traveloka", "Hotel Mulia", "Airbnb"],
+}
+
+ITEMS = {
+    "Groceries": ["Organic Apples", "Milk", "Bread", "Eggs", "Rice", "Coffee Beans"],
+    "Dining": ["Kopi Susu", "Nasi Goreng", "Latte", "Pizza", "Salmon Roll", "Iced Tea"],
+    "Transport": ["Ride", "Fuel", "Toll", "Parking"],
+    "Shopping": ["T-Shirt", "Phone Case", "Desk Lamp", "Backpack", "Headphones"],
+    "Utilities": ["Electricity", "Water", "Internet", "Mobile Data"],
+    "Travel": ["Flight", "Hotel Night", "Airport Transfer", "Travel Insurance"],
+}
+
+CURRENCIES = ["IDR", "IDR", "IDR", "USD", "EUR"]
+PAYMENT_METHODS = ["Cash", "Credit Card", "Debit Card", "Digital Wallet", "Bank Transfer"]
+CARD_TYPES = ["Visa", "Mastercard", "Gopay", "OVO", "Shopee Pay"]
+
+
+def spending_fields(
+    rng: random.Random, category: str, subtotal: float, start: date, days: int
+) -> dict[str, Callable[[], object]]:
+    merchant = rng.choice(MERCHANTS[category])
+    tax = round(subtotal * 0.11, 2)
+
+    return {
+        "type": lambda: rng.choice(["receipt", "receipt", "invoice", "bank statement"]),
+        "currency": lambda: rng.choice(CURRENCIES),
+        "transaction_date": lambda: (start + timedelta(days=rng.randrange(days))).isoformat(),
+        "transaction_time": lambda: f"{rng.randrange(7, 23):02d}:{rng.randrange(60):02d}:00",
+        "transaction_category": lambda: category,
+        "merchant_name": lambda: merchant,
+        "merchant_address": lambda: f"Jl. Sudirman No. {rng.randrange(1, 200)}, Jakarta",
+        "merchant_phone": lambda: f"021-{rng.randrange(1000000, 9999999)}",
+        "merchant_website": lambda: f"https://{merchant.lower().replace(' ', '')}.example.com",
+        "merchant_tax_id": lambda: f"NPWP{rng.randrange(10**8, 10**9)}",
+        "summary_subtotal": lambda: subtotal,
+        "summary_discount_amount": lambda: 0.0,
+        "summary_tax_amount": lambda: tax,
+        "summary_shipping_amount": lambda: 0.0,
+        "summary_total_amount": lambda: round(subtotal + tax, 2),
+        "summary_amount_paid": lambda: round(subtotal + tax, 2),
+        "summary_change_due": lambda: 0.0,
+        "payment_method": lambda: rng.choice(PAYMENT_METHODS),
+        "payment_card_type": lambda: rng.choice(CARD_TYPES),
+        "payment_transaction_id": lambda: f"TXN{rng.randrange(10**11, 10**12)}",
+        "notes": lambda: None,
+    }
+
+
+def make_items(rng: random.Random, category: str, count: int) -> list[SpendingItem]:
+    items = []
+    for _ in range(count):
+        quantity = float(rng.randrange(1, 4))
+        unit_price = round(rng.uniform(1, 60), 2)
+        values = {
+            "description": rng.choice(ITEMS[category]),
+            "quantity": quantity,
+            "unit_price": unit_price,
+            "total": round(quantity * unit_price, 2),
+        }
+        # model_construct skips validation, the values above already fit
+        items.append(SpendingItem.model_construct(**{
+            name: values.get(name) for name in SpendingItem.model_fields
+        }))
+
+    return items
+
+
+def make_spending(
+    rng: random.Random,
+    start: date = date(2022, 1, 1),
+    days: int = 4 * 365,
+    max_items: int = 5,
+) -> SpendingAgentOutput:
+    category = rng.choice(list(MERCHANTS))
+    items = make_items(rng, category, rng.randrange(1, max_items + 1))
+    subtotal = round(sum(item.total for item in items), 2)
+    fields = spending_fields(rng, category, subtotal, start, days)
+
+    values = {}
+    for name, field in Spending.model_fields.items():
+        if name not in fields:
+            raise KeyError(f"no synthetic generator for Spending.{name}")
+        # Fill optional fields about half of the time, like real receipts
+        if field.is_required() or rng.random() < 0.5:
+            values[name] = fields[name]()
+
+    return SpendingAgentOutput.model_construct(**values, items=items)
+
+
+def generate(count: int, seed: int = 0, **kwargs) -> Iterator[SpendingAgentOutput]:
+    """`count` spendings, the same ones for the same seed."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield make_spending(rng, **kwargs)
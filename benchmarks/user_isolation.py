@@ -0,0 +1,163 @@
+"""
+Query latency per user under row level security, with the (user_id, ...)
+indexes of 0006_add_spending_owner against the shared date indexes before it.
+
+Needs an empty throwaway database: it is migrated and seeded server side with
+one heavy user holding most of the rows and --users light ones sharing the
+rest. Every query runs scoped to one user the way query_database runs them.
+
+    POSTGRES_URL=postgres://... python benchmarks/user_isolation.py --rows 2000000
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from personal_accountant.tools import database  # noqa: E402
+
+HEAVY_USER = "heavy"
+LIGHT_USER = "light-0"
+
+# 90% of the rows go to the heavy user, the rest round robin to the light ones
+SEED_SPENDINGS_SQL = """
+INSERT INTO spendings (
+    user_id, type, currency, transaction_date, transaction_category,
+    merchant_name, summary_subtotal, summary_total_amount, base_total_amount
+)
+SELECT
+    CASE WHEN g %% 10 = 0 THEN 'light-' || (g / 10 %% %(users)s) ELSE 'heavy' END,
+    'receipt',
+    'IDR',
+    CURRENT_DATE - (g::bigint * 7919 %% 1460)::integer,
+    (ARRAY['Dining', 'Groceries', 'Travel', 'Utilities', 'Shopping', 'Transport'])[1 + g %% 6],
+    'Merchant #' || (g %% 997),
+    (g::bigint * 31 %% 100000) / 100.0,
+    (g::bigint * 31 %% 100000) / 100.0,
+    (g::bigint * 31 %% 100000) / 100.0
+FROM generate_series(1, %(rows)s) AS g;
+"""
+
+# The indexes before 0006_add_spending_owner, for comparison
+SHARED_INDEXES_SQL = """
+DROP INDEX idx_spendings_transaction_date;
+DROP INDEX idx_spendings_category_date;
+DROP INDEX idx_spendings_fingerprint;
+CREATE INDEX idx_spendings_transaction_date
+    ON spendings (transaction_date) INCLUDE (base_total_amount);
+CREATE INDEX idx_spendings_category_date
+    ON spendings (transaction_category, transaction_date) INCLUDE (base_total_amount);
+CREATE INDEX idx_spendings_fingerprint
+    ON spendings (
+        lower(merchant_name),
+        transaction_date,
+        transaction_time,
+        summary_total_amount,
+        payment_transaction_id
+    )
+    WHERE id >= spending_fingerprint_start()
+        AND (transaction_time IS NOT NULL OR payment_transaction_id IS NOT NULL);
+"""
+
+QUERIES = {
+    "total this month": """
+        SELECT SUM(base_total_amount)
+        FROM spendings
+        WHERE transaction_date >= date_trunc('month', CURRENT_DATE)::date;
+    """,
+    "dining last quarter": """
+        SELECT transaction_date, merchant_name, summary_total_amount
+        FROM spendings
+        WHERE transaction_category = 'Dining'
+          AND transaction_date >= CURRENT_DATE - 90
+        ORDER BY transaction_date;
+    """,
+    "latest 20": """
+        SELECT transaction_date, merchant_name, summary_total_amount
+        FROM spendings
+        ORDER BY transaction_date DESC
+        LIMIT 20;
+    """,
+    "yearly by category": """
+        SELECT transaction_category, SUM(base_total_amount)
+        FROM spendings
+        WHERE transaction_date >= CURRENT_DATE - 365
+        GROUP BY transaction_category;
+    """,
+}
+
+
+async def time_query(pool, user_id: str, query: str, repeat: int) -> float:
+    timings = []
+    async with pool.connection() as conn:
+        await database.scope_to_user(conn, user_id)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await (await conn.execute(query)).fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+async def time_users(pool, repeat: int) -> dict[tuple[str, str], float]:
+    return {
+        (name, user_id): await time_query(pool, user_id, query, repeat)
+        for name, query in QUERIES.items()
+        for user_id in (LIGHT_USER, HEAVY_USER)
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=100, help="Light users")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    try:
+        await database.migrate()
+        pool = await database.get_db_pool()
+        async with pool.connection() as conn:
+            count = await (await conn.execute("SELECT COUNT(*) FROM spendings")).fetchone()
+            if count[0]:
+                raise SystemExit("spendings is not empty, use a throwaway database")
+
+            start = time.perf_counter()
+            await conn.execute(SEED_SPENDINGS_SQL, {"rows": args.rows, "users": args.users})
+            cur = await conn.execute(
+                "SELECT user_id, COUNT(*) FROM spendings WHERE user_id = ANY(%s) GROUP BY user_id",
+                ([LIGHT_USER, HEAVY_USER],),
+            )
+            rows = dict(await cur.fetchall())
+            print(
+                f"seeded {args.rows} spendings in {time.perf_counter() - start:.1f}s,"
+                f" {rows[HEAVY_USER]} for {HEAVY_USER}, {rows[LIGHT_USER]} for {LIGHT_USER}"
+            )
+
+        async with pool.connection() as conn:
+            await conn.set_autocommit(True)
+            await conn.execute("VACUUM ANALYZE spendings")
+            await conn.set_autocommit(False)
+        per_user = await time_users(pool, args.repeat)
+
+        async with pool.connection() as conn:
+            await conn.execute(SHARED_INDEXES_SQL)
+            await conn.commit()
+            await conn.set_autocommit(True)
+            await conn.execute("VACUUM ANALYZE spendings")
+            await conn.set_autocommit(False)
+        shared = await time_users(pool, args.repeat)
+
+        print(f"{'query':<22} {'user':<8} {'shared ms':>10} {'per user ms':>12} {'speedup':>8}")
+        for name, user_id in per_user:
+            before, after = shared[name, user_id], per_user[name, user_id]
+            print(f"{name:<22} {user_id:<8} {before:>10.2f} {after:>12.2f} {before / after:>7.1f}x")
+    finally:
+        await database.close_db_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
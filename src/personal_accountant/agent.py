@@ -1,10 +1,16 @@
 from google.adk.agents import Agent
 from google.adk.tools.agent_tool import AgentTool
 
-from personal_accountant import prompt, model
-from personal_accountant.sub_agents.spend_extractor.agent import spend_extractor_agent
+from personal_accountant import prompt, model, telemetry
+from personal_accountant.image_preprocessing import shrink_images
+from personal_accountant.sub_agents.spend_extractor.agent import (
+    extract_spendings,
+    remember_extraction,
+    spend_extractor_agent,
+    use_cached_extraction,
+)
 from personal_accountant.sub_agents.spend_retriever.agent import spend_retriever_agent
-from personal_accountant.tools.database import save_spending
+from personal_accountant.tools.database import resume_ingest_queue, save_spending
 
 personal_accountant_agent = Agent(
     model=model.LIGHT_MODEL,
@@ -12,7 +18,13 @@ personal_accountant_agent = Agent(
     description="A helpful personal accountant",
     instruction=prompt.PERSONAL_ACCOUNTANT_PROMPT,
     sub_agents=[spend_retriever_agent],
-    tools=[AgentTool(agent=spend_extractor_agent), save_spending],
+    tools=[AgentTool(agent=spend_extractor_agent), extract_spendings, save_spending],
+    before_agent_callback=resume_ingest_queue,
+    before_model_callback=shrink_images,
+    before_tool_callback=use_cached_extraction,
+    after_tool_callback=remember_extraction,
 )
 
+telemetry.instrument(personal_accountant_agent)
+
 root_agent = personal_accountant_agent
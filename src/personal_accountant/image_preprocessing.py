@@ -0,0 +1,183 @@
+"""
+Shrinks receipt photos before they are sent to a model.
+
+Phone photos go out at full resolution, while a receipt stays readable at a
+fraction of that. Every image in a model request is rotated upright from
+its EXIF orientation, cropped to the document, turned grayscale, scaled down
+to IMAGE_TARGET_DPI and re-encoded as JPEG. An image is only replaced when
+that made it smaller.
+
+Pillow is optional (the `images` extra). Without it, or for formats it
+cannot read, images go out as they came.
+"""
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+from collections import OrderedDict
+from typing import Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.llm_request import LlmRequest
+
+from personal_accountant import telemetry
+
+try:
+    from PIL import Image, ImageFilter, ImageOps
+except ImportError:
+    Image = None
+
+IMAGE_PREPROCESSING = os.getenv("IMAGE_PREPROCESSING", "true").lower() == "true"
+IMAGE_TARGET_DPI = int(os.getenv("IMAGE_TARGET_DPI", "200"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "80"))
+
+# A photo carries no physical size. Once cropped, a document much taller
+# than wide is taken to be thermal receipt paper, anything else a page.
+RECEIPT_WIDTH_MM = 80
+PAGE_WIDTH_MM = 210
+RECEIPT_MIN_ASPECT = 1.6
+
+# The document is found on a copy this small, it only needs its outline
+DETECTION_SIZE = 256
+# Crops smaller than this share of the photo are more likely a bright
+# detail than the document, larger ones are not worth it
+MIN_DOCUMENT_AREA = 0.05
+MAX_DOCUMENT_AREA = 0.95
+
+# Every model call resends the images of the whole conversation
+CACHE_SIZE = 32
+
+logger = logging.getLogger(__name__)
+
+# sha256 of the original -> (data, mime type) to send instead
+shrunk: OrderedDict[str, tuple[bytes, str]] = OrderedDict()
+
+
+def otsu_threshold(histogram: list[int]) -> int:
+    """The gray level best separating a 256 bin histogram into two classes."""
+    total = sum(histogram)
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+
+    best_level, best_variance = 127, 0.0
+    background, weighted_background = 0, 0
+    for level, count in enumerate(histogram):
+        background += count
+        weighted_background += level * count
+        foreground = total - background
+        if background == 0 or foreground == 0:
+            continue
+
+        mean_background = weighted_background / background
+        mean_foreground = (weighted_total - weighted_background) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_level, best_variance = level, variance
+
+    return best_level
+
+
+def document_box(gray: "Image.Image") -> Optional[tuple[int, int, int, int]]:
+    """
+    Bounding box of the paper: the bright region of the photo, opened with a
+    min/max filter so specks and glare around it do not count.
+    """
+    small = gray.copy()
+    small.thumbnail((DETECTION_SIZE, DETECTION_SIZE))
+    threshold = otsu_threshold(small.histogram())
+    mask = small.point(lambda level: 255 if level > threshold else 0)
+    mask = mask.filter(ImageFilter.MinFilter(5)).filter(ImageFilter.MaxFilter(5))
+
+    box = mask.getbbox()
+    if box is None:
+        return None
+
+    left, top, right, bottom = box
+    area = (right - left) * (bottom - top) / (small.width * small.height)
+    if not MIN_DOCUMENT_AREA <= area <= MAX_DOCUMENT_AREA:
+        return None
+
+    scale_x, scale_y = gray.width / small.width, gray.height / small.height
+    return (
+        int(left * scale_x),
+        int(top * scale_y),
+        min(gray.width, round(right * scale_x)),
+        min(gray.height, round(bottom * scale_y)),
+    )
+
+
+def target_width(width: int, height: int) -> int:
+    document_mm = RECEIPT_WIDTH_MM if height / width >= RECEIPT_MIN_ASPECT else PAGE_WIDTH_MM
+    return round(document_mm / 25.4 * IMAGE_TARGET_DPI)
+
+
+def preprocess_image(data: bytes) -> Optional[bytes]:
+    """The shrunk image as JPEG, or None when Pillow cannot read `data`."""
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception:
+        return None
+
+    image = ImageOps.exif_transpose(image).convert("L")
+
+    box = document_box(image)
+    if box is not None:
+        image = image.crop(box)
+
+    width = target_width(image.width, image.height)
+    if image.width > width:
+        image = image.resize(
+            (width, round(image.height * width / image.width)), Image.Resampling.LANCZOS
+        )
+
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+async def shrink_image(data: bytes, mime_type: str) -> tuple[bytes, str]:
+    """The image to send instead of `data`, which may be `data` itself."""
+    key = hashlib.sha256(data).hexdigest()
+    if key in shrunk:
+        shrunk.move_to_end(key)
+        return shrunk[key]
+
+    with telemetry.timed("image", "preprocess_image", bytes_in=len(data)) as attributes:
+        processed = await asyncio.to_thread(preprocess_image, data)
+        if processed is not None and len(processed) < len(data):
+            result = (processed, "image/jpeg")
+        else:
+            result = (data, mime_type)
+        attributes["bytes_out"] = len(result[0])
+
+    shrunk[key] = result
+    if len(shrunk) > CACHE_SIZE:
+        shrunk.popitem(last=False)
+
+    return result
+
+
+async def shrink_images(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> None:
+    """before_model_callback replacing the request's images with shrunk ones."""
+    if not IMAGE_PREPROCESSING or Image is None:
+        return None
+
+    for content in llm_request.contents:
+        for part in content.parts or []:
+            blob = part.inline_data
+            if not (blob and blob.data and (blob.mime_type or "").startswith("image/")):
+                continue
+
+            try:
+                # The contents are copies of the session's, the original stays there
+                blob.data, blob.mime_type = await shrink_image(blob.data, blob.mime_type)
+            except Exception:
+                logger.exception(
+                    "could not preprocess a %s image, sending it as is", blob.mime_type
+                )
+
+    return None
@@ -0,0 +1,91 @@
+"""
+Bounded key-value tables in a local SQLite file, for the caches that live
+next to the app: the retriever's query memo and the extractor's cache.
+
+Each store is one table keyed on a text column, with text value columns,
+the day an entry was written and how often it was used. The file is opened
+on first use. Past max_entries, the least used and then the oldest entries
+are dropped.
+"""
+
+import sqlite3
+import threading
+from datetime import date
+from typing import Iterator, Optional
+
+
+class LocalStore:
+    def __init__(self, path: str, table: str, key: str, columns: tuple[str, ...], max_entries: int):
+        self.path = path
+        self.table = table
+        self.key = key
+        self.columns = columns
+        self.max_entries = max_entries
+
+        self.connection: Optional[sqlite3.Connection] = None
+        self.lock = threading.Lock()
+
+    def get_conn(self) -> sqlite3.Connection:
+        with self.lock:
+            if self.connection is None:
+                connection = sqlite3.connect(self.path, check_same_thread=False)
+                value_columns = "".join(f"{column} TEXT NOT NULL, " for column in self.columns)
+                connection.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {self.table} (
+                        {self.key} TEXT PRIMARY KEY,
+                        {value_columns}created_on TEXT NOT NULL,
+                        hits INTEGER NOT NULL DEFAULT 0
+                    )
+                """)
+                self.connection = connection
+
+        return self.connection
+
+    def entries(self) -> Iterator[tuple]:
+        """(key, *columns, created_on) of every entry."""
+        return self.get_conn().execute(
+            f"SELECT {self.key}, {', '.join(self.columns)}, created_on FROM {self.table}"
+        )
+
+    def find(self, key: str) -> Optional[tuple]:
+        """The columns of the entry under `key`, counted as a hit, or None."""
+        row = self.get_conn().execute(
+            f"SELECT {', '.join(self.columns)} FROM {self.table} WHERE {self.key} = ?",
+            (key,),
+        ).fetchone()
+        if row is not None:
+            self.hit(key)
+
+        return row
+
+    def hit(self, key: str):
+        with self.get_conn() as conn:
+            conn.execute(f"UPDATE {self.table} SET hits = hits + 1 WHERE {self.key} = ?", (key,))
+
+    def put(self, key: str, *values: str):
+        """Write the entry under `key`, values in `columns` order, dated today."""
+        assignments = ", ".join(f"{column} = excluded.{column}" for column in self.columns)
+        with self.get_conn() as conn:
+            conn.execute(
+                f"""
+                INSERT INTO {self.table} ({self.key}, {', '.join(self.columns)}, created_on)
+                VALUES ({', '.join(['?'] * (len(self.columns) + 2))})
+                ON CONFLICT ({self.key}) DO UPDATE
+                SET {assignments}, created_on = excluded.created_on
+                """,
+                (key, *values, date.today().isoformat()),
+            )
+            conn.execute(
+                f"""
+                DELETE FROM {self.table} WHERE {self.key} NOT IN (
+                    SELECT {self.key} FROM {self.table}
+                    ORDER BY hits DESC, created_on DESC, rowid DESC
+                    LIMIT ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def remove(self, key: str):
+        with self.get_conn() as conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE {self.key} = ?", (key,))
@@ -0,0 +1,137 @@
+"""
+Building blocks for compact agent instructions.
+
+Schemas are described one line per table or field instead of markdown tables
+or a JSON schema, and few-shot examples are picked per question instead of
+sending all of them every time.
+
+Instructions put what never changes first. Provider-side prompt caching
+(Gemini's implicit caching) only reuses an identical leading run of tokens,
+so the date, the examples and anything else that varies per call has to come
+after the static prefix, never inside it.
+"""
+
+import re
+import types
+from dataclasses import dataclass
+from typing import Annotated, Callable, Mapping, Optional, Sequence, Union, get_args, get_origin
+
+from google.adk.agents.readonly_context import ReadonlyContext
+from pydantic import BaseModel
+
+# "(e.g., Dining, Groceries)" or a trailing "e.g., USD, EUR" in a field description
+EXAMPLE_VALUES = re.compile(r"\(e\.g\.,?\s*([^)]*)\)|e\.g\.,?\s*(.*)$")
+
+# information_schema data types, spelled the way a query would write them.
+# Text is the common case and goes unsaid, prompts have to mention that.
+SHORT_TYPES = {
+    "text": "",
+    "character varying": "",
+    "time without time zone": "time",
+    "timestamp without time zone": "timestamp",
+    "timestamp with time zone": "timestamptz",
+    "double precision": "float",
+}
+
+
+@dataclass(frozen=True)
+class Example:
+    question: str
+    answer: str
+
+
+def user_question(context: ReadonlyContext) -> Optional[str]:
+    """Text of the user message that started the invocation."""
+    content = context.user_content
+    if content is None or not content.parts:
+        return None
+
+    return "\n".join(part.text for part in content.parts if part.text) or None
+
+
+def example_values(model: Optional[type[BaseModel]], field_name: str) -> Optional[str]:
+    field = model.model_fields.get(field_name) if model else None
+    match = field and field.description and EXAMPLE_VALUES.search(field.description)
+    if not match:
+        return None
+
+    return (match.group(1) or match.group(2)).strip()
+
+
+def unwrap_optional(annotation):
+    """X out of Optional[X] and Annotated[X, ...], anything else as is."""
+    args = get_args(annotation)
+    if get_origin(annotation) in (Union, types.UnionType) and type(None) in args:
+        return unwrap_optional(next(arg for arg in args if arg is not type(None)))
+    if get_origin(annotation) is Annotated:
+        return args[0]
+
+    return annotation
+
+
+def describe_model(model: type[BaseModel], indent: str = "") -> str:
+    """One line per field: name, type, whether it is optional and its description."""
+    lines = []
+    for name, field in model.model_fields.items():
+        annotation = unwrap_optional(field.annotation)
+        optional = ", optional" if not field.is_required() else ""
+        description = f": {field.description}" if field.description else ""
+
+        (item,) = get_args(annotation) or (None,)
+        if get_origin(annotation) is list and isinstance(item, type) and issubclass(item, BaseModel):
+            lines.append(f"{indent}- {name} (list{optional}), each with:")
+            lines.append(describe_model(item, indent + "  "))
+            continue
+
+        type_name = getattr(annotation, "__name__", str(annotation))
+        lines.append(f"{indent}- {name} ({type_name}{optional}){description}")
+
+    return "\n".join(lines)
+
+
+def describe_tables(
+    catalog: Mapping[str, Mapping[str, str]],
+    models: Mapping[str, type[BaseModel]] = {},
+    notes: Mapping[str, str] = {},
+) -> str:
+    """
+    One line per table of `catalog` (table -> column -> data type, omitted
+    for text), with the example values the table's pydantic model documents
+    for a column and a line of `notes` under the table. Tables are sorted so the text only
+    changes when the schema does.
+    """
+    lines = []
+    for table in sorted(catalog):
+        columns = []
+        for column, data_type in catalog[table].items():
+            described = f"{column} {SHORT_TYPES.get(data_type, data_type)}".strip()
+            values = example_values(models.get(table), column)
+            if values:
+                described += f" (e.g. {values})"
+            columns.append(described)
+
+        lines.append(f"{table}({', '.join(columns)})")
+        if table in notes:
+            lines.append(f"  {notes[table]}")
+
+    return "\n".join(lines)
+
+
+def select_examples(
+    question: str,
+    examples: Sequence[Example],
+    count: int,
+    tokenize: Callable[[str], frozenset[str]],
+) -> list[Example]:
+    """
+    The `count` examples sharing the most words with `question`. They keep
+    their order in `examples`, so the same picks always render the same text.
+    """
+    words = tokenize(question)
+    ranked = sorted(
+        range(len(examples)),
+        key=lambda i: len(words & tokenize(examples[i].question)),
+        reverse=True,
+    )
+
+    return [examples[i] for i in sorted(ranked[:count])]
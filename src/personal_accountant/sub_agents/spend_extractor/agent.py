@@ -1,8 +1,21 @@
+import asyncio
+import os
+from typing import Any, Optional
+
 from google.adk.agents import Agent
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.adk.tools import BaseTool, ToolContext
+from google.genai import types
 
 from personal_accountant import model
+from personal_accountant.image_preprocessing import shrink_images
 from personal_accountant.types.type import SpendingAgentOutput
-from personal_accountant.sub_agents.spend_extractor import prompt
+from personal_accountant.sub_agents.spend_extractor import extraction_cache, prompt
+from personal_accountant.tools.database import EXTRACTED_SPENDING_KEYS, context_user_id
+
+# Documents of one extract_spendings call that are extracted at the same time
+EXTRACTION_CONCURRENCY = int(os.getenv("EXTRACTION_CONCURRENCY", "5"))
 
 spend_extractor_agent = Agent(
     model=model.LIGHT_MODEL,
@@ -11,4 +24,174 @@ spend_extractor_agent = Agent(
     instruction=prompt.SPEND_EXTRACTOR_PROMPT,
     output_schema=SpendingAgentOutput,
     output_key="structured_spending",
+    before_model_callback=shrink_images,
 )
+
+
+def extraction_key(args: dict[str, Any], tool_context: ToolContext) -> Optional[str]:
+    """
+    Cache key of a spend_extractor_agent call for the user of the session:
+    the files the user attached, or the request the calling agent wrote when
+    there are none. The request is the agent's own wording, which differs
+    every time the same photo is sent, so it is left out of file keys.
+    """
+    user_content = tool_context.user_content
+    parts = [
+        part
+        for part in (user_content.parts if user_content else None) or []
+        if part.inline_data or part.file_data
+    ]
+    if not parts:
+        parts = [types.Part(text=str(args.get("request") or ""))]
+
+    return extraction_cache.content_hash(
+        types.Content(role="user", parts=parts), context_user_id(tool_context)
+    )
+
+
+def use_cached_extraction(
+    tool: BaseTool, args: dict[str, Any], tool_context: ToolContext
+) -> Optional[dict]:
+    """
+    before_tool_callback of the agent calling spend_extractor_agent: a
+    document the user already sent gets its earlier extraction back without
+    a model call.
+    """
+    if tool.name != spend_extractor_agent.name:
+        return None
+
+    key = extraction_key(args, tool_context)
+    structured_spending = key and extraction_cache.find_extraction(key)
+    if not structured_spending:
+        return None
+
+    # What the extractor's output_key would have stored for save_spending
+    tool_context.state[spend_extractor_agent.output_key] = structured_spending
+    tool_context.state[EXTRACTED_SPENDING_KEYS] = None
+    return structured_spending
+
+
+def remember_extraction(
+    tool: BaseTool, args: dict[str, Any], tool_context: ToolContext, tool_response: Any
+):
+    """after_tool_callback counterpart of use_cached_extraction."""
+    if tool.name != spend_extractor_agent.name or not isinstance(tool_response, dict):
+        return
+
+    # save_spending saves an unsaved extract_spendings batch before
+    # structured_spending, this receipt is the one to save now
+    tool_context.state[EXTRACTED_SPENDING_KEYS] = None
+
+    key = extraction_key(args, tool_context)
+    if key:
+        extraction_cache.remember_extraction(key, tool_response)
+
+
+def user_documents(
+    documents: list[str], tool_context: ToolContext
+) -> list[types.Content]:
+    """One message per pasted document and per image or file the user attached."""
+    messages = [
+        types.Content(role="user", parts=[types.Part(text=document)])
+        for document in documents
+        if document.strip()
+    ]
+
+    user_content = tool_context.user_content
+    for part in (user_content.parts if user_content else None) or []:
+        if part.inline_data or part.file_data:
+            messages.append(
+                types.Content(
+                    role="user",
+                    parts=[types.Part(text="Extract the spending in this document"), part],
+                )
+            )
+
+    return messages
+
+
+async def extract_document(runner: Runner, message: types.Content, user_id: str) -> dict:
+    """Run spend_extractor_agent on a single document, in a session of its own."""
+    key = extraction_cache.content_hash(message, user_id)
+    structured_spending = key and extraction_cache.find_extraction(key)
+    if structured_spending:
+        return structured_spending
+
+    session = await runner.session_service.create_session(
+        app_name=runner.app_name, user_id="extract_spendings"
+    )
+    last_event = None
+    async for event in runner.run_async(
+        user_id=session.user_id, session_id=session.id, new_message=message
+    ):
+        last_event = event
+
+    text = "\n".join(
+        part.text
+        for part in (last_event and last_event.content and last_event.content.parts) or []
+        if part.text
+    )
+    structured_spending = SpendingAgentOutput.model_validate_json(text).model_dump(
+        exclude_none=True
+    )
+    if key:
+        extraction_cache.remember_extraction(key, structured_spending)
+
+    return structured_spending
+
+
+async def extract_spendings(documents: list[str], tool_context: ToolContext) -> dict:
+    """
+    Use this tool when the user sent more than one receipt, invoice or bill in a single message. It extracts all of them at once, call save_spending afterwards to save them all.
+
+    Args:
+        documents: The text of every pasted document, one entry each and forwarded as is, **DO NOT TRUNCATE OR SUMMARIZE**. Leave it empty for images or files, every attached one is picked up on its own.
+        tool_context: The ADK tool context.
+    """
+    messages = user_documents(documents, tool_context)
+    if not messages:
+        return {"state": "error", "result": "no documents found to extract"}
+
+    runner = Runner(
+        app_name=spend_extractor_agent.name,
+        agent=spend_extractor_agent,
+        session_service=InMemorySessionService(),
+    )
+    semaphore = asyncio.Semaphore(EXTRACTION_CONCURRENCY)
+    user_id = context_user_id(tool_context)
+
+    async def extract(message: types.Content) -> dict:
+        async with semaphore:
+            return await extract_document(runner, message, user_id)
+
+    results = await asyncio.gather(
+        *(extract(message) for message in messages), return_exceptions=True
+    )
+
+    keys, extracted, failed = [], [], []
+    for number, result in enumerate(results, start=1):
+        if isinstance(result, Exception):
+            failed.append(f"document {number}: {result}")
+            continue
+
+        key = f"structured_spending_{number}"
+        tool_context.state[key] = result
+        keys.append(key)
+        extracted.append(
+            {
+                "document": number,
+                "merchant_name": result.get("merchant_name"),
+                "transaction_date": result.get("transaction_date"),
+                "summary_total_amount": result.get("summary_total_amount"),
+                "currency": result.get("currency"),
+            }
+        )
+
+    tool_context.state[EXTRACTED_SPENDING_KEYS] = keys or None
+    # An earlier single receipt left unsaved is not part of this batch
+    tool_context.state[spend_extractor_agent.output_key] = None
+    return {
+        "state": "success" if keys else "error",
+        "extracted": extracted,
+        "failed": failed,
+    }
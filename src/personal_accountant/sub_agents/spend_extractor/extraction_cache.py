@@ -0,0 +1,75 @@
+"""
+Local cache of extracted spendings, keyed on the user and the document they
+sent.
+
+Users resend the same receipt photo or forward the same invoice again. The
+exact same image bytes, or the same text up to case and whitespace, get the
+earlier structured_spending back instead of another spend_extractor_agent
+call. Saving it again is then caught by the database fingerprint. Entries
+are per user, nobody gets an extraction of another user's receipt.
+"""
+
+import hashlib
+import json
+import os
+import re
+from typing import Optional
+
+from google.genai import types
+
+from personal_accountant.local_store import LocalStore
+
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", ".extraction_cache.sqlite3")
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "1000"))
+
+WHITESPACE = re.compile(r"\s+")
+DIGIT = re.compile(r"\d")
+
+store = LocalStore(
+    EXTRACTION_CACHE_PATH,
+    "extraction_cache",
+    key="content_hash",
+    columns=("structured_spending",),
+    max_entries=EXTRACTION_CACHE_MAX_ENTRIES,
+)
+
+
+def content_hash(content: Optional[types.Content], user_id: str) -> Optional[str]:
+    """
+    SHA-256 over `user_id` and every part of `content`: exact bytes for
+    images and other files, text lowercased with its whitespace collapsed.
+    None when `content` holds no document, neither a file nor text with an
+    amount in it, e.g. "yes" or "save it", which must not be cached.
+    """
+    if content is None or not content.parts:
+        return None
+
+    digest = hashlib.sha256(f"user:{user_id}\0".encode())
+    has_document = False
+    for part in content.parts:
+        if part.inline_data and part.inline_data.data:
+            digest.update(f"blob:{part.inline_data.mime_type}:".encode())
+            digest.update(part.inline_data.data)
+            has_document = True
+        elif part.file_data and part.file_data.file_uri:
+            digest.update(f"file:{part.file_data.file_uri}".encode())
+            has_document = True
+        elif part.text and part.text.strip():
+            text = WHITESPACE.sub(" ", part.text.strip().lower())
+            digest.update(f"text:{text}".encode())
+            has_document = has_document or DIGIT.search(text) is not None
+        else:
+            continue
+        digest.update(b"\0")
+
+    return digest.hexdigest() if has_document else None
+
+
+def find_extraction(key: str) -> Optional[dict]:
+    row = store.find(key)
+    return json.loads(row[0]) if row else None
+
+
+def remember_extraction(key: str, structured_spending: dict):
+    """Admit a validated extraction of the document hashed to `key`."""
+    store.put(key, json.dumps(structured_spending))
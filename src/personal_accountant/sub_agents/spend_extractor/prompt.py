@@ -1,9 +1,12 @@
+from personal_accountant.prompt_builder import describe_model
 from personal_accountant.types.type import SpendingAgentOutput
 
+# The full JSON schema already goes to the model as the response schema
+# (output_schema), the prompt only needs what each field means
 SPEND_EXTRACTOR_PROMPT = f"""
 - You are an expert spending or expense extractor. 
 - You need to parse given information about users spending or expenses and save it into database
 - You need to parse from both text or image based data
-- You need to parse spending information following this JSON schema
-{SpendingAgentOutput.model_json_schema()}
+- You need to parse spending information into these fields:
+{describe_model(SpendingAgentOutput)}
 """
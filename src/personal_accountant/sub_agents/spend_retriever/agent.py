@@ -1,50 +1,128 @@
+import os
+from typing import Optional
+
 from google.adk.agents import Agent, LoopAgent, SequentialAgent
-from google.adk.tools.tool_context import ToolContext
+from google.adk.agents.callback_context import CallbackContext
+from google.genai import types
 
 from personal_accountant import model
-from personal_accountant.sub_agents.spend_retriever import prompt
-from personal_accountant.tools.database import query_database
+from personal_accountant.prompt_builder import user_question
+from personal_accountant.sub_agents.spend_retriever import intents, prompt, query_memo
+from personal_accountant.sub_agents.spend_retriever.executor import QueryExecutorAgent
+from personal_accountant.tools.database import context_user_id, query_template, render_query
+
+FAST_PATH_ENABLED = os.getenv("RETRIEVER_FAST_PATH", "true").lower() == "true"
+
+
+def reset_retrieval_state(callback_context: CallbackContext):
+    """Clear the previous question's results so they cannot leak into this one."""
+    for key in (
+        "sql_query_source",
+        "memo_question",
+        "sql_status",
+        "sql_error",
+        "sql_output",
+        "sql_output_total_rows",
+        "sql_output_truncated",
+    ):
+        callback_context.state[key] = None
+
+
+async def use_fast_path(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    Answer questions the intent rules fully understand with a prepared
+    template, skipping both SQL generation and the executor loop.
+    """
+    if not FAST_PATH_ENABLED:
+        return None
+
+    question = user_question(callback_context)
+    intent = question and intents.parse_question(question)
+    if not intent:
+        return None
+
+    try:
+        res = await query_template(intent.sql, intent.params, context_user_id(callback_context))
+    except Exception:
+        # Let the LLM pipeline deal with whatever went wrong
+        return None
+
+    sql_query = render_query(intent.sql, intent.params)
+    state = callback_context.state
+    state["sql_query"] = sql_query
+    state["sql_query_source"] = "fast_path"
+    state["sql_output"] = res.rows
+    state["sql_output_total_rows"] = res.total_rows
+    state["sql_output_truncated"] = res.truncated
+    state["sql_status"] = "ok" if res.rows else "empty"
+    state["sql_error"] = None
+    return types.Content(role="model", parts=[types.Part(text=sql_query)])
+
+
+def skip_loop_for_fast_path(callback_context: CallbackContext) -> Optional[types.Content]:
+    if callback_context.state.get("sql_query_source") != "fast_path":
+        return None
+
+    return types.Content(role="model", parts=[types.Part(text="data retrieved")])
 
 
-def exit_loop(tool_context: ToolContext):
-    """Call this function ONLY when the critique indicates no further changes are needed, signaling the iterative process should end."""
-    print(f"  [Tool Call] exit_loop triggered by {tool_context.agent_name}")
-    tool_context.actions.escalate = True
-    # Return empty dict as tools should typically return JSON-serializable output
-    return {}
+def use_memoized_query(callback_context: CallbackContext) -> Optional[types.Content]:
+    """Skip the HEAVY_MODEL generation when a close enough question already has working SQL."""
+    question = user_question(callback_context)
+    memo = question and query_memo.find_query(question)
+    if not memo:
+        return None
+
+    memo_question, sql_query = memo
+    callback_context.state["sql_query"] = sql_query
+    callback_context.state["sql_query_source"] = "memo"
+    # query_executor_agent forgets it if the SQL fails
+    callback_context.state["memo_question"] = memo_question
+    return types.Content(role="model", parts=[types.Part(text=sql_query)])
+
+
+def remember_successful_query(callback_context: CallbackContext):
+    state = callback_context.state
+    if state.get("sql_query_source") in ("memo", "fast_path"):
+        return
+    if state.get("sql_status") != "ok":
+        return
+
+    question = user_question(callback_context)
+    if question:
+        query_memo.remember_query(question, state["sql_query"])
 
 
 initial_query_generator_agent = Agent(
     model=model.HEAVY_MODEL,
     name="initial_query_generator_agent",
     description="A initial query generator agent",
-    instruction=prompt.QUERY_GENERATOR_PROMPT,
+    instruction=prompt.query_generator_prompt,
     output_key="sql_query",
+    before_agent_callback=[use_fast_path, use_memoized_query],
+)
+
+query_executor_agent = QueryExecutorAgent(
+    name="query_executor_agent",
+    description="Runs the generated query and classifies its errors",
 )
 
 query_refinement_agent = Agent(
     model=model.HEAVY_MODEL,
     name="query_refinement_agent",
     description="A query refinement agent",
-    instruction=prompt.QUERY_REFINEMENT_PROMPT,
+    instruction=prompt.query_refinement_prompt,
     disallow_transfer_to_parent=True,
     output_key="sql_query",
 )
 
-query_executor_agent = Agent(
-    model=model.LIGHT_MODEL,
-    name="query_executor_agent",
-    description="A query executor agent",
-    instruction=prompt.QUERY_EXECUTOR_PROMPT,
-    disallow_transfer_to_parent=True,
-    tools=[query_database, exit_loop],
-)
-
 query_loop_agent = LoopAgent(
     name="query_loop_agent",
     description="A query loop agent",
     sub_agents=[query_executor_agent, query_refinement_agent],
     max_iterations=5,
+    before_agent_callback=skip_loop_for_fast_path,
+    after_agent_callback=remember_successful_query,
 )
 
 answer_agent = Agent(
@@ -58,4 +136,5 @@ spend_retriever_agent = SequentialAgent(
     name="spend_retriever_agent",
     description="A spend retriever agent",
     sub_agents=[initial_query_generator_agent, query_loop_agent, answer_agent],
+    before_agent_callback=reset_retrieval_state,
 )
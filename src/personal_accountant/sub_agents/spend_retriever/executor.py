@@ -0,0 +1,124 @@
+"""
+Model-free executor step of query_loop_agent.
+
+It runs the SQL the generator or refinement agent wrote and classifies the
+outcome. The loop only goes on to query_refinement_agent when the failure is
+one a rewrite can fix. A success, an empty result, a timeout or any other
+error ends the loop right away.
+"""
+
+import re
+from typing import AsyncGenerator
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from psycopg import errors
+
+from personal_accountant.sub_agents.spend_retriever import query_memo
+from personal_accountant.tools.database import query_database
+from personal_accountant.tools.sql_guard import QueryRejected
+
+SQL_FENCE = re.compile(r"```(?:sql)?\s*(.*?)```", re.S | re.I)
+
+# Error kinds a better query can fix, each gets its own refinement prompt
+FIXABLE_ERRORS = {
+    "syntax",
+    "multiple_statements",
+    "undefined_column",
+    "undefined_table",
+    "undefined_function",
+    "function_not_allowed",
+    "invalid",
+    "too_expensive",
+}
+
+
+def extract_sql(text: str) -> str:
+    """The query out of a model answer that may wrap it in a markdown fence."""
+    match = SQL_FENCE.search(text)
+    return (match.group(1) if match else text).strip()
+
+
+def classify_error(error: Exception) -> str:
+    if isinstance(error, QueryRejected):
+        return error.kind
+    if isinstance(error, errors.SyntaxError):
+        return "syntax"
+    if isinstance(error, errors.UndefinedColumn):
+        return "undefined_column"
+    if isinstance(error, errors.UndefinedTable):
+        return "undefined_table"
+    if isinstance(error, errors.UndefinedFunction):
+        return "undefined_function"
+    if isinstance(
+        error,
+        (
+            errors.GroupingError,
+            errors.AmbiguousColumn,
+            errors.DatatypeMismatch,
+            errors.DataError,
+        ),
+    ):
+        return "invalid"
+    if isinstance(error, errors.QueryCanceled):
+        return "timeout"
+
+    return "error"
+
+
+def describe_error(error: Exception) -> str:
+    """
+    The server's own message, without the context lines that quote our
+    DECLARE ... CURSOR wrapper instead of the query the model wrote.
+    """
+    diag = getattr(error, "diag", None)
+    message = (diag and diag.message_primary) or str(error)
+    if diag and diag.message_hint:
+        message += f" ({diag.message_hint})"
+
+    return f"{type(error).__name__}: {message}"
+
+
+class QueryExecutorAgent(BaseAgent):
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        sql_query = extract_sql(ctx.session.state.get("sql_query") or "")
+        state_delta = {"sql_query": sql_query}
+
+        try:
+            res = await query_database(sql_query, ctx.user_id)
+        except Exception as e:
+            sql_status = classify_error(e)
+            state_delta.update(
+                sql_status=sql_status,
+                sql_error=describe_error(e),
+                sql_output=None,
+                sql_output_total_rows=None,
+                sql_output_truncated=None,
+            )
+            escalate = sql_status not in FIXABLE_ERRORS
+
+            memo_question = ctx.session.state.get("memo_question")
+            if memo_question:
+                # Reused SQL that fails is not reused again, and a rewrite
+                # that works is memoized as the model's own query would be
+                query_memo.forget_query(memo_question)
+                state_delta.update(memo_question=None, sql_query_source=None)
+        else:
+            state_delta.update(
+                sql_status="ok" if res.rows else "empty",
+                sql_error=None,
+                sql_output=res.rows,
+                sql_output_total_rows=res.total_rows,
+                sql_output_truncated=res.truncated,
+            )
+            escalate = True
+
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta=state_delta, escalate=escalate),
+        )
@@ -0,0 +1,234 @@
+"""
+Rule based fast path for the spending questions the query generator examples
+already cover word for word ("total spent this month", "spend by category
+last week", "top 5 transactions").
+
+A question only matches when every word in it is accounted for by a period
+phrase or by the intent's own vocabulary. Anything with an extra filter in it
+("... on coffee", "... at SuperMart") falls through to the LLM pipeline, so
+the fast path never answers a narrower question than the one asked.
+"""
+
+import re
+from calendar import monthrange
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Optional
+
+ALL_TIME = (date(1900, 1, 1), date(9999, 12, 31))
+
+MONTHS = {
+    name: number
+    for number, names in enumerate(
+        [
+            ("january", "jan", "januari"),
+            ("february", "feb", "februari"),
+            ("march", "mar", "maret"),
+            ("april", "apr"),
+            ("may", "mei"),
+            ("june", "jun", "juni"),
+            ("july", "jul", "juli"),
+            ("august", "aug", "agustus"),
+            ("september", "sep", "sept"),
+            ("october", "oct", "oktober"),
+            ("november", "nov", "nopember"),
+            ("december", "dec", "desember"),
+        ],
+        start=1,
+    )
+    for name in names
+}
+
+# Words that carry no filter in any of the intents below
+FILLER_WORDS = {
+    "how", "much", "what", "whats", "what's", "is", "are", "was", "were", "did",
+    "do", "does", "have", "has", "i", "my", "me", "the", "a", "an", "in", "on",
+    "for", "of", "so", "far", "please", "show", "tell", "give", "list", "can",
+    "you", "overall", "altogether", "money", "spend", "spent", "spending",
+    "spendings", "expense", "expenses", "pay", "paid", "cost", "total", "sum",
+    "amount", "all", "time", "ever", "during", "period", "up", "to", "now",
+    "until", "by", "per", "each", "every", "with", "and", "at", "from", "?",
+}
+
+WORD = re.compile(r"[a-z0-9']+")
+
+# Most rows a "top N" intent answers with, larger N go to the LLM pipeline,
+# which reports when a result is cut short
+MAX_LIMIT = 100
+
+
+@dataclass
+class Intent:
+    name: str
+    sql: str
+    params: dict
+    start: date
+    end: date
+
+
+def month_range(year: int, month: int) -> tuple[date, date]:
+    return date(year, month, 1), date(year, month, monthrange(year, month)[1])
+
+
+def resolve_period(
+    question: str, today: date
+) -> Optional[tuple[tuple[date, date], str]]:
+    """
+    Date range of the first relative period phrase in `question`, together
+    with the question with that phrase removed.
+    """
+    week_start = today - timedelta(days=today.weekday())
+
+    periods = [
+        (r"\b(today|hari ini)\b", lambda m: (today, today)),
+        (r"\b(yesterday|kemarin)\b", lambda m: (today - timedelta(days=1),) * 2),
+        (r"\b(this week|minggu ini)\b", lambda m: (week_start, week_start + timedelta(days=6))),
+        (
+            r"\b(last week|minggu lalu)\b",
+            lambda m: (week_start - timedelta(days=7), week_start - timedelta(days=1)),
+        ),
+        (r"\b(this month|bulan ini)\b", lambda m: month_range(today.year, today.month)),
+        (
+            r"\b(last month|bulan lalu)\b",
+            lambda m: month_range(
+                today.year - (today.month == 1), 12 if today.month == 1 else today.month - 1
+            ),
+        ),
+        (r"\b(this year|tahun ini)\b", lambda m: (date(today.year, 1, 1), date(today.year, 12, 31))),
+        (
+            r"\b(last year|tahun lalu)\b",
+            lambda m: (date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)),
+        ),
+        (
+            r"\b(?:last|past) (\d{1,3}) days\b",
+            lambda m: (today - timedelta(days=int(m.group(1)) - 1), today),
+        ),
+        (
+            r"\b(?:in|during|for|of) (\d{4})\b",
+            lambda m: (date(int(m.group(1)), 1, 1), date(int(m.group(1)), 12, 31)),
+        ),
+        (
+            r"\b(?:in|during|for|of) (" + "|".join(MONTHS) + r")(?: (\d{4}))?\b",
+            lambda m: month_range(
+                int(m.group(2))
+                if m.group(2)
+                # A bare month name means its latest occurrence
+                else today.year - (MONTHS[m.group(1)] > today.month),
+                MONTHS[m.group(1)],
+            ),
+        ),
+    ]
+
+    for pattern, resolve in periods:
+        match = re.search(pattern, question)
+        if match:
+            remainder = question[: match.start()] + " " + question[match.end():]
+            return resolve(match), remainder
+
+    return None
+
+
+TOTAL_SQL = """
+SELECT currency, SUM(total_amount) AS total_amount, SUM(transactions) AS transactions
+FROM daily_category_spendings
+WHERE spending_date >= %(start)s AND spending_date <= %(end)s
+GROUP BY currency
+ORDER BY total_amount DESC;
+"""
+
+BY_CATEGORY_SQL = """
+SELECT transaction_category, currency, SUM(total_amount) AS total_amount, SUM(transactions) AS transactions
+FROM daily_category_spendings
+WHERE spending_date >= %(start)s AND spending_date <= %(end)s
+GROUP BY transaction_category, currency
+ORDER BY total_amount DESC;
+"""
+
+TOP_MERCHANTS_SQL = """
+SELECT merchant_name, currency, SUM(summary_total_amount) AS total_amount, COUNT(*) AS transactions
+FROM spendings
+WHERE transaction_date >= %(start)s AND transaction_date <= %(end)s
+GROUP BY merchant_name, currency
+ORDER BY total_amount DESC
+LIMIT %(limit)s;
+"""
+
+TOP_TRANSACTIONS_SQL = """
+SELECT transaction_date, merchant_name, transaction_category, currency, summary_total_amount
+FROM spendings
+WHERE transaction_date >= %(start)s AND transaction_date <= %(end)s
+ORDER BY summary_total_amount DESC
+LIMIT %(limit)s;
+"""
+
+# (name, sql, extra vocabulary, words that must appear, needs an explicit period)
+INTENTS = [
+    (
+        "top_transactions",
+        TOP_TRANSACTIONS_SQL,
+        {"top", "largest", "biggest", "most", "expensive", "highest", "transaction",
+         "transactions", "purchase", "purchases", "receipts"},
+        {"top", "largest", "biggest", "expensive", "highest"},
+        False,
+    ),
+    (
+        "top_merchants",
+        TOP_MERCHANTS_SQL,
+        {"top", "most", "merchant", "merchants", "store", "stores", "shop", "shops",
+         "where", "spend", "biggest", "largest"},
+        {"merchant", "merchants", "store", "stores", "shop", "shops"},
+        False,
+    ),
+    (
+        "spend_by_category",
+        BY_CATEGORY_SQL,
+        {"category", "categories", "breakdown", "split", "grouped", "group"},
+        {"category", "categories"},
+        False,
+    ),
+    (
+        "total_spend",
+        TOTAL_SQL,
+        set(),
+        {"spend", "spent", "spending", "expenses", "total", "paid"},
+        True,
+    ),
+]
+
+
+def parse_question(question: str, today: Optional[date] = None) -> Optional[Intent]:
+    """The fast path intent `question` asks for, or None to use the LLM pipeline."""
+    today = today or date.today()
+    text = question.lower().strip()
+
+    period = resolve_period(text, today)
+    (start, end), text = period if period else (ALL_TIME, text)
+
+    words = WORD.findall(text)
+    numbers = [int(word) for word in words if word.isdigit()]
+    words = {word for word in words if not word.isdigit()}
+
+    for name, query, vocabulary, required, needs_period in INTENTS:
+        if needs_period and period is None:
+            continue
+        if not words & required or not words <= FILLER_WORDS | vocabulary:
+            continue
+
+        # Only the "top N" intents take a number, anything else is a filter we
+        # do not understand
+        if len(numbers) > (1 if name.startswith("top_") else 0):
+            continue
+        limit = numbers[0] if numbers else (5 if name == "top_transactions" else 10)
+        if not 0 < limit <= MAX_LIMIT:
+            return None
+
+        return Intent(
+            name=name,
+            sql=query,
+            params={"start": start, "end": end, "limit": limit},
+            start=start,
+            end=end,
+        )
+
+    return None
+
@@ -1,160 +1,269 @@
 from datetime import date
 
+from google.adk.agents.readonly_context import ReadonlyContext
 
-CURRENT_DATE = date.today().strftime("%Y-%m-%d")
-
-QUERY_GENERATOR_PROMPT = f"""
-You are an AI assistant with read-only access to a PostgreSQL database containing personal spending and transaction data. Your primary goal is to help users understand their spending habits by constructing SQL queries based on their natural language questions. You MUST only generate `SELECT` SQL queries. You CANNOT perform any write operations (INSERT, UPDATE, DELETE, DROP, etc.).
-
-**Current Date for Context:** When interpreting relative date queries (e.g., "this month", "last week"), the current date is **{CURRENT_DATE}**. You will need to calculate date ranges based on this.
-
-**Database Schema:**
-
-You have access to two tables: `spendings` and `spending_items`.
-
-**1. Table: `spendings`**
-This table contains overall information for each spending transaction.
-
-| Column Name               | Data Type      | Description                                                                                                | Notes / Example                                  |
-|---------------------------|----------------|------------------------------------------------------------------------------------------------------------|--------------------------------------------------|
-| `id`                      | SERIAL         | Unique identifier for the spending record (Primary Key).                                                   | Auto-generated integer.                          |
-| `type`                    | TEXT           | Type of document data was extracted from.                                                                  | 'receipt', 'invoice', 'bank statement'           |
-| `currency`                | TEXT           | Currency of the transaction.                                                                               | 'USD', 'EUR', 'IDR'                              |
-| `transaction_date`        | DATE           | Date of the transaction.                                                                                   | Format: 'YYYY-MM-DD'                             |
-| `transaction_time`        | TIME           | Time of the transaction (optional).                                                                        | Format: 'HH:MM:SS'                               |
-| `transaction_category`    | TEXT           | Overall category for the transaction (optional).                                                           | 'Dining', 'Groceries', 'Travel', 'Utilities'     |
-| `merchant_name`           | TEXT           | Name of the merchant or vendor.                                                                            | 'SuperMart', 'Amazon', 'Local Coffee Shop'       |
-| `merchant_address`        | TEXT           | Physical address of the merchant (optional).                                                               | '123 Main St, Anytown'                           |
-| `merchant_phone`          | TEXT           | Phone number of the merchant (optional).                                                                   | '555-1234'                                       |
-| `merchant_website`        | TEXT           | Website URL of the merchant (optional).                                                                    | 'http://supermart.example.com'                   |
-| `merchant_tax_id`         | TEXT           | Tax identification number of the merchant (optional).                                                      | 'AB123456789'                                    |
-| `summary_subtotal`        | NUMERIC(19, 4) | Total cost before discounts, taxes, or shipping.                                                           | 75.50                                            |
-| `summary_discount_amount` | NUMERIC(19, 4) | Total amount of discounts applied (optional).                                                              | 5.00                                             |
-| `summary_tax_amount`      | NUMERIC(19, 4) | Total amount of tax applied (optional).                                                                    | 6.04                                             |
-| `summary_shipping_amount` | NUMERIC(19, 4) | Cost of shipping or delivery (optional).                                                                   | 0.00                                             |
-| `summary_total_amount`    | NUMERIC(19, 4) | Final total amount of the transaction.                                                                     | 76.54                                            |
-| `summary_amount_paid`     | NUMERIC(19, 4) | Actual amount paid by the customer (optional).                                                             | 80.00                                            |
-| `summary_change_due`      | NUMERIC(19, 4) | Amount of change returned to the customer (optional).                                                      | 3.46                                             |
-| `payment_method`          | TEXT           | Method used for payment (optional).                                                                        | 'Credit Card', 'Cash', 'Debit Card'              |
-| `payment_card_type`       | TEXT           | Type of payment card used (optional).                                                                      | 'Visa', 'Mastercard', 'Amex'                     |
-| `payment_transaction_id`  | TEXT           | Unique identifier for the payment transaction (optional).                                                  | 'TXN789123XYZ'                                   |
-| `notes`                   | TEXT           | Any additional notes or comments (optional).                                                               | 'Weekly grocery shopping'                        |
-
-**2. Table: `spending_items`**
-This table contains details about individual items within a spending transaction. It links to the `spendings` table via `spending_id`.
-
-| Column Name   | Data Type      | Description                                                                | Notes / Example        |
-|---------------|----------------|----------------------------------------------------------------------------|------------------------|
-| `id`          | SERIAL         | Unique identifier for the spending item (Primary Key).                     | Auto-generated integer.|
-| `spending_id` | INTEGER        | Foreign key referencing `spendings.id`. Links item to a spending record. | Links to `spendings`.  |
-| `description` | TEXT           | Description of the individual item or service.                             | 'Organic Apples', 'Milk' |
-| `quantity`    | NUMERIC(19, 4) | Quantity of the item purchased.                                            | 2.5, 1.0               |
-| `unit_price`  | NUMERIC(19, 4) | Price per unit of the item.                                                | 1.50, 3.99             |
-| `total`       | NUMERIC(19, 4) | Total cost for this line item (`quantity` * `unit_price`).                 | 3.75, 3.99             |
-
-
-**How to Construct Queries:**
-
-1.  **Understand the User's Intent:** Carefully analyze the user's question to determine what information they are seeking.
-2.  **Select Appropriate Columns:** Choose columns that directly answer the question. Use `*` sparingly; prefer specific columns.
-3.  **Use `WHERE` Clauses for Filtering:** Apply conditions based on dates, categories, merchants, amounts, etc. For column that indicates naming, like merchants, description, use case insensitive filter, for example ILIKE
-4.  **Date Handling:**
-    * For "this month": Calculate the first and last day of the current month based on provided current date.
-        Example: If current date is '2023-10-26', "this month" is from '2023-10-01' to '2023-10-31'.
-    * For "last month": Calculate the first and last day of the previous month.
-    * For "this year": From 'YYYY-01-01' to 'YYYY-12-31' of the current year.
-    * For "today": `transaction_date = 'current date'`.
-    * For "yesterday": `transaction_date = 'current date' - INTERVAL '1 day'`.
-    * Use `transaction_date >= 'YYYY-MM-DD'` and `transaction_date <= 'YYYY-MM-DD'` for ranges.
-5.  **Joining Tables:** If the question involves item details (like "what items did I buy at SuperMart?"), you MUST `JOIN` `spendings` and `spending_items` tables on `spendings.id = spending_items.spending_id`.
-6.  **Aggregations:** Use `SUM()`, `AVG()`, `COUNT()`, `MAX()`, `MIN()` with `GROUP BY` for summary questions (e.g., "total spent on groceries this month").
-7.  **Ordering:** Use `ORDER BY` to sort results (e.g., "show my most expensive transactions").
-8.  **Clarity:** If a user's query is ambiguous, you can ask for clarification, but try your best to infer or provide the most likely interpretation.
-9. **Single Query**: You can only output a single query, if possible use JOIN to retrieve multiples data from multiples column
-
-**Examples of User Questions and Corresponding SQL Queries:**
-
-* **User:** "How much did I spend in total this month?"
-    **SQL (assuming current date is '2023-10-26'):**
-    ```sql
-    SELECT SUM(summary_total_amount)
-    FROM spendings
-    WHERE transaction_date >= '2023-10-01' AND transaction_date <= '2023-10-31';
-    ```
-
-* **User:** "Show me all my grocery expenses from last week."
-    **SQL (assuming current date is '2023-10-26', so last week was Mon 16th to Sun 22nd):**
-    ```sql
-    SELECT transaction_date, merchant_name, summary_total_amount
-    FROM spendings
-    WHERE transaction_category = 'Groceries'
-      AND transaction_date >= '2023-10-16' AND transaction_date <= '2023-10-22'
-    ORDER BY transaction_date;
-    ```
-    *(Note: You'll need to implement logic to accurately determine "last week's" start and end dates based on current date).*
-
-* **User:** "What were my top 5 largest transactions ever?"
-    **SQL:**
-    ```sql
-    SELECT transaction_date, merchant_name, summary_total_amount
-    FROM spendings
-    ORDER BY summary_total_amount DESC
-    LIMIT 5;
-    ```
-
-* **User:** "List all items I bought at 'SuperMart' on October 15th, 2023."
-    **SQL:**
-    ```sql
-    SELECT s.transaction_date, si.description, si.quantity, si.unit_price, si.total
-    FROM spendings s
-    JOIN spending_items si ON s.id = si.spending_id
-    WHERE s.merchant_name = 'SuperMart'
-      AND s.transaction_date = '2023-10-15';
-    ```
-
-* **User:** "What are the different payment methods I've used this year?"
-    **SQL (assuming current date is '2023-10-26'):**
-    ```sql
-    SELECT DISTINCT payment_method
-    FROM spendings
-    WHERE transaction_date >= '2023-01-01' AND transaction_date <= '2023-12-31'
-      AND payment_method IS NOT NULL;
-    ```
-
-* **User:** "Average spending per transaction in the 'Dining' category this month?"
-    **SQL (assuming current date is '2023-10-26'):**
-    ```sql
-    SELECT AVG(summary_total_amount)
-    FROM spendings
-    WHERE transaction_category = 'Dining'
-      AND transaction_date >= '2023-10-01' AND transaction_date <= '2023-10-31';
-    ``
-"""
+from personal_accountant.prompt_builder import (
+    Example,
+    describe_tables,
+    select_examples,
+    user_question,
+)
+from personal_accountant.sub_agents.spend_retriever import query_memo
+from personal_accountant.tools.database import get_catalog
+from personal_accountant.tools.fx_rates import BASE_CURRENCY
+from personal_accountant.types.type import Spending, SpendingItem
+
+# The static prefix: it only changes with the schema, so consecutive calls
+# share it and it can be served from the provider's prompt cache. The date
+# and the examples picked for the question follow it.
+QUERY_GENERATOR_PROMPT = """
+You write a single read-only PostgreSQL query answering the user's question about their personal spending. Answer with the SQL query only.
 
-QUERY_REFINEMENT_PROMPT = f"""
-{QUERY_GENERATOR_PROMPT}
+Tables, columns are text unless another type is given:
+{schema}
 
-You previously executing query:
-{{sql_query}}
+Rules:
+1. Only `SELECT`. Never write or change data (INSERT, UPDATE, DELETE, DROP, ...).
+2. Select the columns that answer the question, avoid `*`.
+3. To find spendings by merchant or by what was bought ("coffee", "Starbucks", "kopi"), read `search_spending('<words>')` instead of filtering with ILIKE. It also matches other word forms, English and Indonesian, and misspelled merchants. A spending whose merchant matches is one row (item_id NULL), otherwise each matching item is a row; SUM(amount) or SUM(base_amount) over it counts every spending once. JOIN `spendings` on `spendings.id = search_spending.spending_id` for dates, currency and other columns.
+4. Compute relative dates ("this month", "last week", "yesterday") from the current date given below; weeks start on Monday.
+5. For item details, JOIN `spending_items` on `spendings.id = spending_items.spending_id`.
+6. Summaries use SUM(), AVG(), COUNT(), MAX() or MIN() with GROUP BY; rankings use ORDER BY.
+7. Rollups first: for totals, counts and breakdowns at their grain, read the rollup tables and sum `total_amount` and `transactions` over them. Use `monthly_merchant_spendings` for whole months only. Anything else (other date ranges per merchant, payment methods, items, single transactions) comes from `spendings`.
+8. Totals across currencies: SUM(`spendings.base_total_amount`) is one total in {base_currency}, never add up amounts of different currencies. Also return COUNT(*) - COUNT(base_total_amount) AS unconverted, the spendings it leaves out.
+9. Only the first few hundred rows of a result are returned. Prefer aggregates, and add LIMIT when listing rows.
+10. One query only; combine data with JOINs, subqueries or CTEs.
+11. If the question is ambiguous, go with the most likely interpretation.
+"""
 
-and the query errored with message: 
-{{sql_error}}
+QUERY_GENERATOR_SUFFIX = """
+The current date is {current_date}.
 
-You need to understand the error and generate new SQL to answer user question
+Examples:
+{examples}
 """
 
-QUERY_EXECUTOR_PROMPT = """
-- You are an AI assistant with read-only access to a PostgreSQL database containing personal spending and transaction data. 
-- You need to first call query_database tool by passing the raw query, without non-SQL-related string from following text: {{sql_query}}
-- **IF** the query_database invocation is success, you need to call exit_loop tool
-- **ELSE** just output empty text
+TABLE_NOTES = {
+    "spendings": f"One row per transaction. Amounts are in the row's currency, except base_total_amount: summary_total_amount in {BASE_CURRENCY}, NULL when no exchange rate was known.",
+    "spending_items": "Line items of a spending, spending_id -> spendings.id.",
+    "daily_category_spendings": "Rollup of spendings per day, category and currency, always up to date: total_amount = SUM(summary_total_amount), transactions = COUNT(*). transaction_category is NULL when uncategorized.",
+    "monthly_merchant_spendings": "Rollup of spendings per month, merchant and currency, always up to date. spending_month is the first day of the month.",
+}
+
+TABLE_MODELS = {"spendings": Spending, "spending_items": SpendingItem}
+
+# Used when the catalog cannot be loaded, the executor reports the database
+# error itself
+COMPACT_SCHEMA = """
+spendings(id, type, currency, transaction_date DATE, transaction_time TIME, transaction_category, merchant_name, merchant_address, merchant_phone, merchant_website, merchant_tax_id, summary_subtotal, summary_discount_amount, summary_tax_amount, summary_shipping_amount, summary_total_amount, summary_amount_paid, summary_change_due, payment_method, payment_card_type, payment_transaction_id, notes, base_total_amount)
+spending_items(id, spending_id -> spendings.id, description, quantity, unit_price, total)
+daily_category_spendings(spending_date, transaction_category, currency, total_amount, transactions)
+monthly_merchant_spendings(spending_month DATE first day of month, merchant_name, currency, total_amount, transactions)
+""".strip()
+
+# 0007_add_spending_search's function, listed with the tables since the
+# catalog only knows about those
+SEARCH_FUNCTION = "search_spending(terms) -> (spending_id, item_id, matched, amount NUMERIC, base_amount NUMERIC, rank REAL), best first"
+
+EXAMPLES_PER_QUESTION = 3
+
+EXAMPLES = [
+    Example(
+        "How much did I spend in total this month?",
+        """
+SELECT currency, SUM(total_amount) AS total_amount
+FROM daily_category_spendings
+WHERE spending_date >= date_trunc('month', CURRENT_DATE)
+GROUP BY currency;
+""",
+    ),
+    Example(
+        "Show me all my grocery expenses from last week",
+        """
+SELECT transaction_date, merchant_name, currency, summary_total_amount
+FROM spendings
+WHERE transaction_category = 'Groceries'
+  AND transaction_date >= date_trunc('week', CURRENT_DATE) - INTERVAL '7 days'
+  AND transaction_date < date_trunc('week', CURRENT_DATE)
+ORDER BY transaction_date
+LIMIT 100;
+""",
+    ),
+    Example(
+        "How much did I spend per category last month?",
+        """
+SELECT transaction_category, currency, SUM(total_amount) AS total_amount, SUM(transactions) AS transactions
+FROM daily_category_spendings
+WHERE spending_date >= date_trunc('month', CURRENT_DATE) - INTERVAL '1 month'
+  AND spending_date < date_trunc('month', CURRENT_DATE)
+GROUP BY transaction_category, currency
+ORDER BY total_amount DESC;
+""",
+    ),
+    Example(
+        "Average spending per transaction on dining this month?",
+        """
+SELECT currency, SUM(total_amount) / SUM(transactions) AS average_amount
+FROM daily_category_spendings
+WHERE transaction_category = 'Dining'
+  AND spending_date >= date_trunc('month', CURRENT_DATE)
+GROUP BY currency;
+""",
+    ),
+    Example(
+        "How much did I spend this year in all currencies combined?",
+        f"""
+SELECT '{BASE_CURRENCY}' AS currency, SUM(base_total_amount) AS total_amount,
+       COUNT(*) - COUNT(base_total_amount) AS unconverted
+FROM spendings
+WHERE transaction_date >= date_trunc('year', CURRENT_DATE);
+""",
+    ),
+    Example(
+        "Which merchants did I spend the most at this year?",
+        """
+SELECT merchant_name, currency, SUM(total_amount) AS total_amount
+FROM monthly_merchant_spendings
+WHERE spending_month >= date_trunc('year', CURRENT_DATE)
+GROUP BY merchant_name, currency
+ORDER BY total_amount DESC
+LIMIT 10;
+""",
+    ),
+    Example(
+        "What were my 5 largest transactions ever?",
+        """
+SELECT transaction_date, merchant_name, currency, summary_total_amount
+FROM spendings
+ORDER BY summary_total_amount DESC
+LIMIT 5;
+""",
+    ),
+    Example(
+        "List the items I bought at SuperMart on October 15th, 2023",
+        """
+SELECT s.transaction_date, si.description, si.quantity, si.unit_price, si.total
+FROM spendings s
+JOIN spending_items si ON s.id = si.spending_id
+JOIN search_spending('SuperMart') m ON m.spending_id = s.id AND m.item_id IS NULL
+WHERE s.transaction_date = '2023-10-15';
+""",
+    ),
+    Example(
+        "How much have I spent on coffee this month?",
+        """
+SELECT SUM(m.base_amount) AS total_amount,
+       COUNT(*) - COUNT(m.base_amount) AS unconverted
+FROM search_spending('coffee') m
+JOIN spendings s ON s.id = m.spending_id
+WHERE s.transaction_date >= date_trunc('month', CURRENT_DATE);
+""",
+    ),
+    Example(
+        "What payment methods have I used this year?",
+        """
+SELECT DISTINCT payment_method
+FROM spendings
+WHERE transaction_date >= date_trunc('year', CURRENT_DATE)
+  AND payment_method IS NOT NULL;
+""",
+    ),
+]
+
+# (catalog they were rendered from, with notes, without), redone when
+# migrate() reloads the catalog
+rendered_schemas: tuple[dict, str, str] | None = None
+
+
+async def table_schema(annotated: bool = True) -> str:
+    """
+    The live schema, annotated with example values and table notes for
+    writing a query, bare for fixing one.
+    """
+    global rendered_schemas
+
+    try:
+        catalog = await get_catalog()
+    except Exception:
+        return f"{COMPACT_SCHEMA}\n{SEARCH_FUNCTION}"
+
+    if rendered_schemas is None or rendered_schemas[0] is not catalog:
+        rendered_schemas = (
+            catalog,
+            describe_tables(catalog, models=TABLE_MODELS, notes=TABLE_NOTES) + f"\n{SEARCH_FUNCTION}",
+            describe_tables(catalog) + f"\n{SEARCH_FUNCTION}",
+        )
+
+    return rendered_schemas[1] if annotated else rendered_schemas[2]
 
+
+def render_examples(examples: list[Example]) -> str:
+    return "\n".join(
+        f"Q: {example.question}\n```sql{example.answer}```" for example in examples
+    )
+
+
+async def query_generator_prompt(context: ReadonlyContext) -> str:
+    examples = select_examples(
+        user_question(context) or "",
+        EXAMPLES,
+        EXAMPLES_PER_QUESTION,
+        query_memo.question_tokens,
+    )
+
+    return QUERY_GENERATOR_PROMPT.format(
+        schema=await table_schema(), base_currency=BASE_CURRENCY
+    ) + QUERY_GENERATOR_SUFFIX.format(
+        current_date=date.today().isoformat(),
+        examples=render_examples(examples),
+    )
+
+
+ERROR_HINTS = {
+    "syntax": "The query has a syntax error. Fix only the syntax and keep what the query asks for.",
+    "undefined_column": "The query uses a column that does not exist. Use only the columns listed in the schema.",
+    "undefined_table": "The query uses a table that does not exist. Use only the tables listed in the schema.",
+    "undefined_function": "A function or operator does not exist for these argument types. Cast the arguments or use a PostgreSQL function that does exist.",
+    "function_not_allowed": "The query calls a function that is not allowed. Use only aggregates, window functions, date, text and math functions, and search_spending().",
+    "multiple_statements": "Only one statement can be run. Combine what is needed into a single SELECT, e.g. with JOINs, subqueries or CTEs.",
+    "too_expensive": "The query would process too much data. Narrow the date range, read the rollup tables, or aggregate instead of listing rows.",
+    "invalid": "The query is well formed but invalid, e.g. a selected column missing from GROUP BY, an ambiguous column or a value of the wrong type. Fix that problem.",
+}
+
+QUERY_REFINEMENT_PROMPT = """
+You fix PostgreSQL `SELECT` queries over personal spending data.
+
+Tables, columns are text unless another type is given:
+{schema}
+
+The current date is {current_date}. This query, written for the user's question above:
+{sql_query}
+
+failed with:
+{sql_error}
+
+{hint}
+Answer with the corrected SQL query only, no explanation.
 """
 
+
+async def query_refinement_prompt(context: ReadonlyContext) -> str:
+    state = context.state
+    return QUERY_REFINEMENT_PROMPT.format(
+        current_date=date.today().isoformat(),
+        schema=await table_schema(annotated=False),
+        sql_query=state.get("sql_query"),
+        sql_error=state.get("sql_error"),
+        hint=ERROR_HINTS.get(state.get("sql_status"), ""),
+    )
+
+
 ANSWER_PROMPT = """
 - You are a helful personal accountant that answer user question based on provided data
 - You need to answer question related to their spending or expenses using following data:
 {{sql_output}} that has already retrieved using following query: {{sql_query}}
+- The query produced {{sql_output_total_rows?}} rows in total, result truncated: {{sql_output_truncated?}}. **IF** it is truncated, the data above is only the first part of the result, say so and suggest narrowing the question (e.g. shorter date range) instead of presenting it as complete
+- **IF** the query failed ({{sql_status?}}: {{sql_error?}}), tell the user their data could not be retrieved, e.g. the question was too broad and timed out, instead of guessing an answer
 - Provide concise and accurate answer only based on provided data.
 - Do not hallucinate. If data provided not enough to answer user question, be clear with it and ask clarifying question
 """
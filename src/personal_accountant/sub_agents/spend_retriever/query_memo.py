@@ -0,0 +1,149 @@
+"""
+Local memo of retrieval questions that already produced a working SQL query.
+
+Most questions are paraphrases of a handful of intents, so before paying for
+a HEAVY_MODEL generation we look for a previously successful question whose
+normalized wording is close enough and reuse its SQL. Close enough only
+covers the wording: the numbers, dates, periods, merchants and categories
+of both questions have to be the same. Only queries that ran without
+sql_error are ever admitted, and one that fails later is forgotten.
+"""
+
+import os
+import re
+from datetime import date
+from typing import Optional
+
+from personal_accountant.local_store import LocalStore
+
+QUERY_MEMO_PATH = os.getenv("QUERY_MEMO_PATH", ".query_memo.sqlite3")
+QUERY_MEMO_MIN_SIMILARITY = float(os.getenv("QUERY_MEMO_MIN_SIMILARITY", "0.85"))
+QUERY_MEMO_MAX_ENTRIES = int(os.getenv("QUERY_MEMO_MAX_ENTRIES", "1000"))
+
+# Questions this short are usually follow-ups ("and last month?") whose SQL
+# depends on the conversation, not on the words themselves
+MIN_QUESTION_TOKENS = 2
+
+STOPWORDS = {
+    "a", "an", "the", "i", "me", "my", "we", "our", "you", "your", "is", "are",
+    "was", "were", "be", "been", "do", "did", "does", "have", "has", "had",
+    "how", "what", "which", "please", "can", "could", "would", "tell", "show",
+    "give", "list", "of", "on", "in", "at", "for", "to", "from", "by", "with",
+    "and", "or", "much", "many", "all", "so", "far", "any", "there",
+    "it", "that", "this", "these", "those", "s",
+}
+
+SYNONYMS = {
+    "spent": "spend",
+    "spending": "spend",
+    "spendings": "spend",
+    "expense": "spend",
+    "expenses": "spend",
+    "expenditure": "spend",
+    "paid": "spend",
+    "pay": "spend",
+    "cost": "spend",
+    "costs": "spend",
+    "purchases": "transaction",
+    "purchase": "transaction",
+    "transactions": "transaction",
+    "receipts": "transaction",
+    "receipt": "transaction",
+    "biggest": "largest",
+    "highest": "largest",
+    "total": "sum",
+    "overall": "sum",
+}
+
+# Relative periods are not stopwords even though they look like them: "this
+# month" and "last month" must not collapse into the same question
+PERIOD_WORDS = {"this", "last", "today", "yesterday", "week", "month", "year"}
+
+# Words that only phrase a question, after SYNONYMS. Every other word is a
+# parameter of the question, a number, a date, a month, a merchant, a
+# category, an item, and has to match exactly before its SQL is reused:
+# "food in March" is not "food in May", however long the question.
+PHRASING_WORDS = {
+    "spend", "transaction", "sum", "money", "amount", "amounts", "altogether",
+    "get", "see", "want", "know", "need", "about", "up", "out", "just", "ever",
+    "let", "us", "hey", "hi", "thanks", "thank", "kindly",
+}
+
+DATE_LITERAL = re.compile(r"\d{4}-\d{2}-\d{2}")
+TOKEN = re.compile(r"[a-z0-9]+")
+
+store = LocalStore(
+    QUERY_MEMO_PATH,
+    "query_memo",
+    key="question",
+    columns=("tokens", "sql_query"),
+    max_entries=QUERY_MEMO_MAX_ENTRIES,
+)
+
+
+def question_tokens(question: str) -> frozenset[str]:
+    tokens = set()
+    for token in TOKEN.findall(question.lower()):
+        if token in STOPWORDS and token not in PERIOD_WORDS:
+            continue
+        tokens.add(SYNONYMS.get(token, token))
+
+    return frozenset(tokens)
+
+
+def parameters(tokens: frozenset[str]) -> frozenset[str]:
+    return frozenset(token for token in tokens if token not in PHRASING_WORDS)
+
+
+def similarity(left: frozenset[str], right: frozenset[str]) -> float:
+    if not left or not right:
+        return 0.0
+
+    # Never reuse SQL written for different parameters ("top 5" vs "top 10",
+    # "in March" vs "in May", one merchant for another)
+    if parameters(left) != parameters(right):
+        return 0.0
+
+    return len(left & right) / len(left | right)
+
+
+def find_query(question: str) -> Optional[tuple[str, str]]:
+    """
+    The closest memoized question and its SQL, or None when nothing is
+    similar enough. Queries with date literals were resolved against the day
+    they were written, so they are only reused on that same day.
+    """
+    tokens = question_tokens(question)
+    if len(tokens) < MIN_QUESTION_TOKENS:
+        return None
+
+    today = date.today().isoformat()
+    best_question, best_sql, best_score = None, None, 0.0
+
+    for memo_question, memo_tokens, sql_query, created_on in store.entries():
+        if created_on != today and DATE_LITERAL.search(sql_query):
+            continue
+
+        score = similarity(tokens, frozenset(memo_tokens.split()))
+        if score > best_score:
+            best_question, best_sql, best_score = memo_question, sql_query, score
+
+    if best_score < QUERY_MEMO_MIN_SIMILARITY:
+        return None
+
+    store.hit(best_question)
+    return best_question, best_sql
+
+
+def remember_query(question: str, sql_query: str):
+    """Admit a question and the SQL that answered it without an error."""
+    tokens = question_tokens(question)
+    if len(tokens) < MIN_QUESTION_TOKENS:
+        return
+
+    store.put(question.strip(), " ".join(sorted(tokens)), sql_query)
+
+
+def forget_query(question: str):
+    """Drop a memoized question whose SQL failed, e.g. after a schema change."""
+    store.remove(question)
@@ -0,0 +1,479 @@
+"""
+Per-session timing of agents, model calls, tools and database work.
+
+instrument(root_agent) hooks callbacks into every agent of the tree, including
+agents wrapped in an AgentTool. Every finished measurement is handed to the
+exporters named in TELEMETRY_EXPORTERS (comma separated):
+
+- memory: keeps the latest measurements in process, needs nothing else and is
+  what benchmarks read (default)
+- jsonl: appends one JSON object per measurement to TELEMETRY_JSONL_PATH
+- otel: replays measurements as OpenTelemetry spans to the OTLP/HTTP collector
+  at OTEL_EXPORTER_OTLP_ENDPOINT, needs opentelemetry-exporter-otlp-proto-http
+- prometheus: aggregates histograms and counters, served in the Prometheus
+  text format on TELEMETRY_PROMETHEUS_PORT when it is set
+
+Set TELEMETRY_EXPORTERS to an empty string to turn measuring off.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator, Optional
+
+from google.adk.agents import BaseAgent, LlmAgent, LoopAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.tools import BaseTool
+from google.adk.tools.agent_tool import AgentTool
+from google.adk.tools.tool_context import ToolContext
+
+TELEMETRY_EXPORTERS = os.getenv("TELEMETRY_EXPORTERS", "memory")
+TELEMETRY_JSONL_PATH = os.getenv("TELEMETRY_JSONL_PATH", "telemetry.jsonl")
+TELEMETRY_PROMETHEUS_PORT = int(os.getenv("TELEMETRY_PROMETHEUS_PORT", "0"))
+TELEMETRY_MEMORY_SIZE = int(os.getenv("TELEMETRY_MEMORY_SIZE", "10000"))
+
+# Histogram buckets in seconds, from a cache hit to a slow HEAVY_MODEL call
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Starts whose end never came (an agent skipped by a later before callback, a
+# tool that raised) are forgotten once this many are pending
+MAX_PENDING = 10_000
+
+
+@dataclass
+class Measurement:
+    kind: str  # agent, loop, model, tool, db, cache, image or queue
+    name: str
+    session_id: Optional[str]
+    invocation_id: Optional[str]
+    started_at: float  # unix time
+    duration_ms: float
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+
+class MemoryExporter:
+    def __init__(self, max_size: int = TELEMETRY_MEMORY_SIZE):
+        self.measurements: deque[Measurement] = deque(maxlen=max_size)
+
+    def export(self, measurement: Measurement):
+        self.measurements.append(measurement)
+
+    def summary(self, session_id: Optional[str] = None) -> dict[str, dict[str, float]]:
+        """Count, total and max latency and token totals per `kind name`."""
+        summary: dict[str, dict[str, float]] = defaultdict(
+            lambda: {"count": 0, "total_ms": 0.0, "max_ms": 0.0}
+        )
+        for measurement in self.measurements:
+            if session_id is not None and measurement.session_id != session_id:
+                continue
+
+            entry = summary[f"{measurement.kind} {measurement.name}"]
+            entry["count"] += 1
+            entry["total_ms"] += measurement.duration_ms
+            entry["max_ms"] = max(entry["max_ms"], measurement.duration_ms)
+            for key, value in measurement.attributes.items():
+                if key.endswith("tokens") or key == "iterations":
+                    entry[key] = entry.get(key, 0) + (value or 0)
+                elif key == "hit":
+                    entry["hits"] = entry.get("hits", 0) + value
+
+        return dict(summary)
+
+
+class JsonlExporter:
+    def __init__(self, path: str = TELEMETRY_JSONL_PATH):
+        self.file = open(path, "a", buffering=1, encoding="utf-8")
+        self.lock = threading.Lock()
+
+    def export(self, measurement: Measurement):
+        line = json.dumps(asdict(measurement), default=str)
+        with self.lock:
+            self.file.write(line + "\n")
+
+
+class OtelExporter:
+    def __init__(self):
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+                OTLPSpanExporter,
+            )
+        except ImportError as e:
+            raise ImportError(
+                "the otel telemetry exporter needs opentelemetry-exporter-otlp-proto-http"
+            ) from e
+
+        # Our own provider, so ADK's spans keep going wherever they already go
+        provider = TracerProvider(
+            resource=Resource.create({"service.name": "personal-accountant"})
+        )
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        self.tracer = provider.get_tracer("personal_accountant")
+
+    def export(self, measurement: Measurement):
+        start_ns = int(measurement.started_at * 1e9)
+        attributes = {
+            key: value
+            for key, value in {
+                "session.id": measurement.session_id,
+                "invocation.id": measurement.invocation_id,
+                **measurement.attributes,
+            }.items()
+            if isinstance(value, (str, bool, int, float))
+        }
+
+        span = self.tracer.start_span(
+            f"{measurement.kind} {measurement.name}",
+            start_time=start_ns,
+            attributes=attributes,
+        )
+        span.end(end_time=start_ns + int(measurement.duration_ms * 1e6))
+
+
+class PrometheusExporter:
+    def __init__(self, port: int = TELEMETRY_PROMETHEUS_PORT):
+        self.lock = threading.Lock()
+        # (kind, name) -> per bucket counts, sum and count of durations
+        self.durations: dict[tuple[str, str], list] = {}
+        self.tokens: dict[tuple[str, str], int] = defaultdict(int)
+        self.iterations: dict[str, list[int]] = defaultdict(lambda: [0, 0])
+        # Latest depth, parked and lag_seconds of the ingest queue
+        self.ingest_queue: dict[str, float] = {}
+        self.ingest_flushed = 0
+        # Latest stats() of the query result cache
+        self.query_cache: dict[str, float] = {}
+
+        if port:
+            self.serve(port)
+
+    def export(self, measurement: Measurement):
+        seconds = measurement.duration_ms / 1000
+
+        with self.lock:
+            buckets, total = self.durations.setdefault(
+                (measurement.kind, measurement.name), [[0] * len(BUCKETS), [0.0, 0]]
+            )
+            for i, bound in enumerate(BUCKETS):
+                buckets[i] += seconds <= bound
+            total[0] += seconds
+            total[1] += 1
+
+            for key in ("prompt_tokens", "output_tokens", "cached_tokens"):
+                if measurement.attributes.get(key):
+                    self.tokens[(measurement.name, key.removesuffix("_tokens"))] += (
+                        measurement.attributes[key]
+                    )
+
+            if measurement.kind == "loop":
+                self.iterations[measurement.name][0] += measurement.attributes["iterations"]
+                self.iterations[measurement.name][1] += 1
+
+            if measurement.kind == "queue":
+                for key in ("depth", "parked", "lag_seconds"):
+                    self.ingest_queue[key] = measurement.attributes[key]
+                self.ingest_flushed += measurement.attributes.get("rows", 0)
+
+            if measurement.kind == "cache":
+                for key in ("size", "hits", "misses", "evictions", "invalidations"):
+                    self.query_cache[key] = measurement.attributes[key]
+
+    def render(self) -> str:
+        lines = [
+            "# HELP personal_accountant_duration_seconds Latency of agents, model calls, tools and database work.",
+            "# TYPE personal_accountant_duration_seconds histogram",
+        ]
+
+        with self.lock:
+            for (kind, name), (buckets, (total, count)) in sorted(self.durations.items()):
+                labels = f'kind="{kind}",name="{name}"'
+                for bound, bucket in zip(BUCKETS, buckets):
+                    lines.append(
+                        f'personal_accountant_duration_seconds_bucket{{{labels},le="{bound}"}} {bucket}'
+                    )
+                lines.append(
+                    f'personal_accountant_duration_seconds_bucket{{{labels},le="+Inf"}} {count}'
+                )
+                lines.append(f"personal_accountant_duration_seconds_sum{{{labels}}} {total}")
+                lines.append(f"personal_accountant_duration_seconds_count{{{labels}}} {count}")
+
+            lines += [
+                "# HELP personal_accountant_tokens_total Model tokens by agent.",
+                "# TYPE personal_accountant_tokens_total counter",
+            ]
+            for (agent, token_type), value in sorted(self.tokens.items()):
+                lines.append(
+                    f'personal_accountant_tokens_total{{agent="{agent}",type="{token_type}"}} {value}'
+                )
+
+            lines += [
+                "# HELP personal_accountant_loop_iterations Iterations per loop agent run.",
+                "# TYPE personal_accountant_loop_iterations summary",
+            ]
+            for loop, (total, count) in sorted(self.iterations.items()):
+                lines.append(f'personal_accountant_loop_iterations_sum{{loop="{loop}"}} {total}')
+                lines.append(f'personal_accountant_loop_iterations_count{{loop="{loop}"}} {count}')
+
+            if self.ingest_queue:
+                lines += [
+                    "# HELP personal_accountant_ingest_queue_depth Spendings waiting in the ingest queue.",
+                    "# TYPE personal_accountant_ingest_queue_depth gauge",
+                    f"personal_accountant_ingest_queue_depth {self.ingest_queue['depth']}",
+                    "# HELP personal_accountant_ingest_queue_parked Spendings the ingest queue gave up on.",
+                    "# TYPE personal_accountant_ingest_queue_parked gauge",
+                    f"personal_accountant_ingest_queue_parked {self.ingest_queue['parked']}",
+                    "# HELP personal_accountant_ingest_queue_lag_seconds Age of the oldest queued spending.",
+                    "# TYPE personal_accountant_ingest_queue_lag_seconds gauge",
+                    f"personal_accountant_ingest_queue_lag_seconds {self.ingest_queue['lag_seconds']}",
+                    "# HELP personal_accountant_ingest_flushed_total Spendings the ingest queue saved to Postgres.",
+                    "# TYPE personal_accountant_ingest_flushed_total counter",
+                    f"personal_accountant_ingest_flushed_total {self.ingest_flushed}",
+                ]
+
+            if self.query_cache:
+                lines += [
+                    "# HELP personal_accountant_query_cache_size Query results in the cache.",
+                    "# TYPE personal_accountant_query_cache_size gauge",
+                    f"personal_accountant_query_cache_size {self.query_cache['size']}",
+                    "# HELP personal_accountant_query_cache_lookups_total Query cache lookups by result.",
+                    "# TYPE personal_accountant_query_cache_lookups_total counter",
+                    f'personal_accountant_query_cache_lookups_total{{result="hit"}} {self.query_cache["hits"]}',
+                    f'personal_accountant_query_cache_lookups_total{{result="miss"}} {self.query_cache["misses"]}',
+                    "# HELP personal_accountant_query_cache_evictions_total Query results dropped to make room.",
+                    "# TYPE personal_accountant_query_cache_evictions_total counter",
+                    f"personal_accountant_query_cache_evictions_total {self.query_cache['evictions']}",
+                    "# HELP personal_accountant_query_cache_invalidations_total Query results dropped after a save or their TTL.",
+                    "# TYPE personal_accountant_query_cache_invalidations_total counter",
+                    f"personal_accountant_query_cache_invalidations_total {self.query_cache['invalidations']}",
+                ]
+
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int):
+        exporter = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = exporter.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+EXPORTERS = {
+    "memory": MemoryExporter,
+    "jsonl": JsonlExporter,
+    "otel": OtelExporter,
+    "prometheus": PrometheusExporter,
+}
+
+exporters: Optional[list] = None
+
+# (session id, invocation id) of whatever is running, for measurements taken
+# outside of callbacks such as database work
+current_scope: ContextVar[tuple[Optional[str], Optional[str]]] = ContextVar(
+    "telemetry_scope", default=(None, None)
+)
+
+# Start times and attributes of measurements in progress
+pending: OrderedDict[tuple, tuple[float, float, dict[str, Any]]] = OrderedDict()
+
+# First sub agent of each loop agent -> loop agent, its runs count iterations
+loop_heads: dict[str, str] = {}
+loop_iterations: dict[tuple[str, str], int] = defaultdict(int)
+
+
+def get_exporters() -> list:
+    global exporters
+
+    if exporters is None:
+        names = [name.strip() for name in TELEMETRY_EXPORTERS.split(",") if name.strip()]
+        exporters = [EXPORTERS[name]() for name in names]
+
+    return exporters
+
+
+def get_exporter(exporter_type: type) -> Optional[Any]:
+    return next((e for e in get_exporters() if isinstance(e, exporter_type)), None)
+
+
+def record(measurement: Measurement):
+    for exporter in get_exporters():
+        exporter.export(measurement)
+
+
+def start(key: tuple, **attributes):
+    if not get_exporters():
+        return
+
+    pending[key] = (time.time(), time.perf_counter(), attributes)
+    while len(pending) > MAX_PENDING:
+        pending.popitem(last=False)
+
+
+def finish(key: tuple, kind: str, name: str, scope: tuple, **attributes):
+    started = pending.pop(key, None)
+    if started is None:
+        return
+
+    started_at, started_counter, start_attributes = started
+    record(
+        Measurement(
+            kind=kind,
+            name=name,
+            session_id=scope[0],
+            invocation_id=scope[1],
+            started_at=started_at,
+            duration_ms=(time.perf_counter() - started_counter) * 1000,
+            attributes={**start_attributes, **attributes},
+        )
+    )
+
+
+@contextmanager
+def timed(kind: str, name: str, **attributes) -> Iterator[dict[str, Any]]:
+    """Measure the block, attributes can be added to the yielded dict."""
+    if not get_exporters():
+        yield attributes
+        return
+
+    started_at, started_counter = time.time(), time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        session_id, invocation_id = current_scope.get()
+        record(
+            Measurement(
+                kind=kind,
+                name=name,
+                session_id=session_id,
+                invocation_id=invocation_id,
+                started_at=started_at,
+                duration_ms=(time.perf_counter() - started_counter) * 1000,
+                attributes=attributes,
+            )
+        )
+
+
+def scope_of(callback_context: CallbackContext) -> tuple[str, str]:
+    return (
+        callback_context._invocation_context.session.id,
+        callback_context.invocation_id,
+    )
+
+
+def before_agent(callback_context: CallbackContext):
+    scope = scope_of(callback_context)
+    current_scope.set(scope)
+    start(("agent", scope[1], callback_context.agent_name))
+
+    loop = loop_heads.get(callback_context.agent_name)
+    if loop is not None:
+        loop_iterations[(scope[1], loop)] += 1
+
+
+def after_agent(callback_context: CallbackContext):
+    scope = scope_of(callback_context)
+    name = callback_context.agent_name
+
+    if name in loop_heads.values():
+        iterations = loop_iterations.pop((scope[1], name), 0)
+        finish(("agent", scope[1], name), "loop", name, scope, iterations=iterations)
+    else:
+        finish(("agent", scope[1], name), "agent", name, scope)
+
+
+def before_model(callback_context: CallbackContext, llm_request: LlmRequest):
+    scope = scope_of(callback_context)
+    start(("model", scope[1], callback_context.agent_name), model=llm_request.model)
+
+
+def after_model(callback_context: CallbackContext, llm_response: LlmResponse):
+    scope = scope_of(callback_context)
+    usage = llm_response.usage_metadata
+
+    finish(
+        ("model", scope[1], callback_context.agent_name),
+        "model",
+        callback_context.agent_name,
+        scope,
+        prompt_tokens=usage and usage.prompt_token_count,
+        output_tokens=usage and usage.candidates_token_count,
+        cached_tokens=usage and usage.cached_content_token_count,
+        total_tokens=usage and usage.total_token_count,
+    )
+
+
+def before_tool(tool: BaseTool, args: dict[str, Any], tool_context: ToolContext):
+    scope = scope_of(tool_context)
+    current_scope.set(scope)
+    start(("tool", scope[1], tool_context.function_call_id))
+
+
+def after_tool(
+    tool: BaseTool, args: dict[str, Any], tool_context: ToolContext, tool_response: Any
+):
+    scope = scope_of(tool_context)
+    state = tool_response.get("state") if isinstance(tool_response, dict) else None
+
+    finish(
+        ("tool", scope[1], tool_context.function_call_id),
+        "tool",
+        tool.name,
+        scope,
+        agent=tool_context.agent_name,
+        state=state,
+    )
+
+
+def as_list(callbacks) -> list:
+    if callbacks is None:
+        return []
+    return list(callbacks) if isinstance(callbacks, list) else [callbacks]
+
+
+def instrument(agent: BaseAgent):
+    """
+    Hook the telemetry callbacks into `agent` and everything below it. They go
+    first in every callback list so they run even when one of the agent's own
+    callbacks short-circuits, and since they never return anything the
+    agent's callbacks still run after them.
+    """
+    if before_agent in as_list(agent.before_agent_callback):
+        return
+
+    agent.before_agent_callback = [before_agent, *as_list(agent.before_agent_callback)]
+    agent.after_agent_callback = [after_agent, *as_list(agent.after_agent_callback)]
+
+    if isinstance(agent, LoopAgent) and agent.sub_agents:
+        loop_heads[agent.sub_agents[0].name] = agent.name
+
+    if isinstance(agent, LlmAgent):
+        agent.before_model_callback = [before_model, *as_list(agent.before_model_callback)]
+        agent.after_model_callback = [after_model, *as_list(agent.after_model_callback)]
+        agent.before_tool_callback = [before_tool, *as_list(agent.before_tool_callback)]
+        agent.after_tool_callback = [after_tool, *as_list(agent.after_tool_callback)]
+
+        for tool in agent.tools:
+            if isinstance(tool, AgentTool):
+                instrument(tool.agent)
+
+    for sub_agent in agent.sub_agents:
+        instrument(sub_agent)
@@ -0,0 +1,527 @@
+"""
+Columnar copy of spendings and spending_items for long-range questions.
+
+export() appends the rows added since the previous export to Parquet files
+under ANALYTICS_PATH, one directory per month of the spending's
+transaction_date, and moves the id high-water mark of each table forward.
+database.query_database sends generated queries is_analytical() accepts to
+DuckDB over those files, as long as the copy holds every row Postgres has.
+Everything else, and every write, stays on Postgres.
+
+The files of the copy are listed in a manifest that is replaced atomically,
+so readers never see half an export, and a crashed export writes the same
+file names again when it is rerun.
+
+The copy holds every user's rows, sorted by user_id within each file so a
+user's queries skip the row groups of everybody else. DuckDB has no row
+level security: the views only return the rows of the user_id variable
+fetch_rows sets on its cursor, and nothing without it.
+
+Rows are appended as long as none are changed. Updates and deletes, e.g.
+the exchange rate backfill, are counted in spending_changes
+(0009_add_spending_changes): a copy exported at other counts is not current,
+and the next export rebuilds it. Columns later migrations add need a
+`--rebuild`. DuckDB is optional (the `analytics` extra). Without it, or
+without ANALYTICS_PATH, queries are not routed anywhere else.
+
+    cd src
+    python -m personal_accountant.tools.analytics
+"""
+
+import argparse
+import asyncio
+import contextvars
+import importlib.util
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+import sqlglot
+from psycopg import AsyncConnection, sql
+from sqlglot import exp
+from sqlglot.errors import ParseError, SqlglotError
+
+from personal_accountant.types import records
+
+# duckdb is imported once the copy is first read or written, processes that
+# never answer an analytical question do not pay for it at startup
+DUCKDB_INSTALLED = importlib.util.find_spec("duckdb") is not None
+
+ANALYTICS_PATH = os.getenv("ANALYTICS_PATH", "")
+# Start an export in the background when an analytical query finds the copy
+# behind, at most this often
+ANALYTICS_EXPORT_INTERVAL_SECONDS = float(os.getenv("ANALYTICS_EXPORT_INTERVAL_SECONDS", "60"))
+# Every export adds a file to each month it touches, past this many a month
+# is rewritten into one
+ANALYTICS_MAX_FILES_PER_MONTH = int(os.getenv("ANALYTICS_MAX_FILES_PER_MONTH", "16"))
+# How long an export waits for running writes to spendings before giving up
+EXPORT_LOCK_TIMEOUT = "5s"
+# Bumped when exported files change shape, a copy written by an older version
+# is not used and the next export starts over. 2: rows carry user_id.
+MANIFEST_VERSION = 2
+
+# Table -> the rows to export between two ids, with the month they belong to
+EXPORT_QUERIES = {
+    "spendings": """
+        SELECT {columns}, to_char(transaction_date, 'YYYY-MM') AS month
+        FROM spendings
+        WHERE id > {low} AND id <= {high}
+    """,
+    "spending_items": """
+        SELECT {columns}, to_char(s.transaction_date, 'YYYY-MM') AS month
+        FROM spending_items
+        JOIN spendings s ON s.id = spending_items.spending_id
+        WHERE spending_items.id > {low} AND spending_items.id <= {high}
+    """,
+}
+TABLES = tuple(EXPORT_QUERIES)
+
+# The high-water marks and change counts of both tables, in one snapshot
+SOURCE_STATE_SQL = """
+SELECT
+    (SELECT max(id) FROM spendings),
+    (SELECT max(id) FROM spending_items),
+    (SELECT jsonb_object_agg(table_name, changes) FROM spending_changes)
+"""
+
+# information_schema data types DuckDB spells differently, numeric is
+# handled on its own
+DUCKDB_TYPES = {
+    "integer": "INTEGER",
+    "bigint": "BIGINT",
+    "smallint": "SMALLINT",
+    "boolean": "BOOLEAN",
+    "date": "DATE",
+    "time without time zone": "TIME",
+    "timestamp without time zone": "TIMESTAMP",
+    "timestamp with time zone": "TIMESTAMPTZ",
+    "double precision": "DOUBLE",
+    "real": "FLOAT",
+}
+
+logger = logging.getLogger(__name__)
+
+# The manifest as last read, with the mtime of its file
+manifest: Optional[dict] = None
+manifest_mtime: Optional[float] = None
+# The manifest DuckDB's views were created from
+views_manifest: Optional[dict] = None
+views_lock = threading.Lock()
+
+connection: Optional["duckdb.DuckDBPyConnection"] = None
+connection_lock = threading.Lock()
+export_lock = asyncio.Lock()
+export_task: Optional[asyncio.Task] = None
+last_export_started = 0.0
+
+
+def enabled() -> bool:
+    return bool(ANALYTICS_PATH) and DUCKDB_INSTALLED
+
+
+def manifest_path() -> Path:
+    return Path(ANALYTICS_PATH) / "manifest.json"
+
+
+def empty_manifest() -> dict:
+    return {
+        "version": MANIFEST_VERSION,
+        "watermarks": {table: 0 for table in TABLES},
+        "files": {table: [] for table in TABLES},
+    }
+
+
+def load_manifest() -> dict:
+    """The current manifest, read again only when another export replaced it."""
+    global manifest, manifest_mtime
+
+    path = manifest_path()
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return empty_manifest()
+
+    if manifest is None or mtime != manifest_mtime:
+        manifest, manifest_mtime = json.loads(path.read_text()), mtime
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        return empty_manifest()
+
+    return manifest
+
+
+def save_manifest(new_manifest: dict):
+    path = manifest_path()
+    staged = path.with_suffix(".json.tmp")
+    staged.write_text(json.dumps(new_manifest, indent=2))
+    os.replace(staged, path)
+
+
+def is_analytical(query: str) -> bool:
+    """
+    Whether `query` is worth running on the columnar copy: it aggregates,
+    and reads nothing but spendings and spending_items.
+    """
+    try:
+        statement = sqlglot.parse_one(query, read="postgres")
+    except ParseError:
+        return False
+
+    cte_names = {cte.alias_or_name.lower() for cte in statement.find_all(exp.CTE)}
+    tables = set()
+    for table in statement.find_all(exp.Table):
+        if not isinstance(table.this, exp.Identifier):
+            # Table functions such as generate_series()
+            return False
+        if table.name.lower() not in cte_names:
+            tables.add(table.name.lower())
+
+    if not tables or not tables <= set(TABLES):
+        return False
+
+    return statement.find(exp.AggFunc, exp.Group) is not None
+
+
+async def source_state(conn: AsyncConnection) -> tuple[dict[str, int], dict[str, int]]:
+    """The highest id and the count of updating or deleting statements per table."""
+    cur = await conn.execute(SOURCE_STATE_SQL)
+    *highs, changes = await cur.fetchone()
+    return {table: high or 0 for table, high in zip(TABLES, highs)}, changes
+
+
+async def is_current(conn: AsyncConnection) -> bool:
+    """Whether the copy holds every row Postgres has, as Postgres has it."""
+    current = load_manifest()
+    highs, changes = await source_state(conn)
+    return current.get("changes") == changes and all(
+        highs[table] <= current["watermarks"][table] for table in TABLES
+    )
+
+
+async def column_types(conn: AsyncConnection, table: str) -> dict[str, str]:
+    cur = await conn.execute(
+        """
+        SELECT column_name, data_type, numeric_precision, numeric_scale
+        FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = %s
+        ORDER BY ordinal_position
+        """,
+        (table,),
+    )
+    columns = {}
+    for column, data_type, precision, scale in await cur.fetchall():
+        if data_type == "tsvector":
+            # 0007_add_spending_search's documents only serve Postgres' search
+            continue
+        if column == "ingest_key":
+            # 0011_add_spending_ingest_key only guards the ingest queue's replays
+            continue
+        if data_type == "numeric":
+            columns[column] = f"DECIMAL({precision}, {scale})" if precision else "DOUBLE"
+        else:
+            columns[column] = DUCKDB_TYPES.get(data_type, "VARCHAR")
+    columns["month"] = "VARCHAR"
+
+    return columns
+
+
+def get_duckdb() -> "duckdb.DuckDBPyConnection":
+    """The process' in-memory DuckDB, every thread works on a cursor() of it."""
+    global connection
+
+    with connection_lock:
+        if connection is None:
+            import duckdb
+
+            connection = duckdb.connect()
+
+    return connection
+
+
+def quote(path: Path) -> str:
+    """`path` as a DuckDB string literal, COPY ... TO and views take no parameters."""
+    return "'" + str(path).replace("'", "''") + "'"
+
+
+def write_parquet(
+    csv_path: Path, columns: dict[str, str], table: str, first_id: int
+) -> tuple[list[str], int]:
+    """
+    Partition the exported CSV by month. Returns the new files, relative to
+    ANALYTICS_PATH, and the number of rows written.
+    """
+    root = Path(ANALYTICS_PATH)
+    cursor = get_duckdb().cursor()
+    cursor.execute(
+        f"""
+        COPY (
+            SELECT * FROM read_csv(
+                ?, header = true, allow_quoted_nulls = false, columns = {columns!r}
+            )
+            ORDER BY user_id
+        )
+        TO {quote(root / table)} (
+            FORMAT parquet,
+            PARTITION_BY (month),
+            OVERWRITE_OR_IGNORE,
+            FILENAME_PATTERN 'from_{first_id}_{{i}}'
+        )
+        """,
+        [str(csv_path)],
+    )
+    (rows,) = cursor.fetchone()
+
+    files = sorted(
+        str(path.relative_to(root))
+        for path in (root / table).glob(f"month=*/from_{first_id}_*.parquet")
+    )
+    return files, rows
+
+
+def compact(files: list[str]) -> list[str]:
+    """
+    Rewrite every month holding more than ANALYTICS_MAX_FILES_PER_MONTH of
+    `files` into a single file. Returns the new file list, the replaced files
+    stay on disk until the manifest no longer names them.
+    """
+    root = Path(ANALYTICS_PATH)
+    months: dict[str, list[str]] = {}
+    for file in files:
+        months.setdefault(str(Path(file).parent), []).append(file)
+
+    compacted = []
+    for month, month_files in sorted(months.items()):
+        if len(month_files) <= ANALYTICS_MAX_FILES_PER_MONTH:
+            compacted += month_files
+            continue
+
+        target = f"{month}/compacted_{uuid.uuid4().hex}.parquet"
+        get_duckdb().cursor().execute(
+            f"COPY (SELECT * FROM read_parquet(?, hive_partitioning = false, union_by_name = true) ORDER BY user_id)"
+            f" TO {quote(root / target)} (FORMAT parquet)",
+            [[str(root / file) for file in month_files]],
+        )
+        compacted.append(target)
+
+    return compacted
+
+
+async def export(conn: AsyncConnection, rebuild: bool = False) -> dict[str, int]:
+    """
+    Append the rows added since the last export to the copy, or copy every
+    row again with `rebuild` or when rows were updated or deleted since.
+    Returns the rows exported per table.
+    """
+    global manifest
+
+    async with export_lock:
+        # Waiting for the running writes to spendings makes every id up to
+        # the maximum committed, nothing can show up below it later, and
+        # the change counts belong to exactly these rows
+        await conn.execute(
+            "SELECT set_config('lock_timeout', %s, true)", (EXPORT_LOCK_TIMEOUT,)
+        )
+        await conn.execute("LOCK TABLE spendings, spending_items IN SHARE MODE")
+        highs, changes = await source_state(conn)
+        await conn.commit()
+
+        previous = load_manifest()
+        # No copy yet, or one of an older version: whatever is on disk is
+        # not referenced by the manifest and would only be overwritten
+        # piecemeal. Rows changed since the last export are in files
+        # already written.
+        rebuild = (
+            rebuild
+            or not any(previous["files"].values())
+            or previous.get("changes") != changes
+        )
+        if rebuild:
+            previous = empty_manifest()
+        new_manifest = json.loads(json.dumps(previous))
+        new_manifest["changes"] = changes
+
+        if rebuild:
+            shutil.rmtree(ANALYTICS_PATH, ignore_errors=True)
+        Path(ANALYTICS_PATH).mkdir(parents=True, exist_ok=True)
+
+        exported = {}
+        written = {table: set() for table in TABLES}
+        with tempfile.TemporaryDirectory() as staging:
+            for table in TABLES:
+                low, high = new_manifest["watermarks"][table], highs[table]
+                exported[table] = 0
+                if high <= low:
+                    continue
+
+                csv_path = Path(staging) / f"{table}.csv"
+                columns = await column_types(conn, table)
+                query = sql.SQL(EXPORT_QUERIES[table]).format(
+                    columns=sql.SQL(", ").join(
+                        sql.Identifier(table, column) for column in columns if column != "month"
+                    ),
+                    low=sql.Literal(low),
+                    high=sql.Literal(high),
+                )
+                async with conn.cursor() as cursor:
+                    async with cursor.copy(
+                        sql.SQL("COPY ({}) TO STDOUT (FORMAT csv, HEADER)").format(query)
+                    ) as copy:
+                        with csv_path.open("wb") as out:
+                            async for data in copy:
+                                out.write(data)
+
+                files, exported[table] = await asyncio.to_thread(
+                    write_parquet, csv_path, columns, table, low + 1
+                )
+                table_files = new_manifest["files"][table]
+                table_files += [file for file in files if file not in table_files]
+                written[table].update(files)
+                new_manifest["files"][table] = await asyncio.to_thread(compact, table_files)
+                new_manifest["watermarks"][table] = high
+
+        save_manifest(new_manifest)
+        manifest = None
+
+        # Files compaction replaced, once the new manifest no longer names them
+        root = Path(ANALYTICS_PATH)
+        for table in TABLES:
+            replaced = set(previous["files"][table]) | written[table]
+            for file in replaced - set(new_manifest["files"][table]):
+                (root / file).unlink(missing_ok=True)
+
+    return exported
+
+
+def export_soon(run_export: Callable[[], Awaitable]):
+    """Start `run_export` in the background unless one ran recently or is running."""
+    global export_task, last_export_started
+
+    if export_task is not None and not export_task.done():
+        return
+    if time.monotonic() - last_export_started < ANALYTICS_EXPORT_INTERVAL_SECONDS:
+        return
+
+    async def run():
+        try:
+            await run_export()
+        except Exception:
+            logger.exception("analytics export failed")
+
+    last_export_started = time.monotonic()
+    # A context of its own, the export is not part of the session that
+    # happened to notice the copy was behind
+    export_task = asyncio.create_task(run(), context=contextvars.Context())
+
+
+def create_views(current: dict):
+    """
+    (Re)create the spendings and spending_items views over the manifest's
+    files, limited to the user in the cursor's user_id variable.
+    """
+    global views_manifest
+
+    with views_lock:
+        if views_manifest is current:
+            return
+
+        root = Path(ANALYTICS_PATH)
+        cursor = get_duckdb().cursor()
+        for table in TABLES:
+            files = ", ".join(quote(root / file) for file in current["files"][table])
+            cursor.execute(f"""
+                CREATE OR REPLACE VIEW {table} AS
+                SELECT * EXCLUDE (month)
+                FROM read_parquet([{files}], hive_partitioning = true, union_by_name = true)
+                WHERE user_id = getvariable('user_id')
+            """)
+        views_manifest = current
+
+
+def run_query(
+    query: str, user_id: str, max_rows: int, max_bytes: int, timeout_seconds: float
+) -> tuple[list[dict], int, bool]:
+    current = load_manifest()
+    if not all(current["files"][table] for table in TABLES):
+        raise LookupError("the analytics copy has no files yet")
+    create_views(current)
+
+    cursor = get_duckdb().cursor()
+    cursor.execute("SET VARIABLE user_id = ?", [user_id])
+    timer = threading.Timer(timeout_seconds, cursor.interrupt)
+    timer.start()
+    try:
+        cursor.execute(query)
+        names = [column[0] for column in cursor.description]
+
+        rows, result_bytes, total_rows, truncated = [], 0, 0, False
+        while batch := cursor.fetchmany(100):
+            for values in batch:
+                total_rows += 1
+                if truncated:
+                    continue
+
+                row = dict(zip(names, values))
+                row_bytes = len(records.encode_row(row))
+                if len(rows) >= max_rows or result_bytes + row_bytes > max_bytes:
+                    truncated = True
+                    continue
+
+                rows.append(row)
+                result_bytes += row_bytes
+    finally:
+        timer.cancel()
+
+    return rows, total_rows, truncated
+
+
+async def fetch_rows(
+    query: str, user_id: str, max_rows: int, max_bytes: int, timeout_seconds: float
+) -> tuple[list[dict], int, bool]:
+    """
+    Run generated Postgres SQL on the columnar copy over the rows of
+    `user_id`. Returns the rows kept
+    within `max_rows` and `max_bytes`, how many there were in total and
+    whether some were left out.
+    """
+    try:
+        duckdb_query = sqlglot.transpile(query, read="postgres", write="duckdb")[0]
+    except SqlglotError as e:
+        raise ValueError(f"cannot run on DuckDB: {e}") from e
+
+    return await asyncio.to_thread(
+        run_query, duckdb_query, user_id, max_rows, max_bytes, timeout_seconds
+    )
+
+
+async def main():
+    from personal_accountant.tools import database
+
+    parser = argparse.ArgumentParser(description="Export spendings to the Parquet analytics copy")
+    parser.add_argument("--rebuild", action="store_true", help="Export every row again")
+    args = parser.parse_args()
+
+    if not enabled():
+        raise SystemExit("Set ANALYTICS_PATH and install the analytics extra (duckdb)")
+
+    try:
+        start = time.perf_counter()
+        exported = await database.run_with_reconnect(
+            lambda conn: export(conn, rebuild=args.rebuild), name="analytics_export"
+        )
+        print(
+            ", ".join(f"{rows} {table}" for table, rows in exported.items())
+            + f" exported in {time.perf_counter() - start:.1f}s"
+        )
+    finally:
+        await database.close_db_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,100 +1,572 @@
+import asyncio
+import functools
+import logging
 import os
+import sqlite3
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, TypeVar
+
 from dotenv import load_dotenv
 
-from psycopg import Connection, Error as DBError
+from psycopg import AsyncConnection, Error as DBError, OperationalError, sql
+from psycopg.errors import QueryCanceled
 from psycopg.rows import dict_row
-from google.adk.tools.tool_context import ToolContext
+from psycopg_pool import AsyncConnectionPool
 from pydantic import ValidationError
 
+# Run as a script (entrypoint.sh) this only migrates, so it skips the ADK and
+# the rest of the package and stays quick to start
 if __name__ != "__main__":
+    from google.adk.agents.readonly_context import ReadonlyContext
+    from google.adk.tools.tool_context import ToolContext
+    from sqlglot import exp
+
+    from personal_accountant import telemetry
+    from personal_accountant.tools import analytics, sql_guard
+    from personal_accountant.tools.fx_rates import rate_cache
+    from personal_accountant.tools.ingest_queue import ingest_queue
+    from personal_accountant.tools.query_cache import query_cache
+    from personal_accountant.types import records
     from personal_accountant.types.type import SpendingAgentOutput
 
 if os.path.exists(".env"):
     load_dotenv(".env")
 
 
-conn: Connection | None = None
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+POOL_MIN_SIZE = int(os.getenv("POSTGRES_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("POSTGRES_POOL_MAX_SIZE", "10"))
+POOL_TIMEOUT = float(os.getenv("POSTGRES_POOL_TIMEOUT", "30"))
+POOL_MAX_IDLE = float(os.getenv("POSTGRES_POOL_MAX_IDLE", "600"))
+RECONNECT_ATTEMPTS = int(os.getenv("POSTGRES_RECONNECT_ATTEMPTS", "2"))
+
+# Bounds on what query_database keeps from LLM written SQL, so neither memory
+# nor the answer prompt grows with the table
+QUERY_MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", "200"))
+QUERY_MAX_BYTES = int(os.getenv("QUERY_MAX_BYTES", "65536"))
+QUERY_STATEMENT_TIMEOUT_MS = int(os.getenv("QUERY_STATEMENT_TIMEOUT_MS", "5000"))
+QUERY_FETCH_SIZE = 100
+# Planner cost above which generated queries are capped with a LIMIT or
+# refused, 0 turns the check off
+QUERY_MAX_COST = float(os.getenv("QUERY_MAX_COST", "1000000"))
+
+# Tables a spending write touches, their cached query results go stale with it.
+# The rollups are kept in sync by triggers on spendings.
+SPENDING_TABLES = (
+    "spendings",
+    "spending_items",
+    "daily_category_spendings",
+    "monthly_merchant_spendings",
+)
 
+# Role saves and generated queries run as, the row level security policies of
+# 0006_add_spending_owner only apply to it. The pool's own role owns the
+# tables, migrations and maintenance jobs see every user's rows through it.
+USER_ROLE = "personal_accountant_user"
+# Owner of the spendings saved before there were owners, `adk web`'s user
+DEFAULT_USER_ID = "user"
 
-def get_db_conn():
-    global conn
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+# Arbitrary key for pg_advisory_xact_lock, shared by every migrating process
+MIGRATION_LOCK_ID = 7_460_214_001
 
-    if conn is not None:
+pool: AsyncConnectionPool | None = None
+pool_lock = asyncio.Lock()
+
+# Table name -> column name -> data type, loaded on first use and dropped by
+# migrate()
+catalog: dict[str, dict[str, str]] | None = None
+
+
+async def get_db_pool() -> AsyncConnectionPool:
+    """
+    Lazily open the shared async connection pool.
+
+    Connections are health-checked when they are handed out, broken ones are
+    discarded by the pool and replaced in the background, so a dropped
+    connection no longer takes the whole process down.
+    """
+    global pool
+
+    if pool is not None:
+        return pool
+
+    async with pool_lock:
+        if pool is not None:
+            return pool
+
+        db_url = os.getenv("POSTGRES_URL")
+        if db_url is None:
+            raise ValueError("POSTGRES_URL is not set!")
+
+        new_pool = AsyncConnectionPool(
+            db_url,
+            min_size=POOL_MIN_SIZE,
+            max_size=POOL_MAX_SIZE,
+            timeout=POOL_TIMEOUT,
+            max_idle=POOL_MAX_IDLE,
+            check=AsyncConnectionPool.check_connection,
+            name="personal_accountant",
+            open=False,
+        )
+        await new_pool.open()
+        pool = new_pool
+
+    return pool
+
+
+async def close_db_pool():
+    global pool
+
+    if pool is None:
         return
 
-    db_url = os.getenv("POSTGRES_URL")
-    if db_url is None:
-        raise ValueError("POSTGRES_URL is not set!")
+    await pool.close()
+    pool = None
 
-    conn = Connection.connect(db_url)
 
-    return
+async def scope_to_user(conn: AsyncConnection, user_id: str):
+    """
+    Run the rest of the current transaction on `conn` as USER_ROLE on behalf
+    of `user_id`: queries only see that user's rows, and new rows belong to
+    them. The owner is bound before the role switch, by a function USER_ROLE
+    may not call (0010_bind_request_owner), so nothing running as USER_ROLE
+    can act for somebody else. Both end with the transaction, so the pool
+    never hands out a connection still acting for someone.
+    """
+    if not user_id:
+        raise ValueError("user_id is required")
+    if conn.autocommit:
+        # The binding would be gone with the SELECT making it
+        raise ValueError("scope_to_user needs a connection in a transaction")
+
+    await conn.execute(
+        "SELECT bind_request_owner(%s), set_config('role', %s, true)",
+        (user_id, USER_ROLE),
+    )
 
 
-def migrate():
-    global conn
+def context_user_id(context: "ReadonlyContext") -> str:
+    """The ADK user whose session `context` belongs to."""
+    return context._invocation_context.user_id
 
-    cur = conn.cursor()
 
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS spendings (
-            id SERIAL PRIMARY KEY,
-            type TEXT NOT NULL,
-            currency TEXT NOT NULL,
-            transaction_date DATE NOT NULL,
-            transaction_time TIME NULL,
-            transaction_category TEXT NULL,
+async def run_with_reconnect(
+    operation: Callable[[AsyncConnection], Awaitable[T]],
+    name: str = "query",
+    user_id: str | None = None,
+) -> T:
+    """
+    Run `operation` on a pooled connection, committing on success. `name`
+    labels its database time in telemetry, pool waits and retries included.
+    With `user_id` it runs scoped to that user, see scope_to_user.
 
-            merchant_name TEXT NOT NULL,
-            merchant_address TEXT NULL,
-            merchant_phone TEXT NULL,
-            merchant_website TEXT NULL,
-            merchant_tax_id TEXT NULL,
+    If the connection dies underneath us (server restart, idle timeout, network
+    blip) the pool throws it away and the operation is retried on a fresh one.
+    """
+    db_pool = await get_db_pool()
+
+    with telemetry.timed("db", name) as attributes:
+        for attempt in range(1, RECONNECT_ATTEMPTS + 1):
+            attributes["attempts"] = attempt
+            conn = None
+            try:
+                async with db_pool.connection() as conn:
+                    if user_id is not None:
+                        await scope_to_user(conn, user_id)
+                    return await operation(conn)
+            except OperationalError:
+                # Only a dead connection is worth a retry, timeouts and pool
+                # exhaustion would just fail again
+                if conn is None or not conn.broken or attempt == RECONNECT_ATTEMPTS:
+                    raise
+
+
+def load_migrations() -> list[tuple[int, str, str]]:
+    """
+    Migrations are plain SQL files named `<version>_<name>.sql`, applied in
+    version order. Never edit one that has shipped, add a new file instead.
+    """
+    migrations = []
+    for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        version, name = path.stem.split("_", 1)
+        migrations.append((int(version), name, path.read_text()))
 
-            summary_subtotal NUMERIC(10, 2) NOT NULL,
-            summary_discount_amount NUMERIC(10, 2) NULL,
-            summary_tax_amount NUMERIC(10, 2) NULL,
-            summary_shipping_amount NUMERIC(10, 2) NULL,
-            summary_total_amount NUMERIC(10, 2) NOT NULL,
-            summary_amount_paid NUMERIC(10, 2) NULL,
-            summary_change_due NUMERIC(10, 2) NULL,
+    return migrations
 
-            payment_method TEXT NULL,
-            payment_card_type TEXT NULL,
-            payment_transaction_id TEXT NULL,
 
-            notes TEXT NULL
-        );
-    """)
+async def applied_migrations(conn: AsyncConnection) -> set[int]:
+    """Versions recorded in schema_migrations, none on a fresh database."""
+    cur = await conn.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    if not (await cur.fetchone())[0]:
+        return set()
 
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS spending_items (
-            id SERIAL PRIMARY KEY,
-            spending_id INTEGER NOT NULL,
-            description TEXT NOT NULL,
-            quantity NUMERIC(10, 2) NOT NULL,
-            unit_price NUMERIC(10, 2) NOT NULL,
-            total NUMERIC(10, 2) NOT NULL,
+    cur = await conn.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in await cur.fetchall()}
 
-            CONSTRAINT fk_spending
-                FOREIGN KEY (spending_id)
-                REFERENCES spendings (id)
-                ON DELETE CASCADE
-        );
-    """)
 
-    conn.commit()
+async def migrate(target_version: int | None = None) -> int:
+    """
+    Apply every migration newer than the database's schema version, up to
+    `target_version` when given, and return how many were applied. All
+    pending migrations run in one transaction, so a failing one leaves the
+    schema untouched.
+    """
+    db_pool = await get_db_pool()
+
+    def pending(applied_versions: set[int]) -> list[tuple[int, str, str]]:
+        return [
+            (version, name, sql)
+            for version, name, sql in load_migrations()
+            if version not in applied_versions
+            and (target_version is None or version <= target_version)
+        ]
+
+    async with db_pool.connection() as conn:
+        # Most starts find the schema up to date, they get away with a read
+        # instead of taking the lock
+        if not pending(await applied_migrations(conn)):
+            return 0
+
+        # Serialize concurrent deploys, the lock is released on commit
+        await conn.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        """)
+
+        migrations = pending(await applied_migrations(conn))
+        for version, name, sql in migrations:
+            print(f"Applying migration {version:04d}_{name}")
+            await conn.execute(sql)
+            await conn.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (version, name),
+            )
 
+    global catalog
+    catalog = None
+
+    return len(migrations)
+
+
+async def get_catalog() -> dict[str, dict[str, str]]:
+    """Tables and columns generated queries may use, i.e. what migrate() created."""
+    global catalog
+
+    if catalog is None:
+        async def load(conn: AsyncConnection) -> dict[str, dict[str, str]]:
+            cur = await conn.execute("""
+                SELECT table_name, column_name, data_type
+                FROM information_schema.columns
+                WHERE table_schema = 'public'
+                  -- Bookkeeping of migrate() and the analytics copy
+                  AND table_name NOT IN ('schema_migrations', 'spending_changes')
+                  -- Searched through search_spending(), not directly
+                  AND data_type <> 'tsvector'
+                ORDER BY table_name, ordinal_position
+            """)
+            tables: dict[str, dict[str, str]] = {}
+            for table, column, data_type in await cur.fetchall():
+                tables.setdefault(table, {})[column] = data_type
+            return tables
+
+        catalog = await run_with_reconnect(load, name="load_catalog")
+
+    return catalog
+
+
+# Header and items go out as a single statement: the CTE inserts the spending
+# row and fans the item arrays out with unnest(), so a receipt costs one round
+# trip no matter how many lines it has. A receipt that is already saved
+# (idx_spendings_fingerprint) inserts nothing and returns no id. The columns
+# are the records ones, see receipt_sql().
+INSERT_RECEIPT_SQL = """
+WITH new_spending AS (
+    INSERT INTO spendings ({spending_columns})
+    VALUES ({spending_values})
+    ON CONFLICT DO NOTHING
+    RETURNING id
+), new_items AS (
+    INSERT INTO spending_items (spending_id, {item_columns})
+    SELECT new_spending.id, {item_columns}
+    FROM new_spending, unnest({item_arrays}) AS item ({item_columns})
+)
+SELECT id FROM new_spending;
+"""
+
+# Element type of the item arrays, numeric unless listed
+ITEM_ARRAY_TYPES = {"description": "text"}
+
+
+@functools.cache
+def receipt_sql() -> str:
+    """INSERT_RECEIPT_SQL for records.SPENDING_COLUMNS and records.ITEM_COLUMNS."""
+    return INSERT_RECEIPT_SQL.format(
+        spending_columns=", ".join(records.SPENDING_COLUMNS),
+        spending_values=", ".join(["%s"] * len(records.SPENDING_COLUMNS)),
+        item_columns=", ".join(records.ITEM_COLUMNS),
+        item_arrays=", ".join(
+            f"%s::{ITEM_ARRAY_TYPES.get(column, 'numeric')}[]" for column in records.ITEM_COLUMNS
+        ),
+    )
+
+
+def spending_values(
+    spending_data: "SpendingAgentOutput", ingest_key: str | None = None
+) -> tuple:
+    """Values for records.SPENDING_COLUMNS, rate_cache has to have loaded the currency."""
+    return records.spending_row(
+        spending_data,
+        rate_cache.to_base(
+            spending_data.summary_total_amount,
+            spending_data.currency,
+            spending_data.transaction_date,
+        ),
+        ingest_key,
+    )
+
+
+def receipt_values(
+    spending_data: "SpendingAgentOutput", ingest_key: str | None = None
+) -> tuple:
+    """Parameters of receipt_sql(), the item arrays after the spending's values."""
+    return (
+        *spending_values(spending_data, ingest_key),
+        *records.item_columns(spending_data.items),
+    )
+
+
+async def insert_spendings(
+    conn: AsyncConnection,
+    spendings: list["SpendingAgentOutput"],
+    ingest_keys: list[str] | None = None,
+) -> list[int | None]:
+    """
+    Insert receipts with their items on `conn` and return the new spending
+    ids, None for the receipts that were already saved. `ingest_keys` are
+    the ingest queue's keys of the receipts, a receipt saved again under its
+    key is skipped like a duplicate.
 
-def save_spending(tool_context: ToolContext):
+    `executemany` pipelines the statements, so a whole batch of receipts is
+    flushed to the server together instead of waiting on each one.
     """
-    Use this tool to save user spending into database. No need to pass the parameter, just pass the context, it will read it from there
+    if not spendings:
+        return []
+
+    await rate_cache.load(conn, {spending.currency for spending in spendings})
+    async with conn.cursor() as cursor:
+        await cursor.executemany(
+            receipt_sql(),
+            [
+                receipt_values(spending_data, ingest_key)
+                for spending_data, ingest_key in zip(
+                    spendings, ingest_keys or [None] * len(spendings)
+                )
+            ],
+            returning=True,
+        )
+
+        inserted_ids = []
+        while True:
+            row = await cursor.fetchone()
+            inserted_ids.append(row[0] if row else None)
+            if not cursor.nextset():
+                break
+
+    return inserted_ids
+
+
+async def copy_spendings(
+    conn: AsyncConnection, spendings: list["SpendingAgentOutput"]
+) -> list[int | None]:
+    """
+    Load a large batch of spendings on `conn` with COPY and return their ids,
+    None for the spendings that were already saved.
+
+    Ids are reserved from the serial sequence up front so items can be linked
+    to their parent without a RETURNING round trip per row. COPY cannot skip
+    conflicting rows, so the batch is copied into temporary tables first and
+    moved over with one INSERT ... ON CONFLICT DO NOTHING.
+    """
+    if not spendings:
+        return []
+
+    columns = ", ".join(records.SPENDING_COLUMNS)
+    item_columns = ", ".join(records.ITEM_COLUMNS)
+
+    await rate_cache.load(conn, {spending.currency for spending in spendings})
+    async with conn.cursor() as cursor:
+        await cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence('spendings', 'id')) FROM generate_series(1, %s)",
+            (len(spendings),),
+        )
+        spending_ids = [row[0] for row in await cursor.fetchall()]
+
+        await cursor.execute(f"""
+            CREATE TEMPORARY TABLE staged_spendings ON COMMIT DROP AS
+            SELECT id, {columns} FROM spendings WITH NO DATA
+        """)
+        await cursor.execute(f"""
+            CREATE TEMPORARY TABLE staged_spending_items ON COMMIT DROP AS
+            SELECT spending_id, {item_columns} FROM spending_items WITH NO DATA
+        """)
+
+        async with cursor.copy(
+            f"COPY staged_spendings (id, {columns}) FROM STDIN"
+        ) as copy:
+            for spending_id, spending_data in zip(spending_ids, spendings):
+                await copy.write_row((spending_id, *spending_values(spending_data)))
+
+        async with cursor.copy("COPY staged_spending_items FROM STDIN") as copy:
+            for spending_id, spending_data in zip(spending_ids, spendings):
+                for item in spending_data.items:
+                    await copy.write_row((spending_id, *records.item_row(item)))
+
+        await cursor.execute(f"""
+            WITH new_spendings AS (
+                INSERT INTO spendings (id, {columns})
+                SELECT id, {columns} FROM staged_spendings
+                ON CONFLICT DO NOTHING
+                RETURNING id
+            ), new_items AS (
+                INSERT INTO spending_items (spending_id, {item_columns})
+                SELECT item.spending_id, {item_columns}
+                FROM staged_spending_items AS item
+                JOIN new_spendings ON new_spendings.id = item.spending_id
+            )
+            SELECT id FROM new_spendings
+        """)
+        inserted = {row[0] for row in await cursor.fetchall()}
+
+    return [spending_id if spending_id in inserted else None for spending_id in spending_ids]
+
+
+async def save_spendings(
+    spendings: list["SpendingAgentOutput"],
+    user_id: str,
+    ingest_keys: list[str] | None = None,
+) -> list[int | None]:
+    """
+    Save a batch of already validated spendings of `user_id` in one
+    transaction, e.g. the rows of an imported bank statement. Returns the
+    generated spending ids, None for duplicates of spendings already saved.
+    The ingest queue passes its records' `ingest_keys`, so a batch it saves
+    twice is only saved once.
+    """
+    spending_ids = await run_with_reconnect(
+        lambda conn: insert_spendings(conn, spendings, ingest_keys),
+        name="insert_spendings",
+        user_id=user_id,
+    )
+    query_cache.bump(*SPENDING_TABLES, scope=user_id)
+
+    return spending_ids
+
+
+async def load_spendings(
+    spendings: list["SpendingAgentOutput"], user_id: str
+) -> list[int | None]:
+    """
+    COPY counterpart of save_spendings for large imports, one transaction per
+    call. Returns the generated spending ids, None for duplicates.
+    """
+    spending_ids = await run_with_reconnect(
+        lambda conn: copy_spendings(conn, spendings),
+        name="copy_spendings",
+        user_id=user_id,
+    )
+    query_cache.bump(*SPENDING_TABLES, scope=user_id)
+
+    return spending_ids
+
+
+async def queue_spendings(spendings: list["SpendingAgentOutput"], user_id: str) -> dict:
+    """
+    save_spending with INGEST_QUEUE_PATH set: journal the spendings, let the
+    ingest queue's worker save them, and answer without waiting for Postgres.
+    """
+    try:
+        queued = await ingest_queue.enqueue(spendings, user_id)
+    except sqlite3.Error as error:
+        return {
+            "state": "error",
+            "result": f"Error while queueing spending data: {error}",
+        }
+
+    ingest_queue.start_worker(save_spendings)
+    result = f"{queued} spendings accepted, they are saved in the background"
+    if queued < len(spendings):
+        result += f", {len(spendings) - queued} were already waiting to be saved"
+    return {"state": "success", "result": result}
+
+
+def resume_ingest_queue(callback_context: "ReadonlyContext"):
+    """
+    Before agent callback starting the ingest queue's worker, so spendings an
+    earlier process left queued get saved without waiting for a new one.
+    """
+    if ingest_queue.enabled():
+        ingest_queue.start_worker(save_spendings)
+
+
+# State key listing the per-document keys extract_spendings stored its
+# results under, cleared once they are saved
+EXTRACTED_SPENDING_KEYS = "extracted_spending_keys"
+
+
+async def save_extracted_spendings(tool_context: "ToolContext", keys: list[str]) -> dict:
+    """Save every spending extract_spendings stored, in one transaction."""
+    try:
+        spendings = records.SPENDINGS.validate_python([tool_context.state.get(key) for key in keys])
+    except ValidationError as error:
+        failed = {detail["loc"][0] for detail in error.errors()}
+        invalid = [keys[index] for index in sorted(failed)]
+        return {
+            "state": "error",
+            "result": f"spending data validation failed for {', '.join(invalid)}, retry extract_spendings for those documents",
+        }
+
+    if ingest_queue.enabled():
+        response = await queue_spendings(spendings, context_user_id(tool_context))
+        if response["state"] == "success":
+            tool_context.state[EXTRACTED_SPENDING_KEYS] = None
+        return response
+
+    try:
+        spending_ids = await save_spendings(spendings, context_user_id(tool_context))
+    except (Exception, DBError) as error:
+        return {
+            "state": "error",
+            "result": f"Error while saving spending data to PostgreSQL: {error}",
+        }
+
+    tool_context.state[EXTRACTED_SPENDING_KEYS] = None
+    duplicates = spending_ids.count(None)
+    return {
+        "state": "success",
+        "result": f"{len(spendings) - duplicates} spendings saved succesfully, {duplicates} were already saved before",
+    }
+
+
+async def save_spending(tool_context: "ToolContext"):
+    """
+    Use this tool to save user spending into database. No need to pass the parameter, just pass the context, it will read it from there. After extract_spendings it saves all of the extracted spendings at once
 
     Args:
         tool_context: The ADK tool context.
     """
 
-    get_db_conn()
+    extracted_keys = tool_context.state.get(EXTRACTED_SPENDING_KEYS)
+    if extracted_keys:
+        return await save_extracted_spendings(tool_context, extracted_keys)
 
     structured_spending = tool_context.state.get("structured_spending")
     if structured_spending is None:
@@ -104,121 +576,227 @@ def save_spending(tool_context: ToolContext):
         }
 
     try:
-        spending_data = SpendingAgentOutput.model_validate(structured_spending)
+        spending_data = records.SPENDING.validate_python(structured_spending)
     except ValidationError as e:
         return {
             "state": "error",
             "result": f"spending data validation failed with error {e.title}, retry spend_extractor_agent tool call",
         }
 
-    global conn
-    cursor = conn.cursor()
+    if ingest_queue.enabled():
+        return await queue_spendings([spending_data], context_user_id(tool_context))
 
     try:
-        insert_spending_sql = """
-        INSERT INTO spendings (
-            type, currency, transaction_date, transaction_time, transaction_category,
-            merchant_name, merchant_address, merchant_phone, merchant_website, merchant_tax_id,
-            summary_subtotal, summary_discount_amount, summary_tax_amount, summary_shipping_amount,
-            summary_total_amount, summary_amount_paid, summary_change_due,
-            payment_method, payment_card_type, payment_transaction_id, notes
-        ) VALUES (
-            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-        ) RETURNING id;
-        """
-        spending_values = (
-            spending_data.type,
-            spending_data.currency,
-            spending_data.transaction_date,
-            spending_data.transaction_time,
-            spending_data.transaction_category,
-            spending_data.merchant_name,
-            spending_data.merchant_address,
-            spending_data.merchant_phone,
-            spending_data.merchant_website,
-            spending_data.merchant_tax_id,
-            spending_data.summary_subtotal,
-            spending_data.summary_discount_amount,
-            spending_data.summary_tax_amount,
-            spending_data.summary_shipping_amount,
-            spending_data.summary_total_amount,
-            spending_data.summary_amount_paid,
-            spending_data.summary_change_due,
-            spending_data.payment_method,
-            spending_data.payment_card_type,
-            spending_data.payment_transaction_id,
-            spending_data.notes,
-        )
-
-        cursor.execute(insert_spending_sql, spending_values)
-        inserted_spending_id = cursor.fetchone()[0]  # Get the generated ID
-
-        # SQL for inserting into spending_items table
-        insert_item_sql = """
-        INSERT INTO spending_items (
-            spending_id, description, quantity, unit_price, total
-        ) VALUES (%s, %s, %s, %s, %s);
-        """
-        for item in spending_data.items:
-            item_values = (
-                inserted_spending_id,
-                item.description,
-                item.quantity,
-                item.unit_price,
-                item.total,
-            )
-            cursor.execute(insert_item_sql, item_values)
-
-        conn.commit()  # Commit the transaction
+        (spending_id,) = await save_spendings([spending_data], context_user_id(tool_context))
+        if spending_id is None:
+            return {
+                "state": "success",
+                "result": "this spending was already saved before, it was not saved again",
+            }
         return {"state": "success", "result": "spending saved succesfully"}
 
     except (Exception, DBError) as error:
-        if conn:
-            conn.rollback()  # Rollback in case of error
         return {
             "state": "error",
             "result": f"Error while saving spending data to PostgreSQL: {error}",
         }
-    finally:
-        if cursor:
-            cursor.close()
 
 
-def query_database(query: str, tool_context: ToolContext):
+@dataclass
+class QueryResult:
+    # JSON values only (records.json_rows), they go into session state as is
+    rows: list[dict]
+    # Rows the query produced in total, `rows` holds at most QUERY_MAX_ROWS of
+    # them. None when counting the remainder hit the statement timeout.
+    total_rows: int | None
+    truncated: bool
+
+
+async def fetch_query_result(conn: AsyncConnection, query: str) -> QueryResult:
+    """
+    Stream `query` through a server-side cursor, keeping at most QUERY_MAX_ROWS
+    rows or QUERY_MAX_BYTES of JSON, whichever comes first. Rows past the cap
+    are counted on the server but never sent over.
     """
-    Use this tool to query from the database.
+    await conn.execute(
+        "SELECT set_config('statement_timeout', %s, true)",
+        (str(QUERY_STATEMENT_TIMEOUT_MS),),
+    )
+
+    rows = []
+    result_bytes = 0
+    truncated = False
+
+    async with conn.cursor(name="query_database", row_factory=dict_row) as cur:
+        await cur.execute(query)
+
+        while not truncated:
+            batch = await cur.fetchmany(QUERY_FETCH_SIZE)
+            if not batch:
+                break
+
+            for row in batch:
+                row_bytes = len(records.encode_row(row))
+                if len(rows) >= QUERY_MAX_ROWS or result_bytes + row_bytes > QUERY_MAX_BYTES:
+                    truncated = True
+                    break
+
+                rows.append(row)
+                result_bytes += row_bytes
+
+        total_rows = len(rows)
+        if truncated:
+            # cur.rownumber is how far the server has sent us, MOVE counts the
+            # remainder without transferring it. Counting is best effort, the
+            # rows we already have are still worth answering from.
+            try:
+                async with conn.transaction():
+                    moved = await conn.execute(
+                        sql.SQL("MOVE FORWARD ALL IN {}").format(sql.Identifier(cur.name))
+                    )
+                total_rows = cur.rownumber + moved.rowcount
+            except QueryCanceled:
+                total_rows = None
+
+    return QueryResult(rows=records.json_rows(rows), total_rows=total_rows, truncated=truncated)
+
+
+def render_query(query: str, params: dict) -> str:
+    """`query` with its %(name)s parameters inlined as SQL literals."""
+    return query % {
+        key: sql.Literal(value).as_string() for key, value in params.items()
+    }
+
+
+async def fetch_template_result(
+    conn: AsyncConnection, query: str, params: dict
+) -> QueryResult:
+    """
+    Run one of our own parameterized queries as a prepared statement, so
+    repeated questions skip parsing and planning. Templates are aggregates or
+    LIMITed, there is nothing to stream.
+    """
+    await conn.execute(
+        "SELECT set_config('statement_timeout', %s, true)",
+        (str(QUERY_STATEMENT_TIMEOUT_MS),),
+    )
 
-    Args:
-        query: The SQL query to be executed into the database.
-        tool_context: The ADK tool context.
+    async with conn.cursor(row_factory=dict_row) as cur:
+        await cur.execute(query, params, prepare=True)
+        rows = await cur.fetchmany(QUERY_MAX_ROWS)
+        truncated = await cur.fetchone() is not None
+
+    return QueryResult(
+        rows=records.json_rows(rows),
+        total_rows=None if truncated else len(rows),
+        truncated=truncated,
+    )
+
+
+def cached_result(query: str, user_id: str) -> QueryResult | None:
+    """query_cache lookup, its outcome and the cache's counters go to telemetry."""
+    with telemetry.timed("cache", "query_cache") as attributes:
+        res = query_cache.get(query, scope=user_id)
+        attributes["hit"] = res is not None
+        attributes.update(query_cache.stats())
+
+    return res
+
+
+async def query_template(query: str, params: dict, user_id: str) -> QueryResult:
     """
-    get_db_conn()
+    Cached counterpart of fetch_template_result over the rows of `user_id`,
+    keyed on the rendered query.
+    """
+    rendered = render_query(query, params)
+
+    res = cached_result(rendered, user_id)
+    if res is None:
+        table_versions = query_cache.versions_for(rendered, scope=user_id)
+        res = await run_with_reconnect(
+            lambda conn: fetch_template_result(conn, query, params),
+            name="query_template",
+            user_id=user_id,
+        )
+        query_cache.put(rendered, res, table_versions, scope=user_id)
+
+    return res
+
+
+async def fetch_guarded_result(
+    conn: AsyncConnection, query: str, statement: "exp.Query"
+) -> QueryResult:
+    """fetch_query_result behind the planner cost check, `statement` is the parsed `query`."""
+    query, capped = await sql_guard.limit_cost(
+        conn, query, statement, QUERY_MAX_COST, QUERY_MAX_ROWS
+    )
+    res = await fetch_query_result(conn, query)
+    if capped and res.truncated:
+        # The LIMIT we added hides how many rows there really are
+        res.total_rows = None
+
+    return res
 
-    global conn
 
-    cur = conn.cursor(row_factory=dict_row)
+async def query_analytics(query: str, user_id: str) -> QueryResult | None:
+    """
+    Run `query` on the columnar analytics copy when it aggregates over
+    spendings and the copy is current. None means Postgres has to answer it:
+    a copy that is behind is exported in the background for the next query,
+    and DuckDB failing on Postgres SQL is not the query's fault.
+    """
+    if not analytics.enabled() or not analytics.is_analytical(query):
+        return None
+
+    if not await run_with_reconnect(analytics.is_current, name="analytics_watermark"):
+        analytics.export_soon(
+            lambda: run_with_reconnect(analytics.export, name="analytics_export")
+        )
+        return None
 
     try:
-        res = cur.execute(query).fetchall()
+        with telemetry.timed("db", "query_analytics"):
+            rows, total_rows, truncated = await analytics.fetch_rows(
+                query, user_id, QUERY_MAX_ROWS, QUERY_MAX_BYTES, QUERY_STATEMENT_TIMEOUT_MS / 1000
+            )
+    except Exception:
+        logger.warning("analytics query failed, running it on Postgres", exc_info=True)
+        return None
 
-        tool_context.state["sql_output"] = res
+    return QueryResult(rows=records.json_rows(rows), total_rows=total_rows, truncated=truncated)
 
-        return {
-            "state": "success",
-            "result": "data retrieved, you can call exit_loop tool now",
-        }
-    except Exception as e:
-        tool_context.state["sql_error"] = e
 
-        return {
-            "state": "error",
-            "result": f"query errored with message {e}",
-        }
+async def query_database(query: str, user_id: str) -> QueryResult:
+    """
+    Run a generated read query over the rows of `user_id` through the result
+    cache, on the analytics copy when query_analytics takes it. Queries
+    failing the SQL guard raise sql_guard.QueryRejected, database errors are
+    raised as is; the caller decides which ones are worth a retry.
+    """
+    statement = sql_guard.check_query(query, await get_catalog())
+
+    res = cached_result(query, user_id)
+    if res is None:
+        table_versions = query_cache.versions_for(query, scope=user_id)
+        res = await query_analytics(query, user_id)
+        if res is None:
+            res = await run_with_reconnect(
+                lambda conn: fetch_guarded_result(conn, query, statement),
+                name="query_database",
+                user_id=user_id,
+            )
+        query_cache.put(query, res, table_versions, scope=user_id)
+
+    return res
 
+
+async def main():
+    try:
+        if not await migrate():
+            print("Schema is up to date")
     finally:
-        cur.close()
+        await close_db_pool()
 
 
 if __name__ == "__main__":
-    get_db_conn()
-    migrate()
+    asyncio.run(main())
@@ -0,0 +1,287 @@
+"""
+Exchange rates for converting spendings into BASE_CURRENCY.
+
+Rates are loaded offline from a file into the fx_rates table, no rate API
+is called at save time. Two layouts are read:
+
+- long: `date,currency,rate` rows
+- wide: a `date` column and one column per currency, like the ECB's
+  eurofxref-hist.csv
+
+Either way a rate is how many units of the currency one unit of the file's
+--reference currency buys (EUR for the ECB). They are stored converted to
+BASE_CURRENCY, which the file has to quote as well.
+
+Saving a spending converts summary_total_amount with the latest rate on or
+before its transaction_date, at most FX_RATE_MAX_AGE_DAYS old. The rates of a
+currency are read into an in-process cache on first use. Loading a file
+fills in base_total_amount for every spending that had no rate yet.
+
+    cd src
+    python -m personal_accountant.tools.fx_rates eurofxref-hist.csv --reference EUR
+"""
+
+import argparse
+import asyncio
+import csv
+import os
+import time
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from psycopg import AsyncConnection
+
+BASE_CURRENCY = os.getenv("BASE_CURRENCY", "IDR").strip().upper()
+# A rate older than this does not convert a spending, it stays NULL until
+# newer rates are loaded
+FX_RATE_MAX_AGE_DAYS = int(os.getenv("FX_RATE_MAX_AGE_DAYS", "7"))
+# How long the rates of a currency are kept before they are read again, so
+# a file loaded by another process is picked up
+FX_CACHE_TTL_SECONDS = float(os.getenv("FX_CACHE_TTL_SECONDS", "3600"))
+
+CENT = Decimal("0.01")
+
+# Fills in base_total_amount from fx_rates with the same lookup as
+# RateCache.to_base. Only rows without one, unless every row is recomputed.
+BACKFILL_SQL = """
+UPDATE spendings AS s
+SET base_total_amount = converted.base_total_amount
+FROM (
+    SELECT
+        t.id,
+        round(t.summary_total_amount * (
+            CASE WHEN upper(trim(t.currency)) = %(base)s THEN 1 ELSE (
+                SELECT f.base_rate
+                FROM fx_rates AS f
+                WHERE f.base_currency = %(base)s
+                  AND f.currency = upper(trim(t.currency))
+                  AND f.rate_date <= t.transaction_date
+                  AND f.rate_date > t.transaction_date - %(max_age)s::integer
+                ORDER BY f.rate_date DESC
+                LIMIT 1
+            ) END
+        ), 2) AS base_total_amount
+    FROM spendings AS t
+    WHERE %(recompute)s OR t.base_total_amount IS NULL
+) AS converted
+WHERE s.id = converted.id
+  AND s.base_total_amount IS DISTINCT FROM converted.base_total_amount
+"""
+
+
+def normalize_currency(currency: str) -> str:
+    return currency.strip().upper()
+
+
+@dataclass
+class RateSeries:
+    loaded_at: float
+    dates: list[date]
+    rates: list[Decimal]
+
+
+class RateCache:
+    """Rates to BASE_CURRENCY per currency, sorted by date for bisecting."""
+
+    def __init__(self, base_currency: str, ttl_seconds: float):
+        self.base_currency = base_currency
+        self.ttl_seconds = ttl_seconds
+        self.series: dict[str, RateSeries] = {}
+
+    async def load(self, conn: AsyncConnection, currencies: Iterable[str]):
+        """Read the rates of `currencies` not cached yet, or cached too long ago."""
+        now = time.monotonic()
+        missing = {
+            currency
+            for currency in map(normalize_currency, currencies)
+            if currency != self.base_currency
+            and (
+                currency not in self.series
+                or now - self.series[currency].loaded_at > self.ttl_seconds
+            )
+        }
+        if not missing:
+            return
+
+        cur = await conn.execute(
+            """
+            SELECT currency, rate_date, base_rate
+            FROM fx_rates
+            WHERE base_currency = %s AND currency = ANY(%s)
+            ORDER BY currency, rate_date
+            """,
+            (self.base_currency, list(missing)),
+        )
+        loaded = {currency: RateSeries(now, [], []) for currency in missing}
+        for currency, rate_date, base_rate in await cur.fetchall():
+            loaded[currency].dates.append(rate_date)
+            loaded[currency].rates.append(base_rate)
+
+        self.series.update(loaded)
+
+    def rate(self, currency: str, on: date) -> Optional[Decimal]:
+        """Latest cached rate of `currency` on or before `on`, if recent enough."""
+        currency = normalize_currency(currency)
+        if currency == self.base_currency:
+            return Decimal(1)
+
+        series = self.series.get(currency)
+        if series is None:
+            return None
+
+        index = bisect_right(series.dates, on) - 1
+        if index < 0 or on - series.dates[index] >= timedelta(days=FX_RATE_MAX_AGE_DAYS):
+            return None
+
+        return series.rates[index]
+
+    def to_base(self, amount: Decimal | float, currency: str, on: str | date) -> Optional[Decimal]:
+        """`amount` of `currency` on `on` in the base currency, rounded to cents."""
+        try:
+            on = on if isinstance(on, date) else date.fromisoformat(on)
+        except ValueError:
+            return None
+
+        rate = self.rate(currency, on)
+        if rate is None:
+            return None
+
+        if not isinstance(amount, Decimal):
+            amount = Decimal(str(amount))
+        return (amount * rate).quantize(CENT)
+
+    def clear(self):
+        self.series.clear()
+
+
+rate_cache = RateCache(BASE_CURRENCY, FX_CACHE_TTL_SECONDS)
+
+
+def parse_rate(value: str) -> Optional[Decimal]:
+    try:
+        rate = Decimal(value.strip())
+    except InvalidOperation:
+        # The ECB writes N/A for currencies it did not quote that day
+        return None
+
+    return rate if rate > 0 else None
+
+
+def read_rates(path: Path, reference: str) -> Iterator[tuple[date, str, Decimal]]:
+    """(date, currency, units of currency per unit of `reference`) from a long or wide CSV."""
+    from personal_accountant.tools.importer import parse_date
+
+    with path.open(newline="", encoding="utf-8-sig") as file:
+        reader = csv.DictReader(file)
+        headers = {header.strip().lower(): header for header in reader.fieldnames or [] if header}
+        if "date" not in headers:
+            raise ValueError(f"{path} needs a date column")
+
+        long_format = "currency" in headers and "rate" in headers
+        for record in reader:
+            rate_date = date.fromisoformat(parse_date(record[headers["date"]]))
+            yield rate_date, reference, Decimal(1)
+
+            if long_format:
+                pairs = [(record[headers["currency"]], record[headers["rate"]])]
+            else:
+                pairs = [
+                    (header, record[header] or "")
+                    for key, header in headers.items()
+                    if key != "date"
+                ]
+
+            for currency, value in pairs:
+                rate = parse_rate(value)
+                if rate is not None:
+                    yield rate_date, normalize_currency(currency), rate
+
+
+def base_rates(
+    rates: Iterable[tuple[date, str, Decimal]], base_currency: str
+) -> Iterator[tuple[date, str, Decimal]]:
+    """
+    Cross the rates of each date through `base_currency`: one unit of a
+    currency is worth base / rate units of it. Dates the file has no base
+    rate for are skipped.
+    """
+    by_date: dict[date, dict[str, Decimal]] = {}
+    for rate_date, currency, rate in rates:
+        by_date.setdefault(rate_date, {})[currency] = rate
+
+    for rate_date, day_rates in by_date.items():
+        base = day_rates.get(base_currency)
+        if base is None:
+            continue
+
+        for currency, rate in day_rates.items():
+            if currency != base_currency:
+                yield rate_date, currency, base / rate
+
+
+async def store_rates(
+    conn: AsyncConnection, rates: Iterable[tuple[date, str, Decimal]], base_currency: str
+) -> int:
+    """Upsert `rates` for `base_currency` with COPY, returning how many were stored."""
+    async with conn.cursor() as cursor:
+        await cursor.execute("""
+            CREATE TEMPORARY TABLE staged_fx_rates ON COMMIT DROP AS
+            SELECT currency, rate_date, base_rate FROM fx_rates WITH NO DATA
+        """)
+        async with cursor.copy(
+            "COPY staged_fx_rates (rate_date, currency, base_rate) FROM STDIN"
+        ) as copy:
+            for row in rates:
+                await copy.write_row(row)
+
+        await cursor.execute(
+            """
+            INSERT INTO fx_rates (base_currency, currency, rate_date, base_rate)
+            SELECT %s, currency, rate_date, base_rate FROM staged_fx_rates
+            ON CONFLICT (base_currency, currency, rate_date) DO UPDATE
+            SET base_rate = EXCLUDED.base_rate
+            """,
+            (base_currency,),
+        )
+        return cursor.rowcount
+
+
+async def backfill(conn: AsyncConnection, base_currency: str, recompute: bool = False) -> int:
+    """Set base_total_amount from fx_rates, returning the spendings changed."""
+    cur = await conn.execute(
+        BACKFILL_SQL,
+        {"base": base_currency, "max_age": FX_RATE_MAX_AGE_DAYS, "recompute": recompute},
+    )
+    return cur.rowcount
+
+
+async def main():
+    from personal_accountant.tools import database
+
+    parser = argparse.ArgumentParser(description="Load exchange rates and convert spendings to BASE_CURRENCY")
+    parser.add_argument("rates", type=Path, nargs="?", help="Long or wide CSV of rates, omit to only convert spendings")
+    parser.add_argument("--reference", default="EUR", help="Currency the file's rates are quoted against")
+    parser.add_argument("--recompute", action="store_true", help="Convert every spending again, e.g. after changing BASE_CURRENCY")
+    args = parser.parse_args()
+
+    async def load(conn: AsyncConnection) -> tuple[int, int]:
+        stored = 0
+        if args.rates:
+            rates = read_rates(args.rates, normalize_currency(args.reference))
+            stored = await store_rates(conn, base_rates(rates, BASE_CURRENCY), BASE_CURRENCY)
+        return stored, await backfill(conn, BASE_CURRENCY, args.recompute)
+
+    try:
+        await database.migrate()
+        stored, converted = await database.run_with_reconnect(load, name="load_fx_rates")
+        print(f"{stored} rates to {BASE_CURRENCY} stored, {converted} spendings converted")
+    finally:
+        await database.close_db_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,493 @@
+"""
+Bulk import of bank statements (CSV, OFX or JSON) straight into the spendings
+table, without running every row through spend_extractor_agent.
+
+Rows are streamed from the file, mapped onto SpendingAgentOutput, categorized
+with keyword rules and loaded in chunks with COPY. Only the rows the rules
+cannot categorize are sent to the model, one batched call per chunk. Rows
+that cannot be read are reported with their line and skipped.
+
+    cd src
+    python -m personal_accountant.tools.importer statement.csv --currency IDR --user alice
+"""
+
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import re
+import sys
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from itertools import batched
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from google import genai
+from google.genai import types
+
+from personal_accountant import model
+from personal_accountant.tools import database
+from personal_accountant.types.type import SpendingAgentOutput
+
+CATEGORY_RULES: dict[str, tuple[str, ...]] = {
+    "Dining": (
+        "restaurant", "resto", "cafe", "coffee", "kopi", "starbucks", "mcdonald",
+        "kfc", "pizza", "bakery", "gofood", "grabfood", "shopeefood", "warung",
+    ),
+    "Groceries": (
+        "supermarket", "grocery", "indomaret", "alfamart", "superindo",
+        "hypermart", "lotte mart", "ranch market", "carrefour", "walmart",
+    ),
+    "Transport": (
+        "gojek", "goride", "grab", "uber", "taxi", "bluebird", "krl", "mrt",
+        "transjakarta", "pertamina", "shell", "parking", "parkir", "toll", "tol ",
+    ),
+    "Travel": (
+        "airline", "garuda", "lion air", "airasia", "hotel", "airbnb",
+        "traveloka", "tiket.com", "booking.com", "agoda",
+    ),
+    "Utilities": (
+        "pln", "electric", "listrik", "pdam", "water", "indihome", "telkom",
+        "internet", "pulsa", "telkomsel", "xl axiata",
+    ),
+    "Shopping": (
+        "tokopedia", "shopee", "lazada", "blibli", "amazon", "zalora", "ikea",
+    ),
+    "Subscriptions": (
+        "netflix", "spotify", "youtube", "disney", "apple.com", "google storage",
+        "icloud", "chatgpt",
+    ),
+    "Health": (
+        "pharmacy", "apotek", "kimia farma", "hospital", "rumah sakit", "clinic",
+        "klinik", "halodoc", "dental",
+    ),
+}
+
+CATEGORIES = (*CATEGORY_RULES, "Other")
+
+CATEGORY_PATTERNS = {
+    category: re.compile("|".join(re.escape(keyword) for keyword in keywords))
+    for category, keywords in CATEGORY_RULES.items()
+}
+
+CSV_COLUMN_ALIASES = {
+    "date": ("date", "transaction_date", "posted", "posting date", "tanggal"),
+    "description": (
+        "description", "memo", "narrative", "details", "payee", "keterangan",
+    ),
+    "amount": ("amount", "jumlah", "nominal"),
+    "debit": ("debit", "withdrawal", "money out"),
+    "currency": ("currency", "mata uang"),
+    "transaction_id": ("transaction_id", "reference", "ref", "fitid", "id"),
+}
+
+DATE_FORMATS = ("%Y-%m-%d", "%Y%m%d", "%d/%m/%Y", "%d-%m-%Y", "%m/%d/%Y", "%d %b %Y")
+
+
+# Markers of the side of an amount, as Indonesian statements print them
+DEBIT_MARKERS = ("DB", "DR", "D")
+CREDIT_MARKERS = ("CR", "K")
+
+# What is left of an amount once its sign, markers and currency are gone
+AMOUNT_DIGITS = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+@dataclass
+class StatementRow:
+    date: str
+    description: str
+    # Negative for money going out
+    amount: Decimal
+    currency: Optional[str] = None
+    transaction_id: Optional[str] = None
+
+
+@dataclass
+class InvalidRow:
+    """A row of the statement that could not be read, `line` is 1-based."""
+
+    line: int
+    error: str
+
+
+def parse_date(value: str) -> str:
+    value = value.strip()
+
+    # Also accept timestamps by trying the leading date part on its own
+    for candidate in (value, value[:10]):
+        for date_format in DATE_FORMATS:
+            try:
+                return datetime.strptime(candidate, date_format).strftime("%Y-%m-%d")
+            except ValueError:
+                continue
+
+    raise ValueError(f"unrecognized date {value!r}")
+
+
+def parse_amount(value: str) -> Decimal:
+    """
+    A statement amount, negative for a debit: -12.50, (12.50) and 12.50 DB
+    all are. Currency codes and symbols around it are ignored. Thousands may
+    be grouped with either separator, 1,234.56 and 1.234,56 are the same
+    amount. A lone separator followed by exactly three digits groups
+    thousands, so 50.000 and 50,000 are both fifty thousand.
+    """
+    text = value.strip().upper().replace(" ", "")
+    negative = False
+    if text.startswith("(") and text.endswith(")"):
+        negative, text = True, text[1:-1]
+
+    for marker in DEBIT_MARKERS + CREDIT_MARKERS:
+        if text.endswith(marker) and text[: -len(marker)][-1:].isdigit():
+            negative, text = negative or marker in DEBIT_MARKERS, text[: -len(marker)]
+            break
+
+    match = AMOUNT_DIGITS.search(text)
+    # Whatever surrounds the number may only be a sign and the currency
+    if match is None or any(char.isdigit() for char in text[: match.start()] + text[match.end():]):
+        raise ValueError(f"unrecognized amount {value!r}")
+    negative = negative or "-" in text[: match.start()] or text.endswith("-")
+
+    number = match.group()
+    separators = [char for char in number if char in ".,"]
+    if len(set(separators)) == 2:
+        # The last separator is the decimal one
+        decimal = separators[-1]
+        thousands = "," if decimal == "." else "."
+        if separators.count(decimal) > 1:
+            raise ValueError(f"unrecognized amount {value!r}")
+        number = number.replace(thousands, "").replace(decimal, ".")
+    elif len(separators) > 1 or (separators and len(number) - number.index(separators[0]) == 4):
+        number = number.replace(",", "").replace(".", "")
+    else:
+        number = number.replace(",", ".")
+
+    amount = Decimal(number)
+    return -amount if negative else amount
+
+
+def read_csv(path: Path, positive_debits: bool = False) -> Iterator[StatementRow | InvalidRow]:
+    with path.open(newline="", encoding="utf-8-sig") as file:
+        reader = csv.DictReader(file)
+        headers = {header.strip().lower(): header for header in reader.fieldnames or []}
+        columns = {
+            field: next((headers[alias] for alias in aliases if alias in headers), None)
+            for field, aliases in CSV_COLUMN_ALIASES.items()
+        }
+        if columns["date"] is None or columns["description"] is None:
+            raise ValueError(f"{path} needs a date and a description column")
+
+        if columns["debit"] is None and columns["amount"] is None:
+            raise ValueError(f"{path} needs an amount or debit column")
+
+        for record in reader:
+            try:
+                if columns["debit"] is not None:
+                    debit = (record[columns["debit"]] or "").strip()
+                    if not debit:
+                        continue
+                    amount = -abs(parse_amount(debit))
+                else:
+                    amount = parse_amount(record[columns["amount"]] or "")
+                    amount = -amount if positive_debits else amount
+
+                yield StatementRow(
+                    date=parse_date(record[columns["date"]] or ""),
+                    description=(record[columns["description"]] or "").strip(),
+                    amount=amount,
+                    currency=record[columns["currency"]] if columns["currency"] else None,
+                    transaction_id=(
+                        record[columns["transaction_id"]] if columns["transaction_id"] else None
+                    ),
+                )
+            except ValueError as error:
+                yield InvalidRow(reader.line_num, str(error))
+
+
+def read_json(path: Path, positive_debits: bool = False) -> Iterator[StatementRow | InvalidRow]:
+    """
+    Reads either a JSON array or JSON lines, one transaction object each.
+    Invalid rows of an array are numbered by their position in it.
+    """
+    with path.open(encoding="utf-8") as file:
+        first_char = file.read(1)
+        file.seek(0)
+
+        if first_char == "[":
+            records = enumerate(json.load(file), start=1)
+        else:
+            records = (
+                (line, json.loads(text))
+                for line, text in enumerate(file, start=1)
+                if text.strip()
+            )
+
+        for line, record in records:
+            try:
+                amount = parse_amount(str(record["amount"]))
+                yield StatementRow(
+                    date=parse_date(str(record["date"])),
+                    description=str(record["description"]).strip(),
+                    amount=-amount if positive_debits else amount,
+                    currency=record.get("currency"),
+                    transaction_id=record.get("transaction_id") or record.get("id"),
+                )
+            except (ValueError, KeyError, TypeError, AttributeError) as error:
+                yield InvalidRow(line, f"{type(error).__name__}: {error}")
+
+
+OFX_TAG = re.compile(r"<(/?)([A-Z.]+)>([^<\r\n]*)")
+
+
+def read_ofx(path: Path, positive_debits: bool = False) -> Iterator[StatementRow | InvalidRow]:
+    """
+    Streams <STMTTRN> blocks from both SGML (OFX 1.x) and XML (OFX 2.x) files.
+    OFX amounts are signed by the standard, `positive_debits` does not apply.
+    """
+    currency = None
+    transaction: Optional[dict[str, str]] = None
+    transaction_line = 0
+
+    with path.open(encoding="utf-8", errors="replace") as file:
+        for line_number, line in enumerate(file, start=1):
+            for closing, tag, value in OFX_TAG.findall(line):
+                value = value.strip()
+                if tag == "CURDEF" and value:
+                    currency = value
+                elif tag == "STMTTRN" and not closing:
+                    transaction, transaction_line = {}, line_number
+                elif tag == "STMTTRN" and closing and transaction is not None:
+                    try:
+                        yield StatementRow(
+                            date=parse_date(transaction["DTPOSTED"][:8]),
+                            description=transaction.get("NAME") or transaction.get("MEMO", ""),
+                            amount=parse_amount(transaction["TRNAMT"]),
+                            currency=currency,
+                            transaction_id=transaction.get("FITID"),
+                        )
+                    except (ValueError, KeyError) as error:
+                        yield InvalidRow(transaction_line, f"{type(error).__name__}: {error}")
+                    transaction = None
+                elif transaction is not None and not closing and value:
+                    transaction[tag] = value
+
+
+READERS = {
+    ".csv": read_csv,
+    ".json": read_json,
+    ".jsonl": read_json,
+    ".ofx": read_ofx,
+    ".qfx": read_ofx,
+}
+
+
+def read_statement(
+    path: Path, positive_debits: bool = False
+) -> Iterator[StatementRow | InvalidRow]:
+    """
+    The rows of the statement at `path`. Amounts are negative for money going
+    out, unless `positive_debits` says the statement's single amount column
+    has debits positive and credits negative.
+    """
+    reader = READERS.get(path.suffix.lower())
+    if reader is None:
+        raise ValueError(f"unsupported statement format {path.suffix!r}")
+
+    return reader(path, positive_debits)
+
+
+def classify(description: str) -> Optional[str]:
+    lowered = description.lower()
+    for category, pattern in CATEGORY_PATTERNS.items():
+        if pattern.search(lowered):
+            return category
+
+    return None
+
+
+def statement_transaction_id(row: StatementRow, occurrence: int) -> str:
+    """
+    Stand-in for the transaction id of a row the bank gave none: the
+    `occurrence`th row with this date, description and amount in the
+    statement. Importing the statement again gives every row the same id,
+    so it is skipped, while two identical purchases on one day stay two.
+    """
+    digest = hashlib.sha256(
+        json.dumps([row.date, row.description, str(row.amount), occurrence]).encode()
+    )
+    return f"statement:{digest.hexdigest()[:16]}"
+
+
+def to_spending(row: StatementRow, default_currency: str) -> SpendingAgentOutput:
+    amount = abs(row.amount)
+
+    return SpendingAgentOutput(
+        type="bank statement",
+        currency=(row.currency or default_currency).upper(),
+        transaction_date=row.date,
+        transaction_category=classify(row.description),
+        merchant_name=row.description or "Unknown",
+        summary_subtotal=amount,
+        summary_total_amount=amount,
+        summary_amount_paid=amount,
+        payment_method="Bank Transfer",
+        payment_transaction_id=row.transaction_id,
+        items=[],
+    )
+
+
+async def classify_with_model(
+    client: genai.Client, descriptions: list[str]
+) -> dict[str, str]:
+    """One model call for every description the keyword rules could not place."""
+    response = await client.aio.models.generate_content(
+        model=model.LIGHT_MODEL,
+        contents=(
+            "Categorize each bank statement line into exactly one of "
+            f"{', '.join(CATEGORIES)}. Answer with a JSON object mapping "
+            "every line, verbatim, to its category.\n"
+            + json.dumps(descriptions, ensure_ascii=False)
+        ),
+        config=types.GenerateContentConfig(
+            response_mime_type="application/json", temperature=0
+        ),
+    )
+
+    categories = json.loads(response.text or "{}")
+    return {
+        description: category
+        for description, category in categories.items()
+        if category in CATEGORIES
+    }
+
+
+async def import_statement(
+    rows: Iterable[StatementRow | InvalidRow],
+    default_currency: str,
+    user_id: str,
+    chunk_size: int = 1000,
+    client: Optional[genai.Client] = None,
+    invalid_rows: Optional[list[InvalidRow]] = None,
+) -> dict[str, int]:
+    """
+    Load statement rows into the ledger of `user_id` in chunks of
+    `chunk_size`, one COPY transaction per chunk. Credits are skipped, only
+    money going out is a spending, and so are rows already saved, e.g. when
+    a statement is imported twice. Rows without a transaction id get one
+    from statement_transaction_id() for that. Rows that could not be read
+    are counted and skipped, and collected in `invalid_rows` when it is
+    given.
+
+    Pass `client` to let the model categorize rows no rule matched, otherwise
+    they are saved without a category.
+    """
+    stats = {
+        "imported": 0,
+        "skipped": 0,
+        "invalid": 0,
+        "duplicates": 0,
+        "rule_classified": 0,
+        "model_classified": 0,
+    }
+
+    def spendings_out(rows: Iterable[StatementRow | InvalidRow]) -> Iterator[SpendingAgentOutput]:
+        occurrences: Counter[tuple] = Counter()
+        for row in rows:
+            if isinstance(row, InvalidRow):
+                stats["invalid"] += 1
+                if invalid_rows is not None:
+                    invalid_rows.append(row)
+                continue
+            if row.amount >= 0:
+                stats["skipped"] += 1
+                continue
+            if not row.transaction_id:
+                occurrences[row.date, row.description, row.amount] += 1
+                row.transaction_id = statement_transaction_id(
+                    row, occurrences[row.date, row.description, row.amount]
+                )
+            yield to_spending(row, default_currency)
+
+    for chunk in batched(spendings_out(rows), chunk_size):
+        chunk = list(chunk)
+        unclassified = {
+            spending.merchant_name
+            for spending in chunk
+            if spending.transaction_category is None
+        }
+        stats["rule_classified"] += sum(
+            spending.transaction_category is not None for spending in chunk
+        )
+
+        if client is not None and unclassified:
+            categories = await classify_with_model(client, sorted(unclassified))
+            for spending in chunk:
+                if spending.transaction_category is None:
+                    spending.transaction_category = categories.get(spending.merchant_name)
+                    stats["model_classified"] += spending.transaction_category is not None
+
+        spending_ids = await database.load_spendings(chunk, user_id)
+        duplicates = spending_ids.count(None)
+        stats["imported"] += len(chunk) - duplicates
+        stats["duplicates"] += duplicates
+
+    return stats
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Import a bank statement into the spendings table")
+    parser.add_argument("statement", type=Path, help="CSV, OFX/QFX, JSON or JSON lines file")
+    parser.add_argument("--currency", default="IDR", help="Currency for rows that do not carry one")
+    parser.add_argument(
+        "--user",
+        default=database.DEFAULT_USER_ID,
+        help="ADK user id whose spendings these are",
+    )
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument(
+        "--positive-debits",
+        action="store_true",
+        help="The statement's amount column lists money going out as positive numbers",
+    )
+    parser.add_argument(
+        "--no-model",
+        action="store_true",
+        help="Never call the model, rows no rule matches are saved uncategorized",
+    )
+    args = parser.parse_args()
+
+    client = None if args.no_model else genai.Client()
+    invalid_rows: list[InvalidRow] = []
+
+    try:
+        stats = await import_statement(
+            read_statement(args.statement, positive_debits=args.positive_debits),
+            default_currency=args.currency,
+            user_id=args.user,
+            chunk_size=args.chunk_size,
+            client=client,
+            invalid_rows=invalid_rows,
+        )
+    finally:
+        await database.close_db_pool()
+
+    for row in invalid_rows:
+        print(f"{args.statement}:{row.line}: {row.error}", file=sys.stderr)
+    print(
+        f"imported {stats['imported']} spendings ({stats['rule_classified']} categorized by rules, "
+        f"{stats['model_classified']} by the model), skipped {stats['skipped']} credits, "
+        f"{stats['invalid']} unreadable rows and {stats['duplicates']} already saved spendings"
+    )
+    if stats["skipped"] and not stats["imported"] and not stats["duplicates"]:
+        print(
+            "every row was a credit, pass --positive-debits if this statement lists "
+            "money going out as positive amounts"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
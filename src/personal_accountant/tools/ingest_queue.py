@@ -0,0 +1,351 @@
+"""
+Write-behind queue between save_spending and Postgres.
+
+With INGEST_QUEUE_PATH set, validated spendings are appended to a SQLite
+journal and save_spending answers as soon as they are on disk. A background
+worker drains the journal to Postgres in batches of up to INGEST_BATCH_SIZE,
+one save_spendings transaction per user, and removes what it saved. Postgres
+being slow or down no longer holds up the chat turn, and nothing has to be
+extracted again: the worker backs off and retries until it is back.
+
+Every record has an idempotency key over the fields of the spendings
+fingerprint (0008_narrow_spending_fingerprint), so queueing the same receipt
+twice keeps one record. Spendings with neither a time nor a transaction id
+have no fingerprint and get a random key, they are always queued as they
+are always saved. The key is saved with the spending
+(0011_add_spending_ingest_key), so replaying a batch that committed right
+before a crash or a lost answer saves nothing twice.
+
+A record Postgres rejects INGEST_MAX_ATTEMPTS times is parked in the journal
+instead of blocking the ones behind it. A record that no longer validates,
+e.g. after a change to the spending model, is parked right away.
+
+Depth, lag and flush throughput are in stats() and go to telemetry with
+every flush.
+
+    cd src
+    python -m personal_accountant.tools.ingest_queue --drain
+"""
+
+import argparse
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from psycopg import OperationalError
+from pydantic import ValidationError
+
+from personal_accountant import telemetry
+from personal_accountant.types.type import SpendingAgentOutput
+
+INGEST_QUEUE_PATH = os.getenv("INGEST_QUEUE_PATH", "")
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "100"))
+# A record Postgres rejected this many times is parked, see retry_parked()
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "5"))
+# Back off between these while Postgres is failing, doubling every time
+INGEST_RETRY_MIN_SECONDS = float(os.getenv("INGEST_RETRY_MIN_SECONDS", "0.5"))
+INGEST_RETRY_MAX_SECONDS = float(os.getenv("INGEST_RETRY_MAX_SECONDS", "30"))
+
+logger = logging.getLogger(__name__)
+
+# save_spendings, passed in by database so this module does not import it.
+# Takes the spendings, their owner and their idempotency keys.
+SaveSpendings = Callable[
+    [list[SpendingAgentOutput], str, list[str]], Awaitable[list[Optional[int]]]
+]
+
+
+def idempotency_key(spending: SpendingAgentOutput, user_id: str) -> str:
+    """
+    SHA-256 over the owner and the spendings fingerprint columns, a key of
+    its own for a spending the fingerprint does not cover.
+    """
+    if spending.transaction_time is None and spending.payment_transaction_id is None:
+        return uuid.uuid4().hex
+
+    fingerprint = [
+        user_id,
+        spending.merchant_name.lower(),
+        spending.transaction_date,
+        spending.transaction_time,
+        f"{spending.summary_total_amount:.2f}",
+        spending.payment_transaction_id,
+    ]
+    return hashlib.sha256(json.dumps(fingerprint).encode()).hexdigest()
+
+
+class IngestQueue:
+    def __init__(self, path: str, batch_size: int, max_attempts: int):
+        self.path = path
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+
+        self.connection: Optional[sqlite3.Connection] = None
+        self.lock = threading.Lock()
+        self.worker: Optional[asyncio.Task] = None
+        self.wakeup: Optional[asyncio.Event] = None
+
+        self.flushed = 0
+        self.flush_seconds = 0.0
+        self.retries = 0
+
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def get_conn(self) -> sqlite3.Connection:
+        if self.connection is not None:
+            return self.connection
+
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        # An acknowledged spending has to survive a crash, every commit is
+        # synced to disk
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = FULL")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                user_id TEXT NOT NULL,
+                spending TEXT NOT NULL,
+                enqueued_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT NULL
+            )
+        """)
+        self.connection = connection
+        return connection
+
+    def append(self, spendings: list[SpendingAgentOutput], user_id: str) -> int:
+        """Journal `spendings`, returning how many were not queued already."""
+        now = time.time()
+        rows = [
+            (idempotency_key(spending, user_id), user_id, spending.model_dump_json(), now)
+            for spending in spendings
+        ]
+        with self.lock:
+            conn = self.get_conn()
+            with conn:
+                before = conn.total_changes
+                conn.executemany(
+                    """
+                    INSERT OR IGNORE INTO ingest_queue (idempotency_key, user_id, spending, enqueued_at)
+                    VALUES (?, ?, ?, ?)
+                    """,
+                    rows,
+                )
+                return conn.total_changes - before
+
+    async def enqueue(self, spendings: list[SpendingAgentOutput], user_id: str) -> int:
+        """
+        Durably queue `spendings` of `user_id` and wake the worker. Returns
+        how many were queued, the rest were waiting in the queue already.
+        """
+        with telemetry.timed("queue", "ingest_enqueue", spendings=len(spendings)) as attributes:
+            queued = await asyncio.to_thread(self.append, spendings, user_id)
+            attributes.update(queued=queued, **await asyncio.to_thread(self.stats))
+
+        if self.wakeup is not None:
+            self.wakeup.set()
+        return queued
+
+    def next_batch(self) -> list[tuple[int, str, str, str]]:
+        """(id, idempotency key, user_id, spending JSON) of the oldest records not parked."""
+        with self.lock:
+            return self.get_conn().execute(
+                """
+                SELECT id, idempotency_key, user_id, spending
+                FROM ingest_queue
+                WHERE attempts < ?
+                ORDER BY id
+                LIMIT ?
+                """,
+                (self.max_attempts, self.batch_size),
+            ).fetchall()
+
+    def remove(self, ids: list[int]):
+        with self.lock:
+            conn = self.get_conn()
+            with conn:
+                conn.executemany("DELETE FROM ingest_queue WHERE id = ?", [(i,) for i in ids])
+
+    def record_failure(self, record_id: int, error: Exception, park: bool = False):
+        """Count a failed attempt at the record, `park` it for good if retrying cannot help."""
+        with self.lock:
+            conn = self.get_conn()
+            with conn:
+                conn.execute(
+                    """
+                    UPDATE ingest_queue SET attempts = max(attempts + 1, ?), last_error = ?
+                    WHERE id = ?
+                    """,
+                    (
+                        self.max_attempts if park else 0,
+                        f"{type(error).__name__}: {error}",
+                        record_id,
+                    ),
+                )
+
+    async def flush_batch(self, save: SaveSpendings) -> tuple[int, int]:
+        """
+        Save the next batch, one transaction per user. Returns the records
+        saved and the records Postgres rejected. Connection failures are
+        raised, nothing is counted against the records for those.
+        """
+        batch = await asyncio.to_thread(self.next_batch)
+        if not batch:
+            return 0, 0
+
+        saved = rejected = 0
+        by_user: dict[str, list[tuple[int, str, SpendingAgentOutput]]] = {}
+        for record_id, key, user_id, spending in batch:
+            try:
+                spending = SpendingAgentOutput.model_validate_json(spending)
+            except ValidationError as error:
+                logger.warning("queued spending %s no longer validates: %s", record_id, error)
+                await asyncio.to_thread(self.record_failure, record_id, error, park=True)
+                rejected += 1
+                continue
+            by_user.setdefault(user_id, []).append((record_id, key, spending))
+
+        with telemetry.timed("queue", "ingest_flush") as attributes:
+            start = time.perf_counter()
+            for user_id, records in by_user.items():
+                try:
+                    await save(
+                        [spending for _, _, spending in records],
+                        user_id,
+                        [key for _, key, _ in records],
+                    )
+                    done = [record_id for record_id, _, _ in records]
+                except OperationalError:
+                    raise
+                except Exception:
+                    # Find the records at fault, the rest of the user's batch
+                    # goes in on its own
+                    done = []
+                    for record_id, key, spending in records:
+                        try:
+                            await save([spending], user_id, [key])
+                            done.append(record_id)
+                        except OperationalError:
+                            raise
+                        except Exception as error:
+                            logger.warning("queued spending %s rejected: %s", record_id, error)
+                            await asyncio.to_thread(self.record_failure, record_id, error)
+                            rejected += 1
+
+                await asyncio.to_thread(self.remove, done)
+                saved += len(done)
+
+            self.flushed += saved
+            self.flush_seconds += time.perf_counter() - start
+            attributes.update(rows=saved, rejected=rejected, **await asyncio.to_thread(self.stats))
+
+        return saved, rejected
+
+    async def drain(self, save: SaveSpendings) -> int:
+        """Save everything queued now, returning how many records were saved."""
+        total = 0
+        while True:
+            saved, rejected = await self.flush_batch(save)
+            total += saved
+            if not saved and not rejected:
+                return total
+
+    async def run_worker(self, save: SaveSpendings):
+        backoff = INGEST_RETRY_MIN_SECONDS
+        while True:
+            self.wakeup.clear()
+            try:
+                saved, rejected = await self.flush_batch(save)
+            except Exception:
+                logger.warning("flushing the ingest queue failed, retrying in %.1fs", backoff, exc_info=True)
+                self.retries += 1
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, INGEST_RETRY_MAX_SECONDS)
+                continue
+
+            backoff = INGEST_RETRY_MIN_SECONDS
+            if rejected:
+                await asyncio.sleep(backoff)
+            elif not saved:
+                await self.wakeup.wait()
+
+    def start_worker(self, save: SaveSpendings):
+        """Start draining in the background unless a worker already runs on this loop."""
+        loop = asyncio.get_running_loop()
+        if self.worker is not None and not self.worker.done() and self.worker.get_loop() is loop:
+            return
+
+        self.wakeup = asyncio.Event()
+        # A context of its own, the worker outlives the session that started it
+        self.worker = asyncio.create_task(self.run_worker(save), context=contextvars.Context())
+
+    def retry_parked(self) -> int:
+        """Give parked records their attempts back, returning how many there were."""
+        with self.lock:
+            conn = self.get_conn()
+            with conn:
+                return conn.execute(
+                    "UPDATE ingest_queue SET attempts = 0 WHERE attempts >= ?", (self.max_attempts,)
+                ).rowcount
+
+    def stats(self) -> dict[str, float]:
+        with self.lock:
+            depth, parked, oldest = self.get_conn().execute(
+                """
+                SELECT
+                    COUNT(*) FILTER (WHERE attempts < ?),
+                    COUNT(*) FILTER (WHERE attempts >= ?),
+                    MIN(enqueued_at) FILTER (WHERE attempts < ?)
+                FROM ingest_queue
+                """,
+                (self.max_attempts, self.max_attempts, self.max_attempts),
+            ).fetchone()
+
+        return {
+            "depth": depth,
+            "parked": parked,
+            "lag_seconds": time.time() - oldest if oldest else 0.0,
+            "flushed": self.flushed,
+            "flushed_per_second": self.flushed / self.flush_seconds if self.flush_seconds else 0.0,
+            "retries": self.retries,
+        }
+
+
+ingest_queue = IngestQueue(INGEST_QUEUE_PATH, INGEST_BATCH_SIZE, INGEST_MAX_ATTEMPTS)
+
+
+async def main():
+    from personal_accountant.tools import database
+
+    parser = argparse.ArgumentParser(description="Inspect or drain the write-behind ingest queue")
+    parser.add_argument("--drain", action="store_true", help="Save everything queued to Postgres now")
+    parser.add_argument("--retry-parked", action="store_true", help="Queue parked records again")
+    args = parser.parse_args()
+
+    if not ingest_queue.enabled():
+        raise SystemExit("Set INGEST_QUEUE_PATH")
+
+    if args.retry_parked:
+        print(f"{ingest_queue.retry_parked()} parked records queued again")
+
+    try:
+        if args.drain:
+            print(f"{await ingest_queue.drain(database.save_spendings)} records saved")
+    finally:
+        await database.close_db_pool()
+
+    print(", ".join(f"{key} {value:g}" for key, value in ingest_queue.stats().items()))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,42 @@
+CREATE TABLE IF NOT EXISTS spendings (
+    id SERIAL PRIMARY KEY,
+    type TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    transaction_date DATE NOT NULL,
+    transaction_time TIME NULL,
+    transaction_category TEXT NULL,
+
+    merchant_name TEXT NOT NULL,
+    merchant_address TEXT NULL,
+    merchant_phone TEXT NULL,
+    merchant_website TEXT NULL,
+    merchant_tax_id TEXT NULL,
+
+    summary_subtotal NUMERIC(10, 2) NOT NULL,
+    summary_discount_amount NUMERIC(10, 2) NULL,
+    summary_tax_amount NUMERIC(10, 2) NULL,
+    summary_shipping_amount NUMERIC(10, 2) NULL,
+    summary_total_amount NUMERIC(10, 2) NOT NULL,
+    summary_amount_paid NUMERIC(10, 2) NULL,
+    summary_change_due NUMERIC(10, 2) NULL,
+
+    payment_method TEXT NULL,
+    payment_card_type TEXT NULL,
+    payment_transaction_id TEXT NULL,
+
+    notes TEXT NULL
+);
+
+CREATE TABLE IF NOT EXISTS spending_items (
+    id SERIAL PRIMARY KEY,
+    spending_id INTEGER NOT NULL,
+    description TEXT NOT NULL,
+    quantity NUMERIC(10, 2) NOT NULL,
+    unit_price NUMERIC(10, 2) NOT NULL,
+    total NUMERIC(10, 2) NOT NULL,
+
+    CONSTRAINT fk_spending
+        FOREIGN KEY (spending_id)
+        REFERENCES spendings (id)
+        ON DELETE CASCADE
+);
@@ -0,0 +1,22 @@
+-- Date ranges are in almost every generated query, category filters usually
+-- come with one, so a (category, date) index serves both shapes.
+CREATE INDEX IF NOT EXISTS idx_spendings_transaction_date
+    ON spendings (transaction_date);
+
+CREATE INDEX IF NOT EXISTS idx_spendings_category_date
+    ON spendings (transaction_category, transaction_date);
+
+-- Postgres does not index foreign keys on its own, every items join and
+-- every ON DELETE CASCADE would scan spending_items without this.
+CREATE INDEX IF NOT EXISTS idx_spending_items_spending_id
+    ON spending_items (spending_id);
+
+-- Trigram indexes make the ILIKE '%...%' filters the retriever writes on
+-- merchant and item names index scans instead of full scans.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_spendings_merchant_name_trgm
+    ON spendings USING gin (merchant_name gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_spending_items_description_trgm
+    ON spending_items USING gin (description gin_trgm_ops);
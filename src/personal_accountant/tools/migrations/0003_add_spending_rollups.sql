@@ -0,0 +1,136 @@
+-- Pre-aggregated totals for the retriever's most common questions. They are
+-- kept in sync by statement level triggers on spendings, so inserts, COPY,
+-- updates, deletes and truncates all move the rollups in the same
+-- transaction as the rows themselves.
+
+-- Nobody may write spendings between the backfill and the triggers existing
+LOCK TABLE spendings IN SHARE ROW EXCLUSIVE MODE;
+
+CREATE TABLE daily_category_spendings (
+    spending_date DATE NOT NULL,
+    transaction_category TEXT NULL,
+    currency TEXT NOT NULL,
+    total_amount NUMERIC(14, 2) NOT NULL,
+    transactions INTEGER NOT NULL
+);
+
+CREATE UNIQUE INDEX idx_daily_category_spendings_key
+    ON daily_category_spendings (spending_date, transaction_category, currency)
+    NULLS NOT DISTINCT;
+
+CREATE TABLE monthly_merchant_spendings (
+    spending_month DATE NOT NULL,
+    merchant_name TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    total_amount NUMERIC(14, 2) NOT NULL,
+    transactions INTEGER NOT NULL,
+
+    PRIMARY KEY (spending_month, merchant_name, currency)
+);
+
+INSERT INTO daily_category_spendings
+SELECT transaction_date, transaction_category, currency, SUM(summary_total_amount), COUNT(*)
+FROM spendings
+GROUP BY transaction_date, transaction_category, currency;
+
+INSERT INTO monthly_merchant_spendings
+SELECT date_trunc('month', transaction_date)::date, merchant_name, currency, SUM(summary_total_amount), COUNT(*)
+FROM spendings
+GROUP BY date_trunc('month', transaction_date)::date, merchant_name, currency;
+
+-- Only the transition tables that exist for TG_OP are referenced, plpgsql
+-- resolves them when a statement first runs.
+CREATE FUNCTION update_spending_rollups() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE daily_category_spendings AS r
+        SET total_amount = r.total_amount - d.total_amount,
+            transactions = r.transactions - d.transactions
+        FROM (
+            SELECT transaction_date, transaction_category, currency,
+                   SUM(summary_total_amount) AS total_amount, COUNT(*) AS transactions
+            FROM old_spendings
+            GROUP BY transaction_date, transaction_category, currency
+        ) AS d
+        WHERE r.spending_date = d.transaction_date
+          AND r.transaction_category IS NOT DISTINCT FROM d.transaction_category
+          AND r.currency = d.currency;
+
+        UPDATE monthly_merchant_spendings AS r
+        SET total_amount = r.total_amount - d.total_amount,
+            transactions = r.transactions - d.transactions
+        FROM (
+            SELECT date_trunc('month', transaction_date)::date AS spending_month, merchant_name, currency,
+                   SUM(summary_total_amount) AS total_amount, COUNT(*) AS transactions
+            FROM old_spendings
+            GROUP BY 1, merchant_name, currency
+        ) AS d
+        WHERE r.spending_month = d.spending_month
+          AND r.merchant_name = d.merchant_name
+          AND r.currency = d.currency;
+
+        DELETE FROM daily_category_spendings AS r
+        USING old_spendings AS o
+        WHERE r.transactions = 0
+          AND r.spending_date = o.transaction_date
+          AND r.transaction_category IS NOT DISTINCT FROM o.transaction_category
+          AND r.currency = o.currency;
+
+        DELETE FROM monthly_merchant_spendings AS r
+        USING old_spendings AS o
+        WHERE r.transactions = 0
+          AND r.spending_month = date_trunc('month', o.transaction_date)::date
+          AND r.merchant_name = o.merchant_name
+          AND r.currency = o.currency;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO daily_category_spendings AS r
+        SELECT transaction_date, transaction_category, currency, SUM(summary_total_amount), COUNT(*)
+        FROM new_spendings
+        GROUP BY transaction_date, transaction_category, currency
+        ON CONFLICT (spending_date, transaction_category, currency) DO UPDATE
+        SET total_amount = r.total_amount + EXCLUDED.total_amount,
+            transactions = r.transactions + EXCLUDED.transactions;
+
+        INSERT INTO monthly_merchant_spendings AS r
+        SELECT date_trunc('month', transaction_date)::date, merchant_name, currency,
+               SUM(summary_total_amount), COUNT(*)
+        FROM new_spendings
+        GROUP BY 1, merchant_name, currency
+        ON CONFLICT (spending_month, merchant_name, currency) DO UPDATE
+        SET total_amount = r.total_amount + EXCLUDED.total_amount,
+            transactions = r.transactions + EXCLUDED.transactions;
+    END IF;
+
+    RETURN NULL;
+END;
+$$;
+
+CREATE FUNCTION truncate_spending_rollups() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    TRUNCATE daily_category_spendings, monthly_merchant_spendings;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER spendings_rollups_insert
+    AFTER INSERT ON spendings
+    REFERENCING NEW TABLE AS new_spendings
+    FOR EACH STATEMENT EXECUTE FUNCTION update_spending_rollups();
+
+CREATE TRIGGER spendings_rollups_update
+    AFTER UPDATE ON spendings
+    REFERENCING OLD TABLE AS old_spendings NEW TABLE AS new_spendings
+    FOR EACH STATEMENT EXECUTE FUNCTION update_spending_rollups();
+
+CREATE TRIGGER spendings_rollups_delete
+    AFTER DELETE ON spendings
+    REFERENCING OLD TABLE AS old_spendings
+    FOR EACH STATEMENT EXECUTE FUNCTION update_spending_rollups();
+
+CREATE TRIGGER spendings_rollups_truncate
+    AFTER TRUNCATE ON spendings
+    FOR EACH STATEMENT EXECUTE FUNCTION truncate_spending_rollups();
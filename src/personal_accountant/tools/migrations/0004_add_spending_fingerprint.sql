@@ -0,0 +1,36 @@
+-- A receipt resent in the chat or a statement imported twice comes back as
+-- the same merchant, date, total and payment transaction id. The unique
+-- index makes those inserts conflict, so saves can skip them with
+-- ON CONFLICT DO NOTHING instead of looking for them first.
+
+-- Nobody may write spendings between the clean up and the index existing
+LOCK TABLE spendings IN SHARE ROW EXCLUSIVE MODE;
+
+-- Keep the first save of every duplicate, items and rollups follow through
+-- ON DELETE CASCADE and the rollup triggers
+DELETE FROM spendings
+WHERE id IN (
+    SELECT id
+    FROM (
+        SELECT
+            id,
+            row_number() OVER (
+                PARTITION BY
+                    lower(merchant_name),
+                    transaction_date,
+                    summary_total_amount,
+                    coalesce(payment_transaction_id, '')
+                ORDER BY id
+            ) AS copy_number
+        FROM spendings
+    ) AS copies
+    WHERE copy_number > 1
+);
+
+CREATE UNIQUE INDEX idx_spendings_fingerprint
+    ON spendings (
+        lower(merchant_name),
+        transaction_date,
+        summary_total_amount,
+        coalesce(payment_transaction_id, '')
+    );
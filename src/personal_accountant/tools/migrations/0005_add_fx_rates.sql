@@ -0,0 +1,26 @@
+-- Exchange rates loaded offline by tools/fx_rates.py: one unit of currency
+-- is worth base_rate units of base_currency on rate_date. Rates for several
+-- base currencies can live side by side, BASE_CURRENCY picks one.
+CREATE TABLE fx_rates (
+    base_currency TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    rate_date DATE NOT NULL,
+    base_rate NUMERIC(24, 12) NOT NULL,
+
+    PRIMARY KEY (base_currency, currency, rate_date)
+);
+
+-- summary_total_amount converted to BASE_CURRENCY when the spending is
+-- saved, NULL while no rate is known for its currency and date. Loading
+-- rates fills in the NULLs.
+ALTER TABLE spendings ADD COLUMN base_total_amount NUMERIC(14, 2) NULL;
+
+-- Cross-currency totals over a date range, overall or per category, become
+-- index-only sums
+DROP INDEX IF EXISTS idx_spendings_transaction_date;
+CREATE INDEX idx_spendings_transaction_date
+    ON spendings (transaction_date) INCLUDE (base_total_amount);
+
+DROP INDEX IF EXISTS idx_spendings_category_date;
+CREATE INDEX idx_spendings_category_date
+    ON spendings (transaction_category, transaction_date) INCLUDE (base_total_amount);
@@ -0,0 +1,174 @@
+-- Every spending belongs to the ADK user that saved it. Generated queries
+-- and saves run as personal_accountant_user with app.user_id set for the
+-- transaction (database.scope_to_user), and the row level security policies
+-- below only let them see and write that user's rows. The role running
+-- migrations owns the tables and is not subject to the policies, exports,
+-- rate backfills and other maintenance keep seeing every row.
+
+-- Nobody may write spendings while the owner column and the rollups change
+LOCK TABLE spendings IN SHARE ROW EXCLUSIVE MODE;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = 'personal_accountant_user') THEN
+        CREATE ROLE personal_accountant_user NOLOGIN;
+    END IF;
+END;
+$$;
+
+-- The pool connects as the migrating role and switches to this one per
+-- transaction, which needs membership
+GRANT personal_accountant_user TO CURRENT_USER;
+
+-- What was saved before there were owners belongs to `adk web`'s default
+-- user. New rows take the owner from the transaction, a save that did not
+-- set one fails on NOT NULL instead of landing in somebody's ledger.
+ALTER TABLE spendings ADD COLUMN user_id TEXT NOT NULL DEFAULT 'user';
+ALTER TABLE spendings
+    ALTER COLUMN user_id SET DEFAULT nullif(current_setting('app.user_id', true), '');
+
+-- Items carry the owner as well, so their policy needs no join
+ALTER TABLE spending_items ADD COLUMN user_id TEXT NOT NULL DEFAULT 'user';
+ALTER TABLE spending_items
+    ALTER COLUMN user_id SET DEFAULT nullif(current_setting('app.user_id', true), '');
+
+ALTER TABLE daily_category_spendings ADD COLUMN user_id TEXT NOT NULL DEFAULT 'user';
+ALTER TABLE daily_category_spendings ALTER COLUMN user_id DROP DEFAULT;
+
+ALTER TABLE monthly_merchant_spendings ADD COLUMN user_id TEXT NOT NULL DEFAULT 'user';
+ALTER TABLE monthly_merchant_spendings ALTER COLUMN user_id DROP DEFAULT;
+
+-- Every query of a user is a range of these indexes instead of a filter
+-- over everyone's rows. Per category totals over a date range are an
+-- index-only scan of the user's range too.
+DROP INDEX IF EXISTS idx_spendings_transaction_date;
+CREATE INDEX idx_spendings_transaction_date
+    ON spendings (user_id, transaction_date) INCLUDE (transaction_category, base_total_amount);
+
+DROP INDEX IF EXISTS idx_spendings_category_date;
+CREATE INDEX idx_spendings_category_date
+    ON spendings (user_id, transaction_category, transaction_date) INCLUDE (base_total_amount);
+
+CREATE INDEX idx_spending_items_user_spending
+    ON spending_items (user_id, spending_id);
+
+-- Two users can send the same receipt, it is only a duplicate within one
+-- ledger
+DROP INDEX IF EXISTS idx_spendings_fingerprint;
+CREATE UNIQUE INDEX idx_spendings_fingerprint
+    ON spendings (
+        user_id,
+        lower(merchant_name),
+        transaction_date,
+        summary_total_amount,
+        coalesce(payment_transaction_id, '')
+    );
+
+DROP INDEX IF EXISTS idx_daily_category_spendings_key;
+CREATE UNIQUE INDEX idx_daily_category_spendings_key
+    ON daily_category_spendings (user_id, spending_date, transaction_category, currency)
+    NULLS NOT DISTINCT;
+
+ALTER TABLE monthly_merchant_spendings DROP CONSTRAINT monthly_merchant_spendings_pkey;
+ALTER TABLE monthly_merchant_spendings
+    ADD PRIMARY KEY (user_id, spending_month, merchant_name, currency);
+
+-- The rollup rows an update or delete emptied. Finding them by joining
+-- old_spendings, as 0003_add_spending_rollups did, turns into a rescan of
+-- the user's rollups per old row under row level security.
+CREATE INDEX idx_daily_category_spendings_empty
+    ON daily_category_spendings (user_id) WHERE transactions = 0;
+CREATE INDEX idx_monthly_merchant_spendings_empty
+    ON monthly_merchant_spendings (user_id) WHERE transactions = 0;
+
+-- 0003_add_spending_rollups' triggers, grouping by owner as well
+CREATE OR REPLACE FUNCTION update_spending_rollups() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE daily_category_spendings AS r
+        SET total_amount = r.total_amount - d.total_amount,
+            transactions = r.transactions - d.transactions
+        FROM (
+            SELECT user_id, transaction_date, transaction_category, currency,
+                   SUM(summary_total_amount) AS total_amount, COUNT(*) AS transactions
+            FROM old_spendings
+            GROUP BY user_id, transaction_date, transaction_category, currency
+        ) AS d
+        WHERE r.user_id = d.user_id
+          AND r.spending_date = d.transaction_date
+          AND r.transaction_category IS NOT DISTINCT FROM d.transaction_category
+          AND r.currency = d.currency;
+
+        UPDATE monthly_merchant_spendings AS r
+        SET total_amount = r.total_amount - d.total_amount,
+            transactions = r.transactions - d.transactions
+        FROM (
+            SELECT user_id, date_trunc('month', transaction_date)::date AS spending_month,
+                   merchant_name, currency,
+                   SUM(summary_total_amount) AS total_amount, COUNT(*) AS transactions
+            FROM old_spendings
+            GROUP BY user_id, 2, merchant_name, currency
+        ) AS d
+        WHERE r.user_id = d.user_id
+          AND r.spending_month = d.spending_month
+          AND r.merchant_name = d.merchant_name
+          AND r.currency = d.currency;
+
+        DELETE FROM daily_category_spendings WHERE transactions = 0;
+        DELETE FROM monthly_merchant_spendings WHERE transactions = 0;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO daily_category_spendings AS r (
+            user_id, spending_date, transaction_category, currency, total_amount, transactions
+        )
+        SELECT user_id, transaction_date, transaction_category, currency,
+               SUM(summary_total_amount), COUNT(*)
+        FROM new_spendings
+        GROUP BY user_id, transaction_date, transaction_category, currency
+        ON CONFLICT (user_id, spending_date, transaction_category, currency) DO UPDATE
+        SET total_amount = r.total_amount + EXCLUDED.total_amount,
+            transactions = r.transactions + EXCLUDED.transactions;
+
+        INSERT INTO monthly_merchant_spendings AS r (
+            user_id, spending_month, merchant_name, currency, total_amount, transactions
+        )
+        SELECT user_id, date_trunc('month', transaction_date)::date, merchant_name, currency,
+               SUM(summary_total_amount), COUNT(*)
+        FROM new_spendings
+        GROUP BY user_id, 2, merchant_name, currency
+        ON CONFLICT (user_id, spending_month, merchant_name, currency) DO UPDATE
+        SET total_amount = r.total_amount + EXCLUDED.total_amount,
+            transactions = r.transactions + EXCLUDED.transactions;
+    END IF;
+
+    RETURN NULL;
+END;
+$$;
+
+GRANT SELECT, INSERT, UPDATE, DELETE
+    ON spendings, spending_items, daily_category_spendings, monthly_merchant_spendings
+    TO personal_accountant_user;
+GRANT SELECT ON fx_rates TO personal_accountant_user;
+GRANT USAGE ON SEQUENCE spendings_id_seq, spending_items_id_seq TO personal_accountant_user;
+
+ALTER TABLE spendings ENABLE ROW LEVEL SECURITY;
+CREATE POLICY spendings_owner ON spendings TO personal_accountant_user
+    USING (user_id = current_setting('app.user_id', true))
+    WITH CHECK (user_id = current_setting('app.user_id', true));
+
+ALTER TABLE spending_items ENABLE ROW LEVEL SECURITY;
+CREATE POLICY spending_items_owner ON spending_items TO personal_accountant_user
+    USING (user_id = current_setting('app.user_id', true))
+    WITH CHECK (user_id = current_setting('app.user_id', true));
+
+ALTER TABLE daily_category_spendings ENABLE ROW LEVEL SECURITY;
+CREATE POLICY daily_category_spendings_owner ON daily_category_spendings TO personal_accountant_user
+    USING (user_id = current_setting('app.user_id', true))
+    WITH CHECK (user_id = current_setting('app.user_id', true));
+
+ALTER TABLE monthly_merchant_spendings ENABLE ROW LEVEL SECURITY;
+CREATE POLICY monthly_merchant_spendings_owner ON monthly_merchant_spendings TO personal_accountant_user
+    USING (user_id = current_setting('app.user_id', true))
+    WITH CHECK (user_id = current_setting('app.user_id', true));
@@ -0,0 +1,77 @@
+-- Search over what was bought and where, for generated queries to call
+-- instead of writing ILIKE '%...%' filters: full text with English and
+-- Indonesian stemming, so "coffees" finds "Coffee" and "kopi" finds
+-- "Kopinya", and trigram word similarity on top, so a misspelled merchant
+-- still matches.
+
+-- The text search document of a name or description
+CREATE FUNCTION search_document(content TEXT) RETURNS tsvector
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT to_tsvector('english', content) || to_tsvector('indonesian', content)
+$$;
+
+CREATE FUNCTION search_query(terms TEXT) RETURNS tsquery
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT websearch_to_tsquery('english', terms) || websearch_to_tsquery('indonesian', terms)
+$$;
+
+-- Stored rather than indexed as an expression: ranking reads the document
+-- of every match, computing it again costs more than the search itself.
+-- get_catalog() and the analytics export leave these columns out.
+ALTER TABLE spendings
+    ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (search_document(merchant_name)) STORED;
+ALTER TABLE spending_items
+    ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (search_document(description)) STORED;
+
+CREATE INDEX idx_spendings_search_vector ON spendings USING gin (search_vector);
+CREATE INDEX idx_spending_items_search_vector ON spending_items USING gin (search_vector);
+
+-- Spendings matching `terms`, best first. A spending whose merchant matches
+-- is one row for its whole total (item_id NULL); otherwise every matching
+-- item is a row for its own total, so summing `amount` never counts a
+-- spending twice. base_amount is `amount` in the base currency, items take
+-- their share of the spending's base_total_amount.
+--
+-- @@ and <% are not leakproof, so under row level security the planner may
+-- not use their indexes and scans every row. The function runs as the
+-- tables' owner instead and keeps to the caller's rows itself, with the
+-- condition of 0006_add_spending_owner's policies.
+CREATE FUNCTION search_spending(terms TEXT)
+RETURNS TABLE (
+    spending_id INTEGER,
+    item_id INTEGER,
+    matched TEXT,
+    amount NUMERIC,
+    base_amount NUMERIC,
+    rank REAL
+)
+LANGUAGE sql STABLE SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+    WITH merchants AS (
+        SELECT s.id, NULL::INTEGER, s.merchant_name, s.summary_total_amount, s.base_total_amount,
+               greatest(
+                   ts_rank_cd(s.search_vector, search_query(terms)),
+                   word_similarity(terms, s.merchant_name)
+               )
+        FROM spendings s
+        WHERE s.user_id = current_setting('app.user_id', true)
+          AND (s.search_vector @@ search_query(terms) OR terms <% s.merchant_name)
+    )
+    SELECT * FROM merchants
+    UNION ALL
+    SELECT i.spending_id, i.id, i.description, i.total,
+           i.total * s.base_total_amount / nullif(s.summary_total_amount, 0),
+           greatest(
+               ts_rank_cd(i.search_vector, search_query(terms)),
+               word_similarity(terms, i.description)
+           )
+    FROM spending_items i
+    JOIN spendings s ON s.id = i.spending_id
+    WHERE i.user_id = current_setting('app.user_id', true)
+      AND (i.search_vector @@ search_query(terms) OR terms <% i.description)
+      AND NOT EXISTS (SELECT FROM merchants m WHERE m.id = i.spending_id)
+    ORDER BY 6 DESC
+$$;
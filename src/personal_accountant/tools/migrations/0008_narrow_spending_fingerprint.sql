@@ -0,0 +1,31 @@
+-- The fingerprint 0004 and 0006 built, on merchant, date, total and
+-- coalesce(payment_transaction_id, ''), also covers spendings with neither a
+-- time nor a transaction id. For those the same merchant, date and total is
+-- as likely a second purchase as a resend, two coffees on one day, yet the
+-- second one was skipped as a duplicate.
+--
+-- The fingerprint now adds transaction_time and compares the transaction id
+-- itself, NULLS NOT DISTINCT, and leaves out spendings with neither, so
+-- those never conflict. Two spendings the old index told apart differ here
+-- too, so building it over the existing rows cannot fail.
+--
+-- spending_fingerprint_start() is the first id the index covers. Every
+-- existing spending already went through 0004's clean up, so it covers them
+-- all.
+CREATE FUNCTION spending_fingerprint_start() RETURNS integer
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    RETURN 0;
+
+DROP INDEX idx_spendings_fingerprint;
+CREATE UNIQUE INDEX idx_spendings_fingerprint
+    ON spendings (
+        user_id,
+        lower(merchant_name),
+        transaction_date,
+        transaction_time,
+        summary_total_amount,
+        payment_transaction_id
+    )
+    NULLS NOT DISTINCT
+    WHERE id >= spending_fingerprint_start()
+        AND (transaction_time IS NOT NULL OR payment_transaction_id IS NOT NULL);
@@ -0,0 +1,58 @@
+-- The analytics copy (tools/analytics.py) appends rows past an id
+-- high-water mark, which says nothing about rows updated or deleted below
+-- it: the exchange rate backfill, a duplicate removed by hand, an edited
+-- receipt. Every statement that changes or removes rows of spendings or
+-- spending_items counts here, and a copy exported at other counts is
+-- rebuilt instead of trusted.
+CREATE TABLE spending_changes (
+    table_name TEXT PRIMARY KEY,
+    changes BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO spending_changes (table_name) VALUES ('spendings'), ('spending_items');
+
+-- Runs as the owner, personal_accountant_user gets no rights on the
+-- counters. Statements that matched no rows count nothing.
+CREATE FUNCTION count_spending_changes() RETURNS trigger
+LANGUAGE plpgsql SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+BEGIN
+    IF TG_OP <> 'TRUNCATE' THEN
+        IF NOT EXISTS (SELECT FROM changed_rows) THEN
+            RETURN NULL;
+        END IF;
+    END IF;
+
+    UPDATE spending_changes SET changes = changes + 1 WHERE table_name = TG_TABLE_NAME;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER spendings_changes_update
+    AFTER UPDATE ON spendings
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_spending_changes();
+
+CREATE TRIGGER spendings_changes_delete
+    AFTER DELETE ON spendings
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_spending_changes();
+
+CREATE TRIGGER spendings_changes_truncate
+    AFTER TRUNCATE ON spendings
+    FOR EACH STATEMENT EXECUTE FUNCTION count_spending_changes();
+
+CREATE TRIGGER spending_items_changes_update
+    AFTER UPDATE ON spending_items
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_spending_changes();
+
+CREATE TRIGGER spending_items_changes_delete
+    AFTER DELETE ON spending_items
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_spending_changes();
+
+CREATE TRIGGER spending_items_changes_truncate
+    AFTER TRUNCATE ON spending_items
+    FOR EACH STATEMENT EXECUTE FUNCTION count_spending_changes();
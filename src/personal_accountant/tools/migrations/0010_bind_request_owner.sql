@@ -0,0 +1,114 @@
+-- 0006_add_spending_owner kept the owner of a transaction in the
+-- app.user_id setting, which any SQL running as personal_accountant_user
+-- can change with set_config() and so read or write another user's rows,
+-- through the policies and through search_spending() alike.
+--
+-- The owner now lives in a temporary table of the role running
+-- migrations, the pool's login role. Only that role may call
+-- bind_request_owner(), which database.scope_to_user does before switching
+-- to personal_accountant_user. That role reads the owner through
+-- app_user_id() and cannot change it. The row is gone when the transaction
+-- ends, as the setting was.
+
+CREATE FUNCTION bind_request_owner(request_user_id TEXT) RETURNS void
+LANGUAGE plpgsql SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+BEGIN
+    IF request_user_id IS NULL OR request_user_id = '' THEN
+        RAISE EXCEPTION 'a request needs an owner';
+    END IF;
+
+    IF to_regclass('pg_temp.request_owner') IS NULL THEN
+        CREATE TEMPORARY TABLE request_owner (user_id TEXT NOT NULL) ON COMMIT DELETE ROWS;
+    ELSIF (SELECT relowner FROM pg_class WHERE oid = 'pg_temp.request_owner'::regclass)
+            <> (SELECT oid FROM pg_roles WHERE rolname = current_user) THEN
+        -- Somebody else's table under the same name would let them pick
+        -- the owner
+        RAISE EXCEPTION 'pg_temp.request_owner is not owned by %', current_user;
+    END IF;
+
+    DELETE FROM pg_temp.request_owner;
+    INSERT INTO pg_temp.request_owner (user_id) VALUES (request_user_id);
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION bind_request_owner(TEXT) FROM PUBLIC;
+
+-- The owner bound for the current transaction, NULL outside of one.
+-- Policies call it as (SELECT app_user_id()), evaluated once per query
+-- rather than per row, which keeps the user_id indexes usable.
+CREATE FUNCTION app_user_id() RETURNS TEXT
+LANGUAGE plpgsql STABLE SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+BEGIN
+    IF to_regclass('pg_temp.request_owner') IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    RETURN (SELECT user_id FROM pg_temp.request_owner);
+END;
+$$;
+
+ALTER TABLE spendings ALTER COLUMN user_id SET DEFAULT app_user_id();
+ALTER TABLE spending_items ALTER COLUMN user_id SET DEFAULT app_user_id();
+
+DROP POLICY spendings_owner ON spendings;
+CREATE POLICY spendings_owner ON spendings TO personal_accountant_user
+    USING (user_id = (SELECT app_user_id()))
+    WITH CHECK (user_id = (SELECT app_user_id()));
+
+DROP POLICY spending_items_owner ON spending_items;
+CREATE POLICY spending_items_owner ON spending_items TO personal_accountant_user
+    USING (user_id = (SELECT app_user_id()))
+    WITH CHECK (user_id = (SELECT app_user_id()));
+
+DROP POLICY daily_category_spendings_owner ON daily_category_spendings;
+CREATE POLICY daily_category_spendings_owner ON daily_category_spendings TO personal_accountant_user
+    USING (user_id = (SELECT app_user_id()))
+    WITH CHECK (user_id = (SELECT app_user_id()));
+
+DROP POLICY monthly_merchant_spendings_owner ON monthly_merchant_spendings;
+CREATE POLICY monthly_merchant_spendings_owner ON monthly_merchant_spendings TO personal_accountant_user
+    USING (user_id = (SELECT app_user_id()))
+    WITH CHECK (user_id = (SELECT app_user_id()));
+
+-- 0007_add_spending_search's function, keeping to the bound owner's rows
+CREATE OR REPLACE FUNCTION search_spending(terms TEXT)
+RETURNS TABLE (
+    spending_id INTEGER,
+    item_id INTEGER,
+    matched TEXT,
+    amount NUMERIC,
+    base_amount NUMERIC,
+    rank REAL
+)
+LANGUAGE sql STABLE SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+    WITH merchants AS (
+        SELECT s.id, NULL::INTEGER, s.merchant_name, s.summary_total_amount, s.base_total_amount,
+               greatest(
+                   ts_rank_cd(s.search_vector, search_query(terms)),
+                   word_similarity(terms, s.merchant_name)
+               )
+        FROM spendings s
+        WHERE s.user_id = (SELECT app_user_id())
+          AND (s.search_vector @@ search_query(terms) OR terms <% s.merchant_name)
+    )
+    SELECT * FROM merchants
+    UNION ALL
+    SELECT i.spending_id, i.id, i.description, i.total,
+           i.total * s.base_total_amount / nullif(s.summary_total_amount, 0),
+           greatest(
+               ts_rank_cd(i.search_vector, search_query(terms)),
+               word_similarity(terms, i.description)
+           )
+    FROM spending_items i
+    JOIN spendings s ON s.id = i.spending_id
+    WHERE i.user_id = (SELECT app_user_id())
+      AND (i.search_vector @@ search_query(terms) OR terms <% i.description)
+      AND NOT EXISTS (SELECT FROM merchants m WHERE m.id = i.spending_id)
+    ORDER BY 6 DESC
+$$;
@@ -0,0 +1,12 @@
+-- The ingest queue's worker can save a batch and fail before removing it
+-- from the journal: the process dies, or the commit's answer is lost and
+-- the connection error makes it retry. The fingerprint skips the replayed
+-- spendings that have a time or a transaction id, the others would be
+-- saved twice.
+--
+-- Every spending saved from the queue carries its journal record's
+-- idempotency key, so a replay conflicts here and ON CONFLICT DO NOTHING
+-- skips it. Spendings saved directly have none, NULLs never conflict.
+ALTER TABLE spendings ADD COLUMN ingest_key TEXT NULL;
+
+CREATE UNIQUE INDEX idx_spendings_ingest_key ON spendings (ingest_key);
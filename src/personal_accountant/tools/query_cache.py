@@ -0,0 +1,155 @@
+"""
+In-process LRU/TTL cache for retrieval query results.
+
+Entries are keyed on normalized SQL, so the same question phrased with
+different whitespace, keyword case or IN (...) order hits the same entry.
+Entries and write versions are kept per scope, the user whose rows the query
+read, so nobody is answered from another user's results and a save only
+invalidates its own user's entries. Every table has a write version per
+scope that savers bump after committing; an entry remembers the versions of
+the tables it read and is dropped once any of them moves. Writes from other
+processes (e.g. the statement importer CLI) are only picked up when the TTL
+expires.
+
+stats() is reported to telemetry with every lookup, see database.cached_result.
+"""
+
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "256"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "300"))
+
+QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+PUNCTUATION = re.compile(r"\s*([(),=<>+*/-])\s*")
+IN_LIST = re.compile(r"\bin \( ([^()]*) \)")
+IN_LIST_ITEM = re.compile(r"\s*('(?:[^']|'')*'|[^,]+)")
+IDENTIFIER = re.compile(r"[a-z_][a-z0-9_]*")
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Canonical form of `query` for cache keys: comments and trailing semicolons
+    dropped, whitespace collapsed, everything outside quotes lowercased and the
+    members of IN (...) lists sorted.
+    """
+    parts = QUOTED.split(query)
+    for i in range(0, len(parts), 2):
+        unquoted = COMMENT.sub(" ", parts[i]).lower()
+        unquoted = PUNCTUATION.sub(r" \1 ", unquoted)
+        parts[i] = " ".join(unquoted.split())
+
+    normalized = " ".join(part for part in parts if part).rstrip("; ")
+
+    def sort_in_list(match: re.Match) -> str:
+        items = sorted(item.strip() for item in IN_LIST_ITEM.findall(match.group(1)))
+        return f"in ( {' , '.join(item for item in items if item)} )"
+
+    return IN_LIST.sub(sort_in_list, normalized)
+
+
+def referenced_names(normalized_query: str) -> set[str]:
+    """
+    Every identifier in the query. Over-approximating the tables it reads is
+    cheap and, unlike parsing FROM clauses, cannot miss comma joins, CTEs or
+    subqueries.
+    """
+    return set(IDENTIFIER.findall(normalized_query))
+
+
+@dataclass
+class CacheEntry:
+    result: Any
+    expires_at: float
+    table_versions: dict[str, int]
+
+
+class QueryCache:
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        # (scope, normalized query) -> entry
+        self.entries: OrderedDict[tuple[str, str], CacheEntry] = OrderedDict()
+        # (scope, table) -> write version
+        self.table_versions: dict[tuple[str, str], int] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def versions_for(self, query: str, scope: str = "") -> dict[str, int]:
+        """
+        Snapshot of the write versions `query` depends on. Take it *before*
+        running the query and hand it to put(), so a write that commits while
+        the query runs invalidates the entry instead of hiding behind it.
+        """
+        return {
+            name: self.table_versions.get((scope, name), 0)
+            for name in referenced_names(normalize_sql(query))
+        }
+
+    def get(self, query: str, scope: str = "") -> Optional[Any]:
+        key = (scope, normalize_sql(query))
+        entry = self.entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        is_stale = any(
+            self.table_versions.get((scope, table), 0) != version
+            for table, version in entry.table_versions.items()
+        )
+        if is_stale or entry.expires_at <= time.monotonic():
+            del self.entries[key]
+            self.invalidations += 1
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry.result
+
+    def put(
+        self, query: str, result: Any, table_versions: dict[str, int], scope: str = ""
+    ):
+        if self.max_size <= 0:
+            return
+
+        key = (scope, normalize_sql(query))
+        self.entries[key] = CacheEntry(
+            result=result,
+            expires_at=time.monotonic() + self.ttl_seconds,
+            table_versions=table_versions,
+        )
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def bump(self, *tables: str, scope: str = ""):
+        """Call after a write to `tables` in `scope` has committed."""
+        for table in tables:
+            key = (scope, table)
+            self.table_versions[key] = self.table_versions.get(key, 0) + 1
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+query_cache = QueryCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL_SECONDS)
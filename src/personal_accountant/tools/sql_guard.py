@@ -0,0 +1,208 @@
+"""
+Checks generated SQL before it reaches the database.
+
+check_query() parses the query locally and rejects anything but a single
+read-only query, functions outside of ALLOWED_FUNCTIONS, and tables and
+columns the catalog does not have, so the common mistakes cost no database
+round trip. limit_cost() then asks
+the planner for the cost. An expensive plan is capped with a LIMIT when that
+makes it cheap enough, and refused otherwise.
+"""
+
+from typing import Collection, Mapping
+
+from psycopg import AsyncConnection
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError
+
+# Nodes that write or change state, wherever they hide (CTEs, subqueries)
+WRITE_NODES = (
+    exp.Insert,
+    exp.Update,
+    exp.Delete,
+    exp.Merge,
+    exp.Create,
+    exp.Drop,
+    exp.Alter,
+    exp.TruncateTable,
+    exp.Command,
+    exp.Into,
+)
+
+# Functions a spending question needs, as sqlglot parses them. Anything else
+# is rejected: server functions can sleep (pg_sleep), change settings
+# (set_config), read files (pg_read_file) or reach other servers (dblink)
+ALLOWED_FUNCTIONS = (
+    # Operators sqlglot parses as functions: AND, OR, COLLATE, @>, <@ and &&
+    exp.Connector, exp.Collate, exp.ArrayContains, exp.ArrayContainedBy,
+    exp.ArrayOverlaps,
+    # Aggregates and window functions
+    exp.Count, exp.Sum, exp.Avg, exp.Min, exp.Max, exp.ArrayAgg, exp.GroupConcat,
+    exp.LogicalAnd, exp.LogicalOr, exp.Stddev, exp.StddevPop, exp.StddevSamp,
+    exp.Variance, exp.VariancePop, exp.Corr, exp.PercentileCont, exp.PercentileDisc,
+    exp.Mode, exp.Median, exp.RowNumber, exp.Rank, exp.DenseRank, exp.Ntile,
+    exp.Lag, exp.Lead, exp.FirstValue, exp.LastValue, exp.NthValue,
+    exp.PercentRank, exp.CumeDist,
+    # Conditionals and casts
+    exp.Case, exp.If, exp.Coalesce, exp.Nullif, exp.Greatest, exp.Least,
+    exp.Exists, exp.Cast, exp.TryCast,
+    # Dates, date_trunc() and to_char() among them
+    exp.CurrentDate, exp.CurrentTimestamp, exp.CurrentTime, exp.Localtimestamp,
+    exp.TimestampTrunc, exp.DateTrunc, exp.Extract, exp.TimeToStr, exp.StrToDate,
+    exp.StrToTime, exp.DateAdd, exp.DateSub, exp.DateBin, exp.JustifyDays,
+    exp.JustifyInterval, exp.UnixToTime,
+    # Text
+    exp.Lower, exp.Upper, exp.Initcap, exp.Length, exp.Trim, exp.Substring,
+    exp.Replace, exp.SplitPart, exp.StrPosition, exp.Concat, exp.ConcatWs,
+    exp.Left, exp.Right, exp.Pad, exp.Repeat, exp.Reverse, exp.RegexpLike,
+    exp.RegexpILike, exp.RegexpReplace,
+    # Numbers
+    exp.Abs, exp.Round, exp.Ceil, exp.Floor, exp.Trunc, exp.Sign, exp.Sqrt,
+    exp.Cbrt, exp.Pow, exp.Exp, exp.Ln, exp.Log, exp.ToNumber, exp.WidthBucket,
+    # Arrays and set returning functions, generate_series() and unnest()
+    exp.Array, exp.ArrayToString, exp.ArraySize, exp.Explode,
+    exp.ExplodingGenerateSeries, exp.GenerateSeries, exp.Unnest,
+)
+
+# Functions sqlglot has no node for, by name
+ALLOWED_FUNCTION_NAMES = frozenset({
+    "search_spending",
+    "age",
+    "make_date",
+    "date_part",
+    "to_char",
+    "to_date",
+    "bool_and",
+    "bool_or",
+    "every",
+    "string_agg",
+    "cardinality",
+    "isfinite",
+})
+
+
+class QueryRejected(Exception):
+    """`kind` uses the executor's error kinds, e.g. syntax or undefined_column."""
+
+    def __init__(self, kind: str, message: str):
+        super().__init__(message)
+        self.kind = kind
+
+
+def check_query(query: str, catalog: Mapping[str, Collection[str]]) -> exp.Query:
+    """
+    Raise QueryRejected unless `query` is one read-only query over tables and
+    columns in `catalog`, a mapping of table name to its column names.
+    Returns the parsed query, for limit_cost().
+    """
+    try:
+        statements = [s for s in sqlglot.parse(query, read="postgres") if s is not None]
+    except ParseError as e:
+        raise QueryRejected("syntax", str(e).splitlines()[0]) from e
+
+    if len(statements) != 1:
+        raise QueryRejected(
+            "multiple_statements", f"expected a single query, got {len(statements)}"
+        )
+
+    statement = statements[0]
+    if not isinstance(statement, exp.Query) or statement.find(*WRITE_NODES):
+        raise QueryRejected("not_select", "only read-only SELECT queries are allowed")
+
+    for function in statement.find_all(exp.Func):
+        if isinstance(function, (exp.Anonymous, exp.AnonymousAggFunc)):
+            name = function.name.lower()
+            allowed = name in ALLOWED_FUNCTION_NAMES
+        else:
+            name = function.sql_name().lower()
+            allowed = isinstance(function, ALLOWED_FUNCTIONS)
+        if not allowed:
+            raise QueryRejected("function_not_allowed", f"function {name}() is not allowed")
+
+    cte_names = {cte.alias_or_name.lower() for cte in statement.find_all(exp.CTE)}
+
+    # alias or name -> table, for every catalog table the query reads
+    sources: dict[str, str] = {}
+    only_catalog_sources = True
+    for table in statement.find_all(exp.Table):
+        name = table.name.lower()
+        if not isinstance(table.this, exp.Identifier):
+            # Table functions such as generate_series()
+            only_catalog_sources = False
+            continue
+        if name in cte_names and not table.db:
+            only_catalog_sources = False
+            continue
+        if table.db or name not in catalog:
+            raise QueryRejected("undefined_table", f'relation "{table.sql(dialect="postgres")}" does not exist')
+        sources[table.alias_or_name.lower()] = name
+
+    if statement.find(exp.Subquery, exp.Values, exp.Unnest):
+        only_catalog_sources = False
+
+    output_aliases = {alias.alias.lower() for alias in statement.find_all(exp.Alias)}
+    known_columns = set().union(*(catalog[table] for table in sources.values()))
+
+    for column in statement.find_all(exp.Column):
+        if isinstance(column.this, exp.Star):
+            continue
+
+        name = column.name.lower()
+        qualifier = column.table.lower()
+        if qualifier:
+            table = sources.get(qualifier)
+            if table is not None and name not in catalog[table]:
+                raise QueryRejected(
+                    "undefined_column", f'column {qualifier}.{name} does not exist in "{table}"'
+                )
+        elif (
+            only_catalog_sources
+            and name not in known_columns
+            and name not in output_aliases
+        ):
+            raise QueryRejected(
+                "undefined_column",
+                f'column "{name}" does not exist in {", ".join(sorted(set(sources.values())))}',
+            )
+
+    return statement
+
+
+async def plan_cost(conn: AsyncConnection, query: str) -> float:
+    cur = await conn.execute(f"EXPLAIN (FORMAT JSON) {query}")
+    plan = (await cur.fetchone())[0]
+    return plan[0]["Plan"]["Total Cost"]
+
+
+async def limit_cost(
+    conn: AsyncConnection, query: str, statement: exp.Query, max_cost: float, max_rows: int
+) -> tuple[str, bool]:
+    """
+    `query` itself when the planner's estimate is within `max_cost`, or the
+    query capped one row past `max_rows` (enough to tell it was truncated)
+    when that brings it within. Returns the query and whether it was capped.
+    `statement` is `query` as check_query() parsed it.
+    """
+    if max_cost <= 0:
+        return query, False
+
+    cost = await plan_cost(conn, query)
+    if cost <= max_cost:
+        return query, False
+
+    # Built from the parsed query rather than its text, which may end in a
+    # comment or a semicolon
+    limited = (
+        exp.select("*")
+        .from_(statement.subquery("limited"))
+        .limit(max_rows + 1)
+        .sql(dialect="postgres")
+    )
+    if await plan_cost(conn, limited) <= max_cost:
+        return limited, True
+
+    raise QueryRejected(
+        "too_expensive",
+        f"estimated cost {cost:.0f} is over the limit of {max_cost:.0f} even with a LIMIT",
+    )
@@ -0,0 +1,69 @@
+"""
+Spendings as rows to save and query results as rows to answer from.
+
+Spendings left in session state are validated with the module-level
+adapters below, built once at import. A save with several receipts
+validates them in one call.
+
+The columns a save fills are generated from the Spending and SpendingItem
+models rather than listed by hand, in field order, so a new field only needs
+the model and a migration. Binding a receipt is then one itemgetter call for
+the header and a pass over its items per column.
+
+Query results come back from psycopg and DuckDB as Decimal, date and time
+values. encode_row() sizes them with pydantic-core's JSON encoder, and
+json_rows() turns the rows that are kept into plain JSON values once, before
+they are cached and put in session state.
+"""
+
+from operator import itemgetter
+from typing import Iterable, Optional
+
+from pydantic import TypeAdapter
+from pydantic_core import to_json, to_jsonable_python
+
+from personal_accountant.types.type import Spending, SpendingAgentOutput, SpendingItem
+
+SPENDING = TypeAdapter(SpendingAgentOutput)
+SPENDINGS = TypeAdapter(list[SpendingAgentOutput])
+
+# The spendings columns spending_row() fills, in its order
+SPENDING_COLUMNS = (*Spending.model_fields, "base_total_amount", "ingest_key")
+# The spending_items columns item_columns() fills, in its order
+ITEM_COLUMNS = tuple(SpendingItem.model_fields)
+
+# Read from the models' __dict__, where pydantic keeps field values.
+# model_dump() would serialize amounts to text and costs more than the
+# whole bind.
+spending_fields = itemgetter(*Spending.model_fields)
+item_fields = itemgetter(*ITEM_COLUMNS)
+
+
+def spending_row(
+    spending: SpendingAgentOutput,
+    base_total_amount: Optional[object],
+    ingest_key: Optional[str] = None,
+) -> tuple:
+    """Values for SPENDING_COLUMNS."""
+    return (*spending_fields(spending.__dict__), base_total_amount, ingest_key)
+
+
+def item_row(item: SpendingItem) -> tuple:
+    """Values for ITEM_COLUMNS."""
+    return item_fields(item.__dict__)
+
+
+def item_columns(items: list[SpendingItem]) -> list[list]:
+    """The values of `items` one list per ITEM_COLUMNS column, for unnest()."""
+    rows = [item.__dict__ for item in items]
+    return [[row[column] for row in rows] for column in ITEM_COLUMNS]
+
+
+def encode_row(row: dict) -> bytes:
+    """`row` as compact JSON, values JSON has no type for as their str()."""
+    return to_json(row, fallback=str)
+
+
+def json_rows(rows: Iterable[dict]) -> list[dict]:
+    """`rows` with only JSON values: Decimal as text, dates in ISO format."""
+    return to_jsonable_python(rows, fallback=str)
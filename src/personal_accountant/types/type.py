@@ -1,5 +1,17 @@
-from typing import Optional
-from pydantic import BaseModel, Field
+from decimal import Decimal
+from typing import Annotated, Optional
+from pydantic import BaseModel, Field, PlainSerializer, WithJsonSchema
+
+# A NUMERIC(10, 2) column. Validated to Decimal, so amounts reach Postgres
+# without passing through a binary float, and dumped as its exact text, so
+# session state and the ingest queue's journal stay JSON. This is for exact
+# amounts, not speed: a Decimal costs more to validate than a float did. The
+# model is still asked for a number.
+Numeric = Annotated[
+    Decimal,
+    PlainSerializer(str, return_type=str),
+    WithJsonSchema({"type": "number"}),
+]
 
 
 class Spending(BaseModel):
@@ -34,28 +46,28 @@ class Spending(BaseModel):
     )
 
     # Summary fields (prefixed)
-    summary_subtotal: float = Field(
+    summary_subtotal: Numeric = Field(
         ...,
         description="The total cost of goods or services before any discounts, taxes, or shipping.",
     )
-    summary_discount_amount: Optional[float] = Field(
+    summary_discount_amount: Optional[Numeric] = Field(
         None,
         description="The total amount of any discounts applied to the transaction.",
     )
-    summary_tax_amount: Optional[float] = Field(
+    summary_tax_amount: Optional[Numeric] = Field(
         None, description="The total amount of tax applied to the transaction."
     )
-    summary_shipping_amount: Optional[float] = Field(
+    summary_shipping_amount: Optional[Numeric] = Field(
         None, description="The cost of shipping or delivery for the transaction."
     )
-    summary_total_amount: float = Field(
+    summary_total_amount: Numeric = Field(
         ...,
         description="The final total amount of the transaction, including subtotal, taxes, shipping, and after discounts.",
     )
-    summary_amount_paid: Optional[float] = Field(
+    summary_amount_paid: Optional[Numeric] = Field(
         None, description="The actual amount paid by the customer."
     )
-    summary_change_due: Optional[float] = Field(
+    summary_change_due: Optional[Numeric] = Field(
         None,
         description="The amount of change returned to the customer, if applicable.",
     )
@@ -90,9 +102,9 @@ class SpendingItem(BaseModel):
     description: str = Field(
         ..., description="A description of the individual item or service."
     )
-    quantity: float = Field(..., description="The quantity of the item purchased.")
-    unit_price: float = Field(..., description="The price per unit of the item.")
-    total: float = Field(
+    quantity: Numeric = Field(..., description="The quantity of the item purchased.")
+    unit_price: Numeric = Field(..., description="The price per unit of the item.")
+    total: Numeric = Field(
         ...,
         description="The total cost for this specific line item (quantity * unit_price).",
     )
@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+
+from google.genai import types
+
+from personal_accountant.sub_agents.spend_extractor.agent import (
+    extraction_key,
+    remember_extraction,
+    spend_extractor_agent,
+)
+from personal_accountant.sub_agents.spend_extractor.extraction_cache import content_hash
+from personal_accountant.tools.database import EXTRACTED_SPENDING_KEYS
+
+RECEIPT = "KOPI KENANGAN\n1x Kopi Susu  25.000\nTOTAL 25.000"
+PHOTO = types.Part(inline_data=types.Blob(mime_type="image/jpeg", data=b"\xff\xd8receipt"))
+
+
+def text(value: str) -> types.Content:
+    return types.Content(role="user", parts=[types.Part(text=value)])
+
+
+def tool_context(user_id: str, *parts: types.Part) -> SimpleNamespace:
+    return SimpleNamespace(
+        user_content=types.Content(role="user", parts=list(parts)),
+        _invocation_context=SimpleNamespace(user_id=user_id),
+    )
+
+
+def test_content_hash_ignores_case_and_whitespace():
+    assert content_hash(text(RECEIPT), "alice") == content_hash(
+        text(f"  {RECEIPT.lower()}\n\n"), "alice"
+    )
+
+
+def test_content_hash_is_per_user():
+    assert content_hash(text(RECEIPT), "alice") != content_hash(text(RECEIPT), "bob")
+
+
+def test_content_hash_skips_messages_without_a_document():
+    assert content_hash(text("yes"), "alice") is None
+    assert content_hash(text("save it please"), "alice") is None
+    assert content_hash(types.Content(role="user", parts=[]), "alice") is None
+    assert content_hash(None, "alice") is None
+
+
+def test_content_hash_uses_attachment_bytes():
+    other_photo = types.Part(inline_data=types.Blob(mime_type="image/jpeg", data=b"\xff\xd8other"))
+    request = types.Part(text="Extract the spending in this document")
+
+    key = content_hash(types.Content(role="user", parts=[request, PHOTO]), "alice")
+    assert key is not None
+    assert key != content_hash(types.Content(role="user", parts=[request, other_photo]), "alice")
+
+
+def test_extraction_key_uses_the_request_not_the_turn():
+    # Two extractor calls in one turn over two pasted receipts
+    context = tool_context("alice", types.Part(text=f"{RECEIPT}\n\nINDOMARET TOTAL 40.000"))
+
+    first = extraction_key({"request": RECEIPT}, context)
+    second = extraction_key({"request": "INDOMARET TOTAL 40.000"}, context)
+
+    assert first is not None and second is not None
+    assert first != second
+
+
+def test_extraction_key_skips_a_confirmation_turn():
+    assert extraction_key({"request": "yes"}, tool_context("alice", types.Part(text="yes"))) is None
+
+
+def test_extraction_key_covers_attachments():
+    request = {"request": "Extract the spending in the attached photo"}
+
+    with_photo = extraction_key(request, tool_context("alice", types.Part(text="here"), PHOTO))
+
+    assert with_photo is not None
+    assert with_photo != extraction_key(request, tool_context("bob", types.Part(text="here"), PHOTO))
+
+
+def test_extraction_key_of_a_photo_ignores_the_request_wording():
+    first = extraction_key(
+        {"request": "Extract the spending in the attached photo"},
+        tool_context("alice", types.Part(text="here"), PHOTO),
+    )
+    again = extraction_key(
+        {"request": "Please read this receipt image"},
+        tool_context("alice", types.Part(text="same one again"), PHOTO),
+    )
+
+    assert first is not None
+    assert first == again
+
+
+def test_single_extraction_replaces_an_unsaved_batch():
+    context = tool_context("alice", types.Part(text="yes"))
+    context.state = {EXTRACTED_SPENDING_KEYS: ["structured_spending_1"]}
+
+    remember_extraction(
+        SimpleNamespace(name=spend_extractor_agent.name), {"request": "yes"}, context, {}
+    )
+
+    assert context.state[EXTRACTED_SPENDING_KEYS] is None
@@ -0,0 +1,132 @@
+from decimal import Decimal
+
+import pytest
+
+from personal_accountant.tools.importer import (
+    InvalidRow,
+    StatementRow,
+    parse_amount,
+    parse_date,
+    read_statement,
+    statement_transaction_id,
+    to_spending,
+)
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        ("12.50", "12.50"),
+        ("-12.50", "-12.50"),
+        ("0,5", "0.5"),
+        ("1,234.56", "1234.56"),
+        ("1.234,56", "1234.56"),
+        # A lone separator followed by three digits groups thousands
+        ("50,000", "50000"),
+        ("1.234", "1234"),
+        ("1.234.567", "1234567"),
+        ("1,234,567.89", "1234567.89"),
+        ("Rp 50.000", "50000"),
+        ("IDR 1.500.000,00", "1500000.00"),
+        ("USD -3.99", "-3.99"),
+        ("$1,000", "1000"),
+        ("(12.00)", "-12.00"),
+        ("12.50 DB", "-12.50"),
+        ("12.50 DR", "-12.50"),
+        ("12.50 CR", "12.50"),
+        ("12-", "-12"),
+    ],
+)
+def test_parse_amount(value, expected):
+    assert parse_amount(value) == Decimal(expected)
+
+
+@pytest.mark.parametrize("value", ["", "abc", "Rp", "1.2.3,4,5", "12 DB 34"])
+def test_parse_amount_rejects(value):
+    with pytest.raises(ValueError):
+        parse_amount(value)
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        ("2024-03-05", "2024-03-05"),
+        ("2024-03-05T10:11:12", "2024-03-05"),
+        ("05/03/2024", "2024-03-05"),
+        ("20240305", "2024-03-05"),
+    ],
+)
+def test_parse_date(value, expected):
+    assert parse_date(value) == expected
+
+
+def test_parse_date_rejects():
+    with pytest.raises(ValueError):
+        parse_date("yesterday")
+
+
+def test_read_csv_reports_invalid_rows(tmp_path):
+    statement = tmp_path / "statement.csv"
+    statement.write_text(
+        "date,description,amount\n"
+        "2024-03-05,Kopi Kenangan,-25.000\n"
+        "2024-03-06,Indomaret,not an amount\n"
+        "someday,Grab,-40.000\n"
+        "2024-03-07,Salary,10.000.000\n"
+    )
+
+    rows = list(read_statement(statement))
+
+    assert [row.amount for row in rows if isinstance(row, StatementRow)] == [
+        Decimal(-25000),
+        Decimal(10000000),
+    ]
+    assert [row.line for row in rows if isinstance(row, InvalidRow)] == [3, 4]
+
+
+def test_read_csv_positive_debits(tmp_path):
+    statement = tmp_path / "statement.csv"
+    statement.write_text(
+        "date,description,amount\n"
+        "2024-03-05,Kopi Kenangan,25.000\n"
+        "2024-03-07,Salary,-10.000.000\n"
+    )
+
+    rows = list(read_statement(statement, positive_debits=True))
+
+    assert [row.amount for row in rows] == [Decimal(-25000), Decimal(10000000)]
+
+
+def test_read_json_lines_reports_invalid_rows(tmp_path):
+    statement = tmp_path / "statement.jsonl"
+    statement.write_text(
+        '{"date": "2024-03-05", "description": "Kopi", "amount": "-25.000"}\n'
+        "\n"
+        '{"date": "2024-03-06", "description": "Grab"}\n'
+    )
+
+    rows = list(read_statement(statement))
+
+    assert isinstance(rows[0], StatementRow)
+    assert isinstance(rows[1], InvalidRow) and rows[1].line == 3
+
+
+def test_to_spending_leaves_notes_empty():
+    row = StatementRow(date="2024-03-05", description="KOPI KENANGAN", amount=Decimal("-25000"))
+
+    spending = to_spending(row, "idr")
+
+    assert spending.merchant_name == "KOPI KENANGAN"
+    assert spending.notes is None
+    assert spending.summary_total_amount == Decimal(25000)
+    assert spending.currency == "IDR"
+    assert spending.transaction_category == "Dining"
+
+
+def test_statement_transaction_id():
+    row = StatementRow(date="2024-03-05", description="KOPI KENANGAN", amount=Decimal("-25000"))
+    same_row = StatementRow(date="2024-03-05", description="KOPI KENANGAN", amount=Decimal("-25000"))
+
+    # Stable across imports, distinct for a second identical purchase
+    assert statement_transaction_id(row, 1) == statement_transaction_id(same_row, 1)
+    assert statement_transaction_id(row, 1) != statement_transaction_id(row, 2)
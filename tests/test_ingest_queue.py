@@ -0,0 +1,42 @@
+import asyncio
+
+from personal_accountant.tools.ingest_queue import IngestQueue, idempotency_key
+from personal_accountant.types.type import SpendingAgentOutput
+
+RECEIPT = SpendingAgentOutput(
+    type="receipt",
+    currency="IDR",
+    transaction_date="2024-03-05",
+    merchant_name="Kopi Kenangan",
+    summary_subtotal="25000",
+    summary_total_amount="25000",
+    items=[],
+)
+
+
+def test_second_purchase_without_time_keeps_its_own_key():
+    assert idempotency_key(RECEIPT, "alice") != idempotency_key(RECEIPT, "alice")
+
+    timed = RECEIPT.model_copy(update={"transaction_time": "10:00:00"})
+    assert idempotency_key(timed, "alice") == idempotency_key(timed, "alice")
+    assert idempotency_key(timed, "alice") != idempotency_key(timed, "bob")
+
+
+def test_flush_passes_keys_and_parks_records_that_no_longer_validate(tmp_path):
+    queue = IngestQueue(str(tmp_path / "queue.sqlite3"), batch_size=10, max_attempts=5)
+    queue.append([RECEIPT, RECEIPT], "alice")
+    with queue.get_conn() as conn:
+        conn.execute("UPDATE ingest_queue SET spending = '{\"type\": \"receipt\"}' WHERE id = 1")
+        (key,) = conn.execute("SELECT idempotency_key FROM ingest_queue WHERE id = 2").fetchone()
+
+    calls = []
+
+    async def save(spendings, user_id, ingest_keys):
+        calls.append((len(spendings), user_id, ingest_keys))
+        return [1] * len(spendings)
+
+    assert asyncio.run(queue.drain(save)) == 1
+
+    assert calls == [(1, "alice", [key])]
+    assert queue.stats()["parked"] == 1
+    assert queue.stats()["depth"] == 0
@@ -0,0 +1,59 @@
+from datetime import date
+
+import pytest
+
+from personal_accountant.sub_agents.spend_retriever.intents import parse_question
+
+# A Wednesday
+TODAY = date(2024, 3, 13)
+
+
+@pytest.mark.parametrize(
+    ("question", "name", "start", "end"),
+    [
+        ("How much did I spend this month?", "total_spend", date(2024, 3, 1), date(2024, 3, 31)),
+        ("total spent last week", "total_spend", date(2024, 3, 4), date(2024, 3, 10)),
+        ("spending in january", "total_spend", date(2024, 1, 1), date(2024, 1, 31)),
+        ("spending in april", "total_spend", date(2023, 4, 1), date(2023, 4, 30)),
+        ("spend by category last month", "spend_by_category", date(2024, 2, 1), date(2024, 2, 29)),
+        ("top 5 transactions", "top_transactions", date(1900, 1, 1), date(9999, 12, 31)),
+        ("top merchants this year", "top_merchants", date(2024, 1, 1), date(2024, 12, 31)),
+    ],
+)
+def test_parse_question(question, name, start, end):
+    intent = parse_question(question, TODAY)
+
+    assert intent is not None
+    assert (intent.name, intent.start, intent.end) == (name, start, end)
+    assert intent.params["start"] == start and intent.params["end"] == end
+
+
+@pytest.mark.parametrize(
+    ("question", "limit"),
+    [
+        ("top transactions", 5),
+        ("top merchants", 10),
+        ("top 20 transactions", 20),
+        ("top 100 merchants", 100),
+    ],
+)
+def test_parse_question_limit(question, limit):
+    assert parse_question(question, TODAY).params["limit"] == limit
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        # An extra filter the intents do not understand
+        "how much did I spend on coffee this month",
+        "total spent at SuperMart last week",
+        # A total needs a period
+        "how much did I spend",
+        # More rows than the fast path answers with, or none at all
+        "top 500 transactions",
+        "top 0 merchants",
+        "top 5 transactions in 2023 of 3",
+    ],
+)
+def test_parse_question_falls_through(question):
+    assert parse_question(question, TODAY) is None
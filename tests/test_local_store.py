@@ -0,0 +1,26 @@
+from personal_accountant.local_store import LocalStore
+
+
+def test_find_counts_hits_and_put_keeps_the_most_used(tmp_path):
+    store = LocalStore(
+        str(tmp_path / "store.sqlite3"), "memo", key="question", columns=("answer",), max_entries=2
+    )
+    store.put("first", "1")
+    store.put("second", "2")
+
+    assert store.find("first") == ("1",)
+    assert store.find("missing") is None
+
+    store.put("third", "3")
+
+    assert {key for key, *_ in store.entries()} == {"first", "third"}
+
+
+def test_put_replaces_an_entry(tmp_path):
+    store = LocalStore(
+        str(tmp_path / "store.sqlite3"), "memo", key="question", columns=("tokens", "sql"), max_entries=10
+    )
+    store.put("question", "a b", "SELECT 1")
+    store.put("question", "a b", "SELECT 2")
+
+    assert store.find("question") == ("a b", "SELECT 2")
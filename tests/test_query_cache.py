@@ -0,0 +1,44 @@
+from personal_accountant.telemetry import Measurement, PrometheusExporter
+from personal_accountant.tools.query_cache import QueryCache, normalize_sql
+
+
+def test_normalize_sql():
+    assert normalize_sql("SELECT  *\nFROM spendings WHERE id IN (3, 1); -- all") == normalize_sql(
+        "select * from spendings where id in (1,3)"
+    )
+
+
+def test_stats_count_hits_misses_and_invalidations():
+    cache = QueryCache(max_size=1, ttl_seconds=60)
+    query = "SELECT count(*) FROM spendings"
+
+    assert cache.get(query, scope="alice") is None
+    cache.put(query, 1, cache.versions_for(query, scope="alice"), scope="alice")
+    assert cache.get(query, scope="alice") == 1
+    assert cache.get(query, scope="bob") is None
+    cache.bump("spendings", scope="alice")
+    assert cache.get(query, scope="alice") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["invalidations"]) == (1, 3, 1)
+    assert stats["hit_rate"] == 0.25
+
+
+def test_prometheus_serves_cache_lookups():
+    exporter = PrometheusExporter(port=0)
+    exporter.export(
+        Measurement(
+            kind="cache",
+            name="query_cache",
+            session_id=None,
+            invocation_id=None,
+            started_at=0,
+            duration_ms=0.1,
+            attributes={"hit": True, "size": 4, "hits": 7, "misses": 3, "evictions": 0, "invalidations": 1},
+        )
+    )
+
+    metrics = exporter.render()
+    assert 'personal_accountant_query_cache_lookups_total{result="hit"} 7' in metrics
+    assert 'personal_accountant_query_cache_lookups_total{result="miss"} 3' in metrics
+    assert "personal_accountant_query_cache_size 4" in metrics
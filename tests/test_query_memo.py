@@ -0,0 +1,40 @@
+import pytest
+
+from personal_accountant.local_store import LocalStore
+from personal_accountant.sub_agents.spend_retriever import query_memo
+
+# Long enough that one different word still leaves the wording 0.85 similar
+QUESTION = (
+    "How much did I spend on food and snacks at the mall near my office downtown"
+    " during lunch breaks in March 2024, in total?"
+)
+
+
+@pytest.fixture(autouse=True)
+def memo(tmp_path, monkeypatch):
+    store = LocalStore(
+        str(tmp_path / "memo.sqlite3"), "query_memo", key="question",
+        columns=("tokens", "sql_query"), max_entries=10,
+    )
+    monkeypatch.setattr(query_memo, "store", store)
+    query_memo.remember_query(QUESTION, "SELECT 1")
+
+
+def test_paraphrase_reuses_the_query():
+    paraphrase = QUESTION.replace("did I spend", "have I spent").replace(", in total?", " total")
+
+    assert query_memo.find_query(paraphrase) == (QUESTION, "SELECT 1")
+
+
+@pytest.mark.parametrize(
+    ("before", "after"),
+    [("March", "May"), ("2024", "2023"), ("food", "drinks"), ("office", "home")],
+)
+def test_different_parameters_miss(before, after):
+    assert query_memo.find_query(QUESTION.replace(before, after)) is None
+
+
+def test_forget_query():
+    query_memo.forget_query(QUESTION)
+
+    assert query_memo.find_query(QUESTION) is None
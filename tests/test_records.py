@@ -0,0 +1,41 @@
+import asyncio
+from decimal import Decimal
+from types import SimpleNamespace
+
+from personal_accountant.tools.database import save_extracted_spendings
+from personal_accountant.types import records
+
+RECEIPT = {
+    "type": "receipt",
+    "currency": "IDR",
+    "transaction_date": "2024-03-05",
+    "merchant_name": "Kopi Kenangan",
+    "summary_subtotal": "25000.00",
+    "summary_total_amount": "25000.00",
+    "items": [{"description": "Kopi Susu", "quantity": "1", "unit_price": "25000", "total": "25000"}],
+}
+
+
+def test_rows_follow_the_generated_columns():
+    spending = records.SPENDING.validate_python(RECEIPT)
+
+    row = dict(zip(records.SPENDING_COLUMNS, records.spending_row(spending, Decimal(25000))))
+    items = dict(zip(records.ITEM_COLUMNS, records.item_columns(spending.items)))
+
+    assert row["merchant_name"] == "Kopi Kenangan"
+    assert row["summary_total_amount"] == Decimal("25000.00")
+    assert row["base_total_amount"] == Decimal(25000)
+    assert items["description"] == ["Kopi Susu"]
+    assert items["total"] == [Decimal(25000)]
+
+
+def test_save_extracted_spendings_names_the_invalid_documents():
+    state = {"doc_1": RECEIPT, "doc_2": {**RECEIPT, "summary_total_amount": "lots"}, "doc_3": None}
+
+    response = asyncio.run(
+        save_extracted_spendings(SimpleNamespace(state=state), ["doc_1", "doc_2", "doc_3"])
+    )
+
+    assert response["state"] == "error"
+    assert "doc_2, doc_3" in response["result"]
+    assert "doc_1" not in response["result"]
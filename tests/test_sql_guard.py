@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+import sqlglot
+
+from personal_accountant.tools.sql_guard import QueryRejected, check_query, limit_cost
+
+CATALOG = {
+    "spendings": {"id", "user_id", "transaction_date", "merchant_name", "transaction_category",
+                  "currency", "summary_total_amount", "base_total_amount"},
+    "spending_items": {"id", "spending_id", "description", "quantity", "total_price"},
+    "daily_category_spendings": {"spending_date", "transaction_category", "currency",
+                                 "total_amount", "transactions"},
+}
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "SELECT currency, SUM(summary_total_amount) FROM spendings GROUP BY currency",
+        """
+        SELECT date_trunc('month', transaction_date) AS month, to_char(transaction_date, 'YYYY-MM'),
+               COUNT(*) FILTER (WHERE summary_total_amount > 100),
+               ROUND(AVG(summary_total_amount), 2), COALESCE(MAX(merchant_name), 'none')
+        FROM spendings
+        WHERE transaction_date >= CURRENT_DATE - INTERVAL '3 months'
+          AND (lower(merchant_name) LIKE '%kopi%' OR transaction_category = 'Dining')
+        GROUP BY 1, 2
+        """,
+        """
+        SELECT merchant_name, RANK() OVER (ORDER BY summary_total_amount DESC),
+               EXTRACT(YEAR FROM transaction_date), CAST(summary_total_amount AS integer)
+        FROM spendings
+        """,
+        "SELECT s.currency, SUM(s.total_amount) FROM search_spending('kopi') AS s GROUP BY 1",
+        """
+        SELECT day::date, COUNT(s.id)
+        FROM generate_series(DATE '2024-01-01', DATE '2024-01-31', INTERVAL '1 day') AS day
+        LEFT JOIN spendings AS s ON s.transaction_date = day::date
+        GROUP BY 1
+        """,
+    ],
+)
+def test_accepts(query):
+    check_query(query, CATALOG)
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "SELECT set_config('app.user_id', 'alice', true)",
+        "SELECT set_config('role', 'postgres', true), COUNT(*) FROM spendings",
+        "SELECT * FROM set_config('role', 'postgres', true)",
+        "SELECT current_setting('app.user_id')",
+        "SELECT pg_sleep(10)",
+        "SELECT COUNT(*) FROM spendings WHERE pg_sleep(10) IS NULL",
+        "SELECT nextval('spendings_id_seq')",
+        "SELECT pg_read_file('/etc/passwd')",
+        "SELECT * FROM dblink('host=evil', 'SELECT 1') AS t(a int)",
+        "SELECT pg_catalog.set_config('role', 'postgres', true)",
+        "SELECT current_user",
+        "WITH x AS (SELECT pg_terminate_backend(1)) SELECT * FROM x",
+        "SELECT merchant_name FROM spendings WHERE id IN (SELECT lo_import('/etc/passwd'))",
+    ],
+)
+def test_rejects_functions_not_allowed(query):
+    with pytest.raises(QueryRejected) as rejected:
+        check_query(query, CATALOG)
+
+    assert rejected.value.kind == "function_not_allowed"
+
+
+@pytest.mark.parametrize(
+    ("query", "kind"),
+    [
+        ("SELEC * FROM spendings", "syntax"),
+        ("SELECT 1; SELECT 2", "multiple_statements"),
+        ("DELETE FROM spendings", "not_select"),
+        ("WITH gone AS (DELETE FROM spendings RETURNING id) SELECT * FROM gone", "not_select"),
+        ("SELECT * INTO copy FROM spendings", "not_select"),
+        ("SET ROLE postgres", "not_select"),
+        ("SELECT * FROM pg_authid", "undefined_table"),
+        ("SELECT * FROM public.spendings", "undefined_table"),
+        ("SELECT amount FROM spendings", "undefined_column"),
+        ("SELECT s.amount FROM spendings AS s", "undefined_column"),
+    ],
+)
+def test_rejects(query, kind):
+    with pytest.raises(QueryRejected) as rejected:
+        check_query(query, CATALOG)
+
+    assert rejected.value.kind == kind
+
+
+class PlannerStub:
+    """Connection whose plans are expensive unless capped by a LIMIT."""
+
+    def __init__(self):
+        self.explained = []
+
+    async def execute(self, query):
+        self.explained.append(query.removeprefix("EXPLAIN (FORMAT JSON) "))
+        return self
+
+    async def fetchone(self):
+        return ([{"Plan": {"Total Cost": 10.0 if " LIMIT " in self.explained[-1] else 1e9}}],)
+
+
+def test_limit_cost_wraps_the_parsed_query():
+    query = "SELECT merchant_name FROM spendings\n-- newest first"
+    conn = PlannerStub()
+
+    limited, capped = asyncio.run(limit_cost(conn, query, check_query(query, CATALOG), 100, 50))
+
+    assert capped
+    assert limited == conn.explained[-1]
+    # The comment no longer swallows the closing parenthesis
+    parsed = sqlglot.parse_one(limited, read="postgres")
+    assert parsed.args["limit"].expression.name == "51"
+    assert parsed.find(sqlglot.exp.Subquery).alias == "limited"